@@ -0,0 +1,261 @@
+# Building blocks of actor-learner training (see training.train_actor_learner)
+# Actor processes play games with a NumPy copy of the Q network and push their transitions into a shared
+# memory ring each; a single learner drains the rings into its ReplayBuffer, trains continuously, and
+# publishes new weights that the actors pick up between games. By default a full ring overwrites its oldest
+# transitions, so actors never wait for the learner. Nothing here imports TensorFlow, so actors stay light.
+
+import multiprocessing as mp
+import time
+import numpy as np
+import pokemon
+
+
+# Q network evaluated with NumPy from a list of Keras style weights [kernel 1, bias 1, kernel 2, bias 2, ...]
+# Every layer uses relu, like training.build_dqn
+class NumpyQNetwork:
+    def __init__(self, weights):
+        self.layers = [(np.asarray(weights[i], dtype=np.float32), np.asarray(weights[i + 1], dtype=np.float32))
+                       for i in range(0, len(weights), 2)]
+
+    # Returns the Q values of a batch of states (or of a single state)
+    def predict(self, states):
+        x = np.asarray(states, dtype=np.float32)
+        for kernel, bias in self.layers:
+            x = np.maximum(x @ kernel + bias, 0.0)
+        return x
+
+    # Epsilon greedy action (0 based) for one observation
+    # mask holds the legal actions (see pokemon.legal_actions), None if every action is legal
+    def choose_action(self, observation, epsilon, rng, mask=None):
+        if rng.random() < epsilon:
+            if mask is None:
+                return int(rng.integers(self.layers[-1][1].shape[0]))
+            return int(pokemon.random_legal_actions(mask, rng))
+        q_values = self.predict(observation)
+        if mask is not None:
+            q_values = pokemon.masked_q_values(q_values, mask)
+        return int(np.argmax(q_values))
+
+
+# Q network weights in shared memory, written by the learner and read by the actors
+# A version counter works as a sequence lock: it is odd while the weights are written, so a reader that sees
+# the version change (or an odd version) during its copy reads again
+class SharedWeights:
+    def __init__(self, shapes):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.buffer = mp.RawArray('f', sum(self.sizes))
+        self.version = mp.RawValue('q', 0)
+        self.epsilon = mp.RawValue('d', 1.0)  # Exploration rate the actors should use
+
+    # Flat NumPy view of the shared weights
+    def array(self):
+        return np.frombuffer(self.buffer, dtype=np.float32)
+
+    # Called by the learner
+    def publish(self, weights, epsilon):
+        self.version.value += 1
+        self.array()[:] = np.concatenate([np.ravel(w) for w in weights])
+        self.epsilon.value = epsilon
+        self.version.value += 1
+
+    # Returns (version, weights list, epsilon), copying the weights out of shared memory
+    def read(self):
+        flat = self.array()
+        while True:
+            version = self.version.value
+            if version % 2 == 0:
+                copy = flat.copy()
+                epsilon = self.epsilon.value
+                if self.version.value == version:
+                    break
+            time.sleep(0.0001)
+        weights = []
+        offset = 0
+        for shape, size in zip(self.shapes, self.sizes):
+            weights.append(copy[offset:offset + size].reshape(shape))
+            offset += size
+        return version, weights, epsilon
+
+
+# Single producer, single consumer ring of transitions in shared memory
+# The actor only advances written and the learner only advances read, so no lock is needed. policy decides
+# what an actor does with a full ring, capacity transitions ahead of the learner:
+#     'overwrite' = write over the oldest unread transition; the learner skips what was overwritten
+#     'drop'      = throw the new transition away
+#     'block'     = wait until the learner has read from the ring
+# Transitions lost to a full ring are counted in dropped
+ring_policies = ('overwrite', 'drop', 'block')
+
+
+class TransitionRing:
+    def __init__(self, capacity, state_size, policy='overwrite'):
+        if policy not in ring_policies:
+            raise ValueError('Unknown ring policy \'%s\'' % policy)
+        self.capacity = capacity
+        self.state_size = state_size
+        self.policy = policy
+        self.states = mp.RawArray('f', capacity * state_size)
+        self.new_states = mp.RawArray('f', capacity * state_size)
+        self.actions = mp.RawArray('i', capacity)
+        self.rewards = mp.RawArray('f', capacity)
+        self.dones = mp.RawArray('b', capacity)
+        self.next_masks = mp.RawArray('b', capacity * 6)  # Legal actions in the new states
+        self.written = mp.RawValue('q', 0)
+        self.read = mp.RawValue('q', 0)
+        # Only the actor writes it with 'drop' and only the learner with 'overwrite'
+        self.dropped = mp.RawValue('q', 0)
+        self.views = None
+
+    # NumPy views of the shared blocks, created on first use in each process
+    def arrays(self):
+        if self.views is None:
+            self.views = (np.frombuffer(self.states, dtype=np.float32).reshape(self.capacity, self.state_size),
+                          np.frombuffer(self.new_states, dtype=np.float32).reshape(self.capacity, self.state_size),
+                          np.frombuffer(self.actions, dtype=np.int32),
+                          np.frombuffer(self.rewards, dtype=np.float32),
+                          np.frombuffer(self.dones, dtype=np.int8),
+                          np.frombuffer(self.next_masks, dtype=np.int8).reshape(self.capacity, 6))
+        return self.views
+
+    # Views are per process and must not be pickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['views'] = None
+        return state
+
+    # Called by the actor. Returns False if stop was set while waiting for room
+    def push(self, state, action, reward, new_state, done, next_mask, stop=None):
+        written = self.written.value
+        if self.policy != 'overwrite' and written - self.read.value >= self.capacity:
+            if self.policy == 'drop':
+                self.dropped.value += 1
+                return True
+            while written - self.read.value >= self.capacity:
+                if stop is not None and stop.value:
+                    return False
+                time.sleep(0.0005)
+        states, new_states, actions, rewards, dones, next_masks = self.arrays()
+        index = written % self.capacity
+        states[index] = state
+        new_states[index] = new_state
+        actions[index] = action
+        rewards[index] = reward
+        dones[index] = done
+        next_masks[index] = next_mask
+        self.written.value = written + 1
+        return True
+
+    # Called by the learner. Returns copies of every transition not read yet, oldest first:
+    # states, actions, rewards, new states, dones, new state legal action masks
+    def drain(self):
+        start = self.read.value
+        written = self.written.value
+        if written == start:
+            return None
+        # With 'overwrite', only the last capacity transitions are still in the ring
+        read = max(start, written - self.capacity)
+        states, new_states, actions, rewards, dones, next_masks = self.arrays()
+        indices = np.arange(read, written) % self.capacity
+        batch = (states[indices], actions[indices], rewards[indices], new_states[indices], dones[indices].astype(bool),
+                 next_masks[indices].astype(bool))
+        if self.policy == 'overwrite':
+            # The actor may have written over the oldest copied transitions meanwhile, including the one it is
+            # writing now, which it has not counted in written yet
+            overwritten = self.written.value + 1 - self.capacity - read
+            if overwritten > 0:
+                batch = tuple(array[overwritten:] for array in batch)
+            self.dropped.value += written - start - len(batch[1])
+        self.read.value = written
+        return batch if len(batch[1]) else None
+
+
+# Shared counters of finished games, for progress reports and stopping
+class ActorStats:
+    def __init__(self, n_actors):
+        self.episodes = mp.RawArray('q', n_actors)
+        self.scores = mp.RawArray('d', n_actors)  # Summed clamped score of Team 1 over the actor's games
+        self.turns = mp.RawArray('q', n_actors)
+
+    def totals(self):
+        return sum(self.episodes), sum(self.scores), sum(self.turns)
+
+
+# Entry point of an actor process
+# Team 1 is played by the shared Q network. Team 2 is played by evaluator (called with (team, opponent)) or,
+# if evaluator is None, by the same network, which makes it self-play; the network then sees Team 2's side of
+# the board (see pokemon.swap_observation). Only Team 1's transitions are pushed
+# Weights are synced from shared memory whenever the learner published a new version, checked every
+# sync_every steps
+def actor(index, ring, weights, stats, stop, team_1_generator, team_2_generator, evaluator, sync_every, seed,
+          score_range):
+    seed = np.random.SeedSequence(seed, spawn_key=(4, index))
+    rng = np.random.default_rng(seed)
+    battle_rng = pokemon.BattleRNG(seed.spawn(1)[0])
+    team_a = team_1_generator()
+    team_b = team_2_generator()
+    observation = np.zeros(pokemon.state_size, dtype=np.float32)
+    new_observation = np.zeros(pokemon.state_size, dtype=np.float32)
+    swapped = np.zeros(pokemon.state_size, dtype=np.float32)
+
+    version, layers, epsilon = weights.read()
+    network = NumpyQNetwork(layers)
+    steps = 0
+    while not stop.value:
+        team_a.reset()
+        team_b.reset()
+        pokemon.seatTeams(team_a, team_b)
+        pokemon.getState(team_a, team_b, out=observation)
+        masks = pokemon.legal_actions(team_a, team_b)
+        done = False
+        score = 0.0
+        while not done:
+            if steps % sync_every == 0 and weights.version.value != version:
+                version, layers, epsilon = weights.read()
+                network = NumpyQNetwork(layers)
+            action_a = network.choose_action(observation, epsilon, rng, masks[0])
+            if evaluator is not None:
+                action_b = evaluator(team_b, team_a)
+            else:
+                action_b = network.choose_action(pokemon.swap_observation(observation, out=swapped), epsilon, rng,
+                                                 masks[1])
+
+            _, reward, done = pokemon.step(team_a, team_b, action_a + 1, action_b + 1, out=new_observation,
+                                           rng=battle_rng)
+            masks = pokemon.legal_actions(team_a, team_b)
+            if not ring.push(observation, action_a, reward[0], new_observation, done, masks[0], stop):
+                return
+            observation, new_observation = new_observation, observation
+            score += reward[0]
+            steps += 1
+
+        stats.episodes[index] += 1
+        stats.scores[index] += max(-score_range, min(score_range, score))
+        stats.turns[index] += team_a.roundNumber
+
+
+# Raises a RuntimeError if one of the actor processes has exited, so the learner does not wait for
+# transitions that will never come. Actors only exit on their own once stop is set
+def check_actors(processes):
+    for index, process in enumerate(processes):
+        if not process.is_alive():
+            raise RuntimeError('Actor %i exited with code %s' % (index, process.exitcode))
+
+
+# Starts n_actors actor processes and returns them with their rings, the shared stop flag and ActorStats
+# ring_policy is the TransitionRing policy of every ring
+def start_actors(n_actors, weights, team_1_generator, team_2_generator, evaluator, ring_capacity=4096,
+                 sync_every=64, seed=None, score_range=5.0, ring_policy='overwrite'):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    rings = [TransitionRing(ring_capacity, pokemon.state_size, ring_policy) for _ in range(n_actors)]
+    stats = ActorStats(n_actors)
+    stop = mp.RawValue('b', 0)
+    processes = []
+    for index in range(n_actors):
+        process = mp.Process(target=actor, daemon=True,
+                             args=(index, rings[index], weights, stats, stop, team_1_generator, team_2_generator,
+                                   evaluator, sync_every, seed, score_range))
+        process.start()
+        processes.append(process)
+    return processes, rings, stop, stats
@@ -0,0 +1,242 @@
+# Vectorized battle engine
+# Stores N concurrent games between the same two rosters as NumPy arrays and resolves a full
+# round for every game in one call. The rules and rewards mirror pokemon.fightSim / pokemon.step,
+# so the rewards, done flags and observations can be consumed the same way as the single game API.
+
+import numpy as np
+import pokemon
+
+
+# Batch of games played between the rosters built by team_1_generator and team_2_generator
+# Arrays indexed by side use 0 for Team 1 and 1 for Team 2. Pokemon slots are 0 based.
+class BatchBattle:
+    # Arrays holding the mutable battle state, captured by snapshot
+    state_arrays = ('hp', 'healthPercentage', 'status', 'active', 'hasAvailablePokemon', 'faintedFlag', 'reward',
+                    'roundNumber')
+
+    # seed may be an int or a numpy SeedSequence (such as pokemon.gameSeed(root_seed, batch_index)).
+    # All games of a batch share one stream; every random number of a step is drawn in a single call per kind
+    def __init__(self, n_games, team_1_generator=pokemon.generate_team_1, team_2_generator=pokemon.generate_team_2,
+                 seed=None):
+        self.n_games = n_games
+        self.rng = np.random.default_rng(seed)
+
+        # Build the rosters once; only their immutable data is used from here on
+        teams = [team_1_generator(), team_2_generator()]
+        rosters = [[team.Pokemon1, team.Pokemon2, team.Pokemon3] for team in teams]
+
+        # ---------- Static roster tables, shape (2 sides, 3 slots) ----------
+        self.maxHp = np.array([[p.maxHp for p in roster] for roster in rosters], dtype=np.float64)
+        self.startHp = np.array([[p.hp for p in roster] for roster in rosters], dtype=np.float64)
+        self.startHealthPercentage = np.array([[p.healthPercentage for p in roster] for roster in rosters],
+                                              dtype=np.float64)
+        self.startStatus = np.array([[p.status for p in roster] for roster in rosters], dtype=np.int32)
+        self.speed = np.array([[p.speed for p in roster] for roster in rosters], dtype=np.float64)
+
+        # ---------- Move tables, shape (2 sides, 3 slots, 4 moves) ----------
+        self.accuracy = np.array([[[m.accuracy for m in p.moves] for p in roster] for roster in rosters],
+                                 dtype=np.int32)
+        self.category = np.array([[[m.category for m in p.moves] for p in roster]
+                                  for roster in rosters], dtype=np.int32)
+        self.isPhysical = self.category == pokemon.CATEGORY_PHYSICAL
+        self.isDamaging = (self.category == pokemon.CATEGORY_PHYSICAL) | (self.category == pokemon.CATEGORY_SPECIAL)
+
+        # Deterministic part of the damage formula for every (side, attacker slot, move, defender slot)
+        # Only the critical hit, roll and burn multipliers are applied per hit
+        self.baseDamage = np.zeros((2, 3, 4, 3), dtype=np.float64)
+        for side in range(2):
+            for a, attacker in enumerate(rosters[side]):
+                for m, move in enumerate(attacker.moves):
+                    if move.category != pokemon.CATEGORY_PHYSICAL and move.category != pokemon.CATEGORY_SPECIAL:
+                        continue
+                    for d, defender in enumerate(rosters[1 - side]):
+                        self.baseDamage[side, a, m, d] = pokemon.baseDamage(attacker, move, defender)
+
+        # Observation template; only the dynamic fields are patched each step
+        self.stateTemplate = np.array(pokemon.getState(teams[0], teams[1]), dtype=np.float32)
+        index = pokemon.state_index
+        self.healthColumns = np.array([index['team%i.pokemon%i.healthPercentage' % (t, p)]
+                                       for t in (1, 2) for p in (1, 2, 3)])
+        self.activeColumns = np.array([index['team%i.activePokemonN' % t] for t in (1, 2)])
+        self.availableColumns = np.array([index['team%i.hasAvailablePokemon' % t] for t in (1, 2)])
+        self.roundColumns = np.array([index['team%i.roundNumber' % t] for t in (1, 2)])
+
+        # ---------- Mutable battle state ----------
+        self.hp = np.zeros((n_games, 2, 3), dtype=np.float64)
+        self.healthPercentage = np.zeros((n_games, 2, 3), dtype=np.float64)
+        self.status = np.zeros((n_games, 2, 3), dtype=np.int32)
+        self.active = np.zeros((n_games, 2), dtype=np.int64)
+        self.hasAvailablePokemon = np.ones((n_games, 2), dtype=bool)
+        self.faintedFlag = np.zeros((n_games, 2), dtype=bool)
+        self.reward = np.zeros((n_games, 2), dtype=np.float64)
+        self.roundNumber = np.zeros(n_games, dtype=np.int64)
+        # True while a copy-on-write snapshot shares the state arrays, see snapshot
+        self.shared = False
+
+        self._games = np.arange(n_games)
+        self._sides = np.arange(2)
+        self.reset()
+
+    # Restores the games selected by mask (all games if None) to their starting state
+    # Returns the observations of every game
+    def reset(self, mask=None):
+        self._own()
+        games = self._games if mask is None else np.flatnonzero(mask)
+        self.hp[games] = self.startHp
+        self.healthPercentage[games] = self.startHealthPercentage
+        self.status[games] = self.startStatus
+        self.active[games] = 0
+        self.hasAvailablePokemon[games] = True
+        self.faintedFlag[games] = False
+        self.reward[games] = 0
+        self.roundNumber[games] = 0
+        return self.getState()
+
+    # Returns a token holding the battle state of every game, see restore
+    # copy_on_write = False copies the state arrays now
+    # copy_on_write = True  keeps references to them; the arrays are only copied once the next step or reset
+    #                       is about to modify them, so a snapshot that is restored before then costs nothing
+    def snapshot(self, copy_on_write=False):
+        if copy_on_write:
+            self.shared = True
+            return tuple(getattr(self, name) for name in self.state_arrays)
+        return tuple(getattr(self, name).copy() for name in self.state_arrays)
+
+    # Puts every game back into the state it had when the token was taken
+    # The token's arrays are shared until the next modification, so the same token can be restored again
+    def restore(self, token):
+        for name, array in zip(self.state_arrays, token):
+            setattr(self, name, array)
+        self.shared = True
+
+    # Gives the battle its own copy of the state arrays if a snapshot still shares them
+    def _own(self):
+        if self.shared:
+            for name in self.state_arrays:
+                setattr(self, name, getattr(self, name).copy())
+            self.shared = False
+
+    # Returns a boolean array of size n_games, True where the game has not ended
+    def running(self):
+        return self.hasAvailablePokemon.all(axis=1)
+
+    # Returns the (n_games, 2, 6) legal action masks of both teams in every game, see pokemon.legal_actions
+    def legalActions(self):
+        return pokemon.legal_actions_batch(self.hp, self.active)
+
+    # Returns the (n_games, pokemon.state_size) float32 observations, same layout as pokemon.getState
+    def getState(self):
+        state = np.tile(self.stateTemplate, (self.n_games, 1))
+        state[:, self.healthColumns] = self.healthPercentage.reshape(self.n_games, 6)
+        state[:, self.activeColumns] = self.active + 1
+        state[:, self.availableColumns] = self.hasAvailablePokemon
+        state[:, self.roundColumns] = self.roundNumber[:, None]
+        return state
+
+    # Performs one round for every running game
+    # actions_a and actions_b are integer arrays of size n_games using fightSim's 1 to 6 action numbers
+    # Games that already ended are left untouched and report a reward of 0
+    # Returns observations, rewards of shape (n_games, 2) clamped to [-1.0, 1.0], and done flags
+    def step(self, actions_a, actions_b):
+        actions = np.stack([np.asarray(actions_a), np.asarray(actions_b)], axis=1).astype(np.int64)
+        self._own()
+        running = self.running()
+        self.reward[:] = 0
+        self.faintedFlag[:] = False
+
+        # Switches happen before either Pokemon attacks
+        self._switch(actions, running)
+
+        # The faster active Pokemon attacks first, Team 1 wins speed ties
+        speed = self.speed[self._sides, self.active]
+        first = np.where(speed[:, 0] >= speed[:, 1], 0, 1)
+        self._attack(first, actions, running)
+        # The other Pokemon attacks only if neither active Pokemon fainted
+        activeHp = self.hp[self._games[:, None], self._sides, self.active]
+        self._attack(1 - first, actions, running & (activeHp > 0).all(axis=1))
+
+        self._faint(running)
+        self._end_round(running)
+
+        rewards = np.clip(self.reward, -1.0, 1.0)
+        return self.getState(), rewards, ~self.running()
+
+    # Applies action 5 and 6 switches. Impossible switches are ignored, like in fightSim
+    def _switch(self, actions, running):
+        isSwitch = (actions >= 5) & running[:, None]
+        self.reward -= pokemon.reward_punish_switch * isSwitch
+
+        slots = np.arange(3)
+        candidates = (self.hp > 0) & (slots != self.active[:, :, None])
+        # Action 5 looks for the first Pokemon in slot order, action 6 in reverse slot order
+        first = np.argmax(candidates, axis=2)
+        last = 2 - np.argmax(candidates[:, :, ::-1], axis=2)
+        target = np.where(actions == 5, first, last)
+        self.active = np.where(isSwitch & candidates.any(axis=2), target, self.active)
+
+    # Performs the move chosen by side attacker (one side index per game) in the games selected by mask
+    def _attack(self, attacker, actions, mask):
+        move = actions[self._games, attacker] - 1
+        games = np.flatnonzero(mask & (move < 4))
+        if games.size == 0:
+            return
+
+        side = attacker[games]
+        other = 1 - side
+        move = move[games]
+        attackerSlot = self.active[games, side]
+        defenderSlot = self.active[games, other]
+        n = games.size
+
+        # Accuracy check, critical hit and damage roll
+        hit = self.accuracy[side, attackerSlot, move] >= self.rng.integers(1, 101, size=n)
+        critical = np.where(self.rng.integers(0, 16, size=n) == 15, 1.5, 1.0)
+        roll = self.rng.uniform(0.85, 1.0, size=n)
+        burn = np.where((self.status[games, side, attackerSlot] == pokemon.pokemon_conditions_dict["Burned"])
+                        & self.isPhysical[side, attackerSlot, move], 0.5, 1.0)
+
+        damaging = self.isDamaging[side, attackerSlot, move]
+        damage = self.baseDamage[side, attackerSlot, move, defenderSlot] * critical * roll * burn
+        # Non-damaging moves use the same placeholder damage as damageCalc
+        damage = np.where(damaging, damage, 100.0)
+        damage = np.where(hit, damage, 0.0)
+
+        maxHp = self.maxHp[other, defenderSlot]
+        hp = self.hp[games, other, defenderSlot] - damage
+        self.hp[games, other, defenderSlot] = hp
+        self.reward[games, side] += np.where(hit & damaging, damage / maxHp * pokemon.reward_damage_multiplier, 0.0)
+        self.healthPercentage[games, other, defenderSlot] = np.where(
+            hit, np.ceil(hp / maxHp * 100), self.healthPercentage[games, other, defenderSlot])
+
+    # Automatically switches out a fainted active Pokemon and applies the faint rewards
+    def _faint(self, running):
+        activeHp = self.hp[self._games[:, None], self._sides, self.active]
+        fainted = running[:, None] & (activeHp <= 0) & (activeHp[:, ::-1] > 0) & self.hasAvailablePokemon
+        self.faintedFlag = fainted
+        self.reward += pokemon.reward_pokemon_faint * (fainted[:, ::-1].astype(np.float64) - fainted)
+
+        # Pick the first Pokemon in slot order that can still battle
+        alive = self.hp > 0
+        replacement = np.argmax(alive, axis=2)
+        self.active = np.where(fainted & alive.any(axis=2), replacement, self.active)
+
+    # Applies the max round rule, the win/loss rewards and the round length discount
+    def _end_round(self, running):
+        timeout = running & (self.roundNumber >= pokemon.max_round)
+        if timeout.any():
+            self.hasAvailablePokemon[timeout] = False
+            # Compare teams by the sum of their health percentages
+            total = self.healthPercentage.sum(axis=2)
+            ahead = np.sign(total[:, 0] - total[:, 1])[:, None] * np.array([1.0, -1.0])
+            self.reward += timeout[:, None] * np.where(ahead > 0, pokemon.reward_round_win,
+                                                       np.where(ahead < 0, -pokemon.reward_round_loss, 0.0))
+
+        lost = running[:, None] & ~(self.hp > 0).any(axis=2)
+        self.hasAvailablePokemon &= ~lost
+        self.reward += lost[:, ::-1] * pokemon.reward_round_win - lost * pokemon.reward_round_loss
+
+        # Discourage long games by linearly increasing a punishment
+        roundDiscount = np.maximum(1.0, self.roundNumber / pokemon.round_n_goal)
+        self.reward -= (running * roundDiscount * pokemon.reward_round_n_multiplier)[:, None]
+        self.roundNumber += running
+
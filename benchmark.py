@@ -0,0 +1,362 @@
+# Benchmark suite for the simulator and training hot paths
+# Results are saved as JSON and can be compared against a stored baseline, so performance
+# changes to pokemon.py are caught before they reach training runs.
+#
+# Usage:
+#   python benchmark.py                                   Run every benchmark and print the results
+#   python benchmark.py --output results.json             Also save the results
+#   python benchmark.py --baseline baseline.json          Compare against a baseline, exit with 1 on a regression
+#   python benchmark.py --baseline baseline.json --save-baseline   Store the results as the new baseline
+#
+# Benchmarks that need TensorFlow (Agent, ReplayBuffer and the end-to-end training runs) are skipped when it
+# cannot be imported.
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+import pokemon
+import batch_battle
+import vec_env
+import mcts
+
+# Every benchmark runs for at least this many seconds per repeat; the best repeat is kept
+min_time = 0.5
+repeats = 3
+# Default worker counts for the games/hour benchmarks
+worker_counts = [1, 2, 4]
+# Games played by each end-to-end training run
+train_games = 20
+# Default fraction a result may get worse by before it counts as a regression
+regression_threshold = 0.10
+
+
+# Calls run(n) with increasing n until one call takes at least min_time seconds
+# run(n) must perform n operations. Returns the best operations per second over the repeats
+def measure(run):
+    best = 0.0
+    n = 1
+    for _ in range(repeats):
+        while True:
+            start = time.perf_counter()
+            run(n)
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+            n = n * 2 if elapsed < min_time / 10 else int(n * min_time / elapsed) + 1
+        best = max(best, n / elapsed)
+    return best
+
+
+# Returns a benchmark result entry
+def result(value, unit, higher_is_better=True):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+# ---------- Simulator benchmarks ----------
+
+def bench_fight_sim():
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+
+    def run(n):
+        for _ in range(n):
+            if pokemon.isGameOver(team_1, team_2):
+                team_1.reset()
+                team_2.reset()
+            pokemon.fightSim(team_1, team_2, random.randint(1, 6), random.randint(1, 6))
+
+    return result(measure(run), 'turns/s')
+
+
+def bench_step():
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+
+    def run(n):
+        for _ in range(n):
+            _, _, done = pokemon.step(team_1, team_2, random.randint(1, 6), random.randint(1, 6))
+            if done:
+                team_1.reset()
+                team_2.reset()
+
+    return result(measure(run), 'turns/s')
+
+
+def bench_step_into_buffer():
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+    out = np.zeros(pokemon.state_size, dtype=np.float32)
+
+    def run(n):
+        for _ in range(n):
+            _, _, done = pokemon.step(team_1, team_2, random.randint(1, 6), random.randint(1, 6), out=out)
+            if done:
+                team_1.reset()
+                team_2.reset()
+
+    return result(measure(run), 'turns/s')
+
+
+def bench_get_state():
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+
+    def run(n):
+        for _ in range(n):
+            pokemon.getState(team_1, team_2)
+
+    return result(measure(run), 'calls/s')
+
+
+def bench_get_state_into_buffer():
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+    out = np.zeros(pokemon.state_size, dtype=np.float32)
+
+    def run(n):
+        for _ in range(n):
+            pokemon.getState(team_1, team_2, out=out)
+
+    return result(measure(run), 'calls/s')
+
+
+def bench_generate_teams():
+    def run(n):
+        for _ in range(n):
+            pokemon.generate_team_1()
+            pokemon.generate_team_2()
+
+    return result(measure(run), 'resets/s')
+
+
+def bench_team_reset():
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+
+    def run(n):
+        for _ in range(n):
+            team_1.reset()
+            team_2.reset()
+
+    return result(measure(run), 'resets/s')
+
+
+def bench_batch_battle():
+    n_games = 1024
+    battle = batch_battle.BatchBattle(n_games)
+
+    def run(n):
+        for _ in range(n):
+            battle.step(np.random.randint(1, 7, n_games), np.random.randint(1, 7, n_games))
+            battle.reset(~battle.running())
+
+    return result(measure(run) * n_games, 'turns/s')
+
+
+# Simulations per second of an MCTSAgent searching from the start of a game
+def bench_mcts():
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+    agent = mcts.MCTSAgent(time_budget_ms=min_time * 1000, seed=0)
+    agent(team_1, team_2)
+    return result(agent.simulations / min_time, 'simulations/s')
+
+
+# ---------- Training benchmarks (need TensorFlow) ----------
+
+def bench_store_transition(training):
+    memory = training.ReplayBuffer(100000, pokemon.state_size)
+    state = np.zeros(pokemon.state_size, dtype=np.float32)
+
+    def run(n):
+        for _ in range(n):
+            memory.store_step_transition(state, 1, 0.5, state, False)
+
+    return result(measure(run), 'calls/s')
+
+
+def bench_sample_memory(training):
+    memory = training.ReplayBuffer(100000, pokemon.state_size)
+    state = np.zeros(pokemon.state_size, dtype=np.float32)
+    for _ in range(10000):
+        memory.store_step_transition(state, 1, 0.5, state, False)
+
+    def run(n):
+        for _ in range(n):
+            memory.sample_memory(64)
+
+    return result(measure(run), 'batches/s')
+
+
+def bench_choose_action(agent):
+    agent.epsilon = 0.0  # Always take the exploitation path
+    team_1 = pokemon.generate_team_1()
+    team_2 = pokemon.generate_team_2()
+    observation = pokemon.getState(team_1, team_2, out=np.zeros(pokemon.state_size, dtype=np.float32))
+
+    def run(n):
+        for _ in range(n):
+            agent.choose_action(observation)
+
+    return result(1e6 / measure(run), 'us/decision', higher_is_better=False)
+
+
+def bench_learn(agent):
+    state = np.zeros(pokemon.state_size, dtype=np.float32)
+    for _ in range(agent.batch_size * 4):
+        agent.store_step_transition(state, 1, 0.5, state, False)
+
+    def run(n):
+        for _ in range(n):
+            agent.learn()
+
+    return result(measure(run), 'steps/s')
+
+
+# ---------- End-to-end benchmarks ----------
+
+# Games per hour of a short training run: mode is training.train or training.train_actor_learner, which plays
+# train_games games with n_workers actors. Everything the run does, choosing actions, stepping, storing
+# transitions and learning, is timed. Models, plots and timings are not saved and the run's output is hidden
+def bench_training(training, mode, n_workers=1):
+    settings = {'num_games': train_games, 'n_actors': n_workers, 'save_model': False, 'save_plot': False,
+                'profile_training': False, 'record_file': None, 'replay_directory': None}
+    saved = {name: getattr(training, name) for name in settings}
+    for name, value in settings.items():
+        setattr(training, name, value)
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            mode()
+        elapsed = time.perf_counter() - start
+    finally:
+        for name, value in saved.items():
+            setattr(training, name, value)
+    return result(train_games / elapsed * 3600.0, 'games/hour')
+
+
+# Games per hour played through a VecEnv with n_workers processes, without storing transitions or learning
+# This measures the environment alone; see bench_training for games/hour of training
+# Team 1 is driven by the Agent when one is given, otherwise both teams pick random actions
+def bench_vec_env_games_per_hour(n_workers, agent=None, games_per_worker=16):
+    env = vec_env.VecEnv(n_workers, games_per_worker)
+    try:
+        env.reset()
+        n_games = env.n_games
+        finished = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time * repeats:
+            if agent is not None:
+                actions_a = agent.choose_actions(env.observations) + 1
+            else:
+                actions_a = np.random.randint(1, 7, n_games)
+            _, _, dones = env.step(actions_a, np.random.randint(1, 7, n_games))
+            finished += int(dones.sum())
+        elapsed = time.perf_counter() - start
+    finally:
+        env.close()
+    return result(finished / elapsed * 3600.0, 'games/hour')
+
+
+# Runs every benchmark and returns a dictionary of results by name
+def run_benchmarks(workers=None):
+    results = {
+        'fightSim': bench_fight_sim(),
+        'step': bench_step(),
+        'step_into_buffer': bench_step_into_buffer(),
+        'getState': bench_get_state(),
+        'getState_into_buffer': bench_get_state_into_buffer(),
+        'generate_teams': bench_generate_teams(),
+        'team_reset': bench_team_reset(),
+        'BatchBattle.step': bench_batch_battle(),
+        'MCTSAgent.simulations': bench_mcts(),
+    }
+
+    try:
+        import training
+    except ImportError as error:
+        print('Skipping training benchmarks (%s)' % error)
+        training = None
+
+    agent = None
+    if training is not None:
+        agent = training.make_agent('benchmark_model.h5')
+        results['ReplayBuffer.store_step_transition'] = bench_store_transition(training)
+        results['ReplayBuffer.sample_memory'] = bench_sample_memory(training)
+        results['Agent.choose_action'] = bench_choose_action(agent)
+        results['Agent.learn'] = bench_learn(agent)
+
+    for n_workers in (workers or worker_counts):
+        results['vec_env.games_per_hour.workers_%i' % n_workers] = bench_vec_env_games_per_hour(n_workers, agent)
+
+    if training is not None:
+        results['train.games_per_hour'] = bench_training(training, training.train)
+        for n_workers in (workers or worker_counts):
+            results['train_actor_learner.games_per_hour.workers_%i' % n_workers] = \
+                bench_training(training, training.train_actor_learner, n_workers)
+
+    return results
+
+
+# Compares results against baseline. Returns a list of (name, baseline value, value, relative change)
+# for every benchmark that got worse by more than threshold
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for name, entry in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['value']
+        new = entry['value']
+        if old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if entry['higher_is_better'] else change
+        if worse > threshold:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Pokemon simulator and training hot paths')
+    parser.add_argument('--output', help='Save the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against the results stored in this JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=regression_threshold,
+                        help='Fraction a benchmark may get worse by before it is a regression')
+    parser.add_argument('--workers', type=lambda s: [int(x) for x in s.split(',')],
+                        help='Comma separated worker counts for the games/hour benchmarks')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.workers)
+    for name, entry in results.items():
+        print('%-40s %14.1f %s' % (name, entry['value'], entry['unit']))
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('Saved baseline to %s' % args.baseline)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print('REGRESSION %s: %.1f -> %.1f (%+.1f%%)' % (name, old, new, change * 100))
+        if regressions:
+            sys.exit(1)
+        print('No regressions over %.0f%% against %s' % (args.threshold * 100, args.baseline))
+
+
+if __name__ == '__main__':
+    main()
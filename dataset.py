@@ -0,0 +1,230 @@
+# Offline transition datasets (see training.train_offline)
+# generate_dataset plays games between pairs of tournament Entrants over a process pool and writes Team 1's
+# transitions (state, action, reward, next state, done, legal actions in the next state) into shards. A shard
+# is a directory laid out exactly like the memory-mapped training.ReplayBuffer (meta.npy, state_memory.npy,
+# ...), so it can also be opened as one. ShardedDataset samples minibatches from every shard of a dataset
+# through memory maps, without simulating anything, so many models can be trained on the same games.
+#
+# Usage:
+#   python dataset.py games --shards 16 --shard-size 100000 --models model_a.h5 --epsilon 0.2 --workers 8
+
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import random
+import numpy as np
+import pokemon
+import rollout
+import tournament
+
+# Arrays of a shard, named and typed like the ones of training.ReplayBuffer, with the shape of one row
+_memories = [('state_memory', np.float32, (pokemon.state_size,)),
+             ('new_state_memory', np.float32, (pokemon.state_size,)),
+             ('action_memory', np.int32, ()), ('reward_memory', np.float32, ()), ('doneflags_memory', np.int32, ()),
+             ('next_mask_memory', np.bool_, (6,))]
+
+
+# ---------- Players ----------
+
+# Takes a random legal action with probability epsilon, otherwise plays like the wrapped entrant's player
+def _epsilonPlayer(seed, entrant, epsilon):
+    player = entrant.make(seed)
+    rnd = random.Random(seed)
+    return lambda team, opponent, observation: \
+        pokemon.randomLegalAction(team, rnd) - 1 if rnd.random() < epsilon else player(team, opponent, observation)
+
+
+# entrant with epsilon-random exploration, so the dataset also covers actions the entrant would not take
+def epsilonEntrant(entrant, epsilon, name=None):
+    return tournament.Entrant(name or '%s_eps%g' % (entrant.name, epsilon), _epsilonPlayer, entrant, epsilon)
+
+
+# ---------- Writing ----------
+
+# Creates the arrays of a shard holding size transitions in directory
+def _openShard(directory, size):
+    os.makedirs(directory, exist_ok=True)
+    arrays = {}
+    for name, dtype, shape in _memories:
+        arrays[name] = np.lib.format.open_memmap(os.path.join(directory, name + '.npy'), mode='w+', dtype=dtype,
+                                                 shape=(size,) + shape)
+    arrays['meta'] = np.lib.format.open_memmap(os.path.join(directory, 'meta.npy'), mode='w+', dtype=np.int64,
+                                               shape=(3,))
+    return arrays
+
+
+# Pool task: plays games until shard holds size transitions and writes it to directory
+# Games cycle through matchups, a list of (Team 1 Entrant, Team 2 Entrant). The game that does not fit when
+# the shard fills up is dropped, so every game in a shard ends with its terminal transition and the shard may
+# hold a few less than size transitions. Returns (shard, transitions, games, summed score of Team 1 in them)
+def _writeShard(shard, directory, size, matchups, team_1_generator, team_2_generator, root_seed):
+    seed = np.random.SeedSequence(root_seed, spawn_key=(5, shard))
+    player_seeds = seed.spawn(2 * len(matchups))
+    players = [(entrant1.make(int(player_seeds[2 * k].generate_state(1)[0])),
+                entrant2.make(int(player_seeds[2 * k + 1].generate_state(1)[0])))
+               for k, (entrant1, entrant2) in enumerate(matchups)]
+    rng = pokemon.BattleRNG(seed)
+    team1 = team_1_generator()
+    team2 = team_2_generator()
+    arrays = _openShard(directory, size)
+    states, new_states = arrays['state_memory'], arrays['new_state_memory']
+    actions, rewards, doneflags = arrays['action_memory'], arrays['reward_memory'], arrays['doneflags_memory']
+    next_masks = arrays['next_mask_memory']
+    observation = np.zeros(pokemon.state_size, dtype=np.float32)
+    swapped = np.zeros(pokemon.state_size, dtype=np.float32)  # Team 2's view, like in tournament.playGame
+
+    count = 0
+    games = 0
+    score = 0.0
+    while count < size:
+        player1, player2 = players[games % len(players)]
+        game_start = count
+        team1.reset()
+        team2.reset()
+        pokemon.seatTeams(team1, team2)
+        pokemon.getState(team1, team2, out=observation)
+        done = False
+        while not done and count < size:
+            action1 = player1(team1, team2, observation)
+            action2 = player2(team2, team1, pokemon.swap_observation(observation, out=swapped))
+            states[count] = observation
+            _, reward, done = pokemon.step(team1, team2, action1 + 1, action2 + 1, out=observation, rng=rng)
+            new_states[count] = observation
+            actions[count] = action1
+            rewards[count] = reward[0]
+            # Stored like ReplayBuffer: 0 at the end of a game
+            doneflags[count] = 0 if done else 1
+            next_masks[count] = pokemon.teamLegalActions(team1)
+            count += 1
+        if not done:
+            count = game_start
+            break
+        games += 1
+        value = rollout.gameValue(team1, team2)
+        score += 1.0 if value > 0 else 0.0 if value < 0 else 0.5
+
+    arrays['meta'][:] = (count, size, pokemon.state_size)
+    for array in arrays.values():
+        array.flush()
+    return shard, count, games, score
+
+
+# Writes n_shards shards of up to shard_size transitions to directory/shard_00000, shard_00001, ...
+# matchups   = List of (Team 1 Entrant, Team 2 Entrant) cycled through game by game, see default_matchups
+# n_workers  = Number of worker processes, None for one per CPU, 0 to play in the calling process
+# root_seed  = Seed of the battles and players; shard k always holds the same games for the same seed
+# Returns a summary that is also saved as directory/dataset.json
+def generate_dataset(directory, n_shards, shard_size=100000, matchups=None, n_workers=None,
+                     team_1_generator=pokemon.generate_team_1, team_2_generator=pokemon.generate_team_2, root_seed=0):
+    if matchups is None:
+        matchups = default_matchups()
+    os.makedirs(directory, exist_ok=True)
+    tasks = [(shard, os.path.join(directory, 'shard_%05i' % shard), shard_size, matchups, team_1_generator,
+              team_2_generator, root_seed) for shard in range(n_shards)]
+    if n_workers == 0:
+        results = [_writeShard(*task) for task in tasks]
+    else:
+        with mp.Pool(n_workers) as pool:
+            results = pool.starmap(_writeShard, tasks)
+
+    games = sum(result[2] for result in results)
+    summary = {'shards': n_shards, 'shard_size': shard_size, 'transitions': sum(result[1] for result in results),
+               'games': games, 'team_1_win_rate': sum(result[3] for result in results) / games if games else 0.0,
+               'matchups': [[entrant1.name, entrant2.name] for entrant1, entrant2 in matchups],
+               'root_seed': root_seed}
+    with open(os.path.join(directory, 'dataset.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+# Highest damage evaluator against itself, with and without exploration, and a random player against it
+def default_matchups(epsilon=0.2):
+    evaluator = tournament.evaluatorEntrant('highest_damage', pokemon.evaluator_highest_damage_action)
+    return [(evaluator, evaluator), (epsilonEntrant(evaluator, epsilon), evaluator),
+            (tournament.randomEntrant(), evaluator)]
+
+
+# ---------- Reading ----------
+
+# Every shard of a dataset directory, sampled like one ReplayBuffer
+# Has the mem_counter and sample_memory of a ReplayBuffer, so it can stand in for an Agent's memory
+class ShardedDataset:
+    def __init__(self, directory, rng=None):
+        self.directories = sorted(glob.glob(os.path.join(directory, 'shard_*')))
+        if not self.directories:
+            raise ValueError('No dataset shards in %s' % directory)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.shards = []
+        sizes = []
+        for shard in self.directories:
+            count, _, input_dims = np.load(os.path.join(shard, 'meta.npy'))
+            if input_dims != pokemon.state_size:
+                raise ValueError('Dataset shard %s holds states of size %i, expected %i'
+                                 % (shard, input_dims, pokemon.state_size))
+            # Shards written before masks were stored get them from their new states when gathered
+            self.shards.append([np.load(os.path.join(shard, name + '.npy'), mmap_mode='r')
+                                if os.path.exists(os.path.join(shard, name + '.npy')) else None
+                                for name, _, _ in _memories])
+            sizes.append(int(count))
+        # Transition i of the dataset is row i - offsets[k] of shard k
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)])
+        self.mem_counter = int(self.offsets[-1])
+
+    def __len__(self):
+        return self.mem_counter
+
+    # Nothing to write back; kept for Agent.save_model
+    def flush(self):
+        pass
+
+    # Returns batch_size transitions drawn uniformly (with replacement) from every shard, in the order of
+    # ReplayBuffer.sample_memory: states, actions, rewards, new states, doneflags, new state legal action masks
+    def sample_memory(self, batch_size):
+        return self.gather(self.rng.integers(self.mem_counter, size=batch_size))
+
+    # Returns the transitions at dataset indices batch, reading each shard once in ascending row order
+    def gather(self, batch):
+        batch = np.asarray(batch)
+        order = np.argsort(batch, kind='stable')
+        shard_of = np.searchsorted(self.offsets, batch[order], side='right') - 1
+        columns = [np.empty((len(batch),) + shape, dtype=dtype) for _, dtype, shape in _memories]
+        for k in np.unique(shard_of):
+            selected = shard_of == k
+            rows = batch[order[selected]] - self.offsets[k]
+            for column, memory in zip(columns, self.shards[k]):
+                if memory is not None:
+                    column[order[selected]] = memory[rows]
+            if self.shards[k][-1] is None:
+                columns[-1][order[selected]] = pokemon.observation_legal_actions(columns[1][order[selected]])[:, 0]
+        states, new_states, actions, rewards, doneflags, next_masks = columns
+        return states, actions, rewards, new_states, doneflags, next_masks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate an offline dataset of Pokemon battle transitions')
+    parser.add_argument('directory', help='Directory to write the shards to')
+    parser.add_argument('--shards', type=int, default=16, help='Number of shards')
+    parser.add_argument('--shard-size', type=int, default=100000, help='Transitions per shard')
+    parser.add_argument('--models', nargs='*', default=[],
+                        help='Saved Agent models (such as model_a.h5) to also play Team 1 against the evaluator')
+    parser.add_argument('--epsilon', type=float, default=0.2, help='Exploration rate of the exploring players')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, 0 plays in this process')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the dataset')
+    args = parser.parse_args()
+
+    matchups = default_matchups(args.epsilon)
+    evaluator = matchups[0][1]
+    for fname in args.models:
+        model = tournament.modelEntrant(os.path.splitext(os.path.basename(fname))[0], fname)
+        matchups.append((epsilonEntrant(model, args.epsilon), evaluator))
+
+    summary = generate_dataset(args.directory, args.shards, shard_size=args.shard_size, matchups=matchups,
+                               n_workers=args.workers, root_seed=args.seed)
+    print('Wrote %i transitions from %i games to %s (Team 1 win rate %.1f%%)'
+          % (summary['transitions'], summary['games'], args.directory, summary['team_1_win_rate'] * 100))
+
+
+if __name__ == '__main__':
+    main()
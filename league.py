@@ -0,0 +1,114 @@
+# Self-play league (see training.train_league)
+# The learner's weights are copied into a pool of frozen checkpoints on a schedule. Every game is played
+# against a checkpoint sampled from the pool, favoring the ones the learner still loses to. Frozen opponents
+# are evaluated with NumPy from the pool's weights, so any number of games in flight share one copy of each
+# checkpoint and nothing is reloaded or rebuilt when the opponent changes.
+
+import collections
+import numpy as np
+import pokemon
+import actor_learner
+
+_available_columns = [pokemon.state_index['team%i.hasAvailablePokemon' % t] for t in (1, 2)]
+_health_columns = [[pokemon.state_index['team%i.pokemon%i.healthPercentage' % (t, p)] for p in (1, 2, 3)]
+                   for t in (1, 2)]
+
+
+# Returns Team 1's score (1 win, 0.5 draw, 0 loss) from the final observation of a game
+# A game that reached max_round goes to the team with the most health left, like in fightSim
+def observationScore(observation):
+    available1, available2 = observation[_available_columns]
+    if available1 and not available2:
+        return 1.0
+    if available2 and not available1:
+        return 0.0
+    difference = observation[_health_columns[0]].sum() - observation[_health_columns[1]].sum()
+    return 1.0 if difference > 0 else 0.0 if difference < 0 else 0.5
+
+
+# A frozen copy of the learner's weights and the learner's results against it
+class Checkpoint:
+    def __init__(self, name, weights):
+        self.name = name
+        self.weights = [np.array(w, dtype=np.float32) for w in weights]
+        for w in self.weights:
+            w.flags.writeable = False
+        self.games = 0
+        self.score = 0.0  # Summed score of the learner: 1 for a win, 0.5 for a draw
+
+    # Learner win rate against the checkpoint, with one virtual draw so new checkpoints start at 0.5
+    def win_rate(self):
+        return (self.score + 0.5) / (self.games + 1)
+
+
+# Pool of at most max_size checkpoints
+# Opponents are sampled with weight (1 - win rate) ** hardness, so checkpoints the learner beats every game
+# are rarely picked; latest_share of the games are played against the newest checkpoint
+class CheckpointPool:
+    def __init__(self, max_size=20, hardness=2.0, latest_share=0.2):
+        self.max_size = max_size
+        self.hardness = hardness
+        self.latest_share = latest_share
+        self.checkpoints = collections.OrderedDict()  # Checkpoints by name, oldest first
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    # Adds a checkpoint. When the pool is full, the one the learner beats most often is dropped
+    def add(self, name, weights):
+        if len(self.checkpoints) >= self.max_size:
+            easiest = max(self.checkpoints.values(), key=lambda c: c.win_rate())
+            del self.checkpoints[easiest.name]
+        checkpoint = self.checkpoints[name] = Checkpoint(name, weights)
+        return checkpoint
+
+    # Returns the Checkpoint to play a new game against
+    def sample(self, rng):
+        checkpoints = list(self.checkpoints.values())
+        if rng.random() < self.latest_share:
+            return checkpoints[-1]
+        weights = np.array([(1.0 - c.win_rate()) ** self.hardness for c in checkpoints])
+        weights = weights + 1e-6  # Every checkpoint keeps a small chance
+        return checkpoints[rng.choice(len(checkpoints), p=weights / weights.sum())]
+
+    # Records the learner's score (1 win, 0.5 draw, 0 loss) in a game against checkpoint
+    def record(self, checkpoint, score):
+        checkpoint.games += 1
+        checkpoint.score += score
+
+    # Returns (name, games, learner win rate) of every checkpoint, oldest first
+    def summary(self):
+        return [(c.name, c.games, c.win_rate()) for c in self.checkpoints.values()]
+
+
+# NumPy networks of the pool's checkpoints, built on first use and shared by every game against them
+# Networks of checkpoints dropped from the pool are forgotten once the cache fills up; games still in flight
+# against them hold the Checkpoint, so its network is simply built again from the same arrays
+class InferenceCache:
+    def __init__(self, pool):
+        self.pool = pool
+        self.networks = {}
+
+    def network(self, checkpoint):
+        network = self.networks.get(checkpoint.name)
+        if network is None:
+            if len(self.networks) >= self.pool.max_size:
+                self.networks = {n: net for n, net in self.networks.items() if n in self.pool.checkpoints}
+            # The network wraps the checkpoint's arrays without copying them
+            network = self.networks[checkpoint.name] = actor_learner.NumpyQNetwork(checkpoint.weights)
+        return network
+
+    # Greedy actions (0 based) for the rows of observations, with one forward pass per distinct opponent
+    # opponents is a list of Checkpoints, one per row. observations must be seen from the side the checkpoints
+    # play (see pokemon.swap_observation). masks, if given, holds the legal actions of every row
+    def choose_actions(self, opponents, observations, masks=None):
+        actions = np.zeros(len(opponents), dtype=np.int64)
+        rows = collections.defaultdict(list)
+        for row, checkpoint in enumerate(opponents):
+            rows[checkpoint].append(row)
+        for checkpoint, indices in rows.items():
+            q_values = self.network(checkpoint).predict(observations[indices])
+            if masks is not None:
+                q_values = pokemon.masked_q_values(q_values, masks[indices])
+            actions[indices] = np.argmax(q_values, axis=1)
+        return actions
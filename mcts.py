@@ -0,0 +1,200 @@
+# Simultaneous-move Monte Carlo tree search
+# Both teams choose their action at the same time, so each node keeps separate statistics for the actions of
+# the searching team and of the opponent (decoupled UCT): each side picks its action by UCB1 over its own
+# statistics, both actions are played together with fightSim, and the value of the playout is credited to
+# each side's action. Accuracy, critical hit and damage rolls are sampled on every visit.
+#
+# Nodes live in a transposition table keyed on a canonical, HP-bucketed description of the battle state, so
+# positions reached through different move orders or rolls share statistics, and the tree of the previous
+# turn is reused: after both teams act, the new root is usually already in the table. The key does not say
+# which Pokemon are on the teams, so there is one table per matchup (see matchupKey), and turns are searched
+# with both teams in their real seats, so speed ties go the same way as in the game.
+#
+#     agent = MCTSAgent(time_budget_ms=50)
+#     action = agent(team, opponent)  # 0 to 5, usable as training.evaluator_function
+
+import math
+import random
+import time
+import numpy as np
+import pokemon
+import rollout
+
+
+# Statistics of one battle state. Action indexes are 0 based
+# The legal actions only depend on the active slots and on which Pokemon fainted, which are part of the
+# stateKey, so they are worked out once when the node is created
+class Node:
+    __slots__ = ('visits', 'countsA', 'valuesA', 'countsB', 'valuesB', 'generation', 'actionsA', 'actionsB')
+
+    def __init__(self, generation, actionsA, actionsB):
+        self.visits = 0
+        self.countsA = [0] * 6  # Visits of each action of the searching team
+        self.valuesA = [0.0] * 6  # Summed values of each action of the searching team
+        self.countsB = [0] * 6  # Visits of each action of the opponent
+        self.valuesB = [0.0] * 6  # Summed values of each action of the opponent, from its own point of view
+        self.generation = generation  # Last decision that visited the node
+        self.actionsA = actionsA  # Legal actions of the searching team
+        self.actionsB = actionsB  # Legal actions of the opponent
+
+
+# Returns the list of 0 based legal actions of team, see pokemon.teamLegalActions
+# Every action is returned if none is legal, which only happens once the game is over
+def legalActionList(team):
+    actions = [a for a, legal in enumerate(pokemon.teamLegalActions(team)) if legal]
+    return actions if actions else list(range(6))
+
+
+# Returns the transposition table key of the battle state, seen from team
+# Health percentages are grouped into buckets of hp_bucket percent and the round number into buckets of
+# round_bucket rounds; fainted Pokemon get their own bucket
+def stateKey(team, opponent, hp_bucket=10, round_bucket=10):
+    p1, p2, p3 = team.roster
+    q1, q2, q3 = opponent.roster
+    return (team.activePokemonN, opponent.activePokemonN, team.roundNumber // round_bucket,
+            int(p1.healthPercentage) // hp_bucket if p1.hp > 0 else -1,
+            int(p2.healthPercentage) // hp_bucket if p2.hp > 0 else -1,
+            int(p3.healthPercentage) // hp_bucket if p3.hp > 0 else -1,
+            int(q1.healthPercentage) // hp_bucket if q1.hp > 0 else -1,
+            int(q2.healthPercentage) // hp_bucket if q2.hp > 0 else -1,
+            int(q3.healthPercentage) // hp_bucket if q3.hp > 0 else -1,
+            p1._status, p2._status, p3._status, q1._status, q2._status, q3._status)
+
+
+# Returns the key of the table the states of team against opponent are kept in: the seat of team (see
+# pokemon.seatOf) and the species of both rosters
+def matchupKey(team, opponent):
+    return (pokemon.seatOf(team, opponent), tuple(p.name for p in team.roster),
+            tuple(p.name for p in opponent.roster))
+
+
+# Returns the action with the highest UCB1 score; untried actions are picked first
+def selectAction(counts, values, visits, exploration, actions):
+    logVisits = math.log(visits) if visits > 0 else 0.0
+    best = actions[0]
+    bestScore = -math.inf
+    for a in actions:
+        n = counts[a]
+        if n == 0:
+            return a
+        score = values[a] / n + exploration * math.sqrt(logVisits / n)
+        if score > bestScore:
+            bestScore = score
+            best = a
+    return best
+
+
+# Decoupled UCT agent. Called with (team, opponent) like an evaluator function
+# time_budget_ms = Milliseconds of search per decision
+# iterations     = Maximum number of simulations per decision, None for no limit
+# exploration    = UCB1 exploration constant
+# policy         = Playout policy used below the tree, see rollout.playout_policies
+# max_depth      = Deepest number of turns walked through the tree before a playout
+# max_turns      = Turns after which a playout is scored by remaining health, None plays to the end of the game
+# max_nodes      = Size of a transposition table above which nodes not visited recently are dropped
+# seed           = Seed of the search (an int or numpy SeedSequence), None for a random seed
+class MCTSAgent:
+    def __init__(self, time_budget_ms=50, iterations=None, exploration=1.4, policy='mixed', max_depth=20,
+                 max_turns=None, hp_bucket=10, round_bucket=10, max_nodes=200000, seed=None):
+        if policy not in rollout.playout_policies:
+            raise ValueError('Unknown playout policy \'%s\'' % policy)
+        self.time_budget_ms = time_budget_ms
+        self.iterations = iterations
+        self.exploration = exploration
+        self.policy = rollout.playout_policies[policy]
+        self.max_depth = max_depth
+        self.max_turns = max_turns
+        self.hp_bucket = hp_bucket
+        self.round_bucket = round_bucket
+        self.max_nodes = max_nodes
+        seed = np.random.SeedSequence(seed)
+        self.rnd = random.Random(int(seed.generate_state(1)[0]))
+        self.rng = pokemon.BattleRNG(seed)
+        self.tables = {}  # Transposition tables of Nodes by stateKey, by matchupKey
+        self.table = {}  # Table of the matchup of the last decision
+        self.seat = 1  # Seat of the searching team at the last decision
+        self.generation = 0  # Number of decisions made
+        self.root = None  # Root Node of the last decision
+        self.simulations = 0  # Number of simulations run by the last decision
+
+    # Searches for up to time_budget_ms and returns the 0 based action of team visited most at the root
+    def __call__(self, team, opponent=None):
+        if opponent is None:
+            raise ValueError('MCTSAgent needs the opposing team')
+        return self.choose_action(team, opponent)
+
+    def choose_action(self, team, opponent):
+        self.generation += 1
+        self.seat = pokemon.seatOf(team, opponent)
+        matchup = matchupKey(team, opponent)
+        self.table = self.tables.get(matchup)
+        if self.table is None:
+            self.table = self.tables[matchup] = {}
+        if len(self.table) > self.max_nodes:
+            self._prune(matchup)
+
+        root = self._node(team, opponent)
+        token = pokemon.snapshot(team, opponent)
+        deadline = time.perf_counter() + self.time_budget_ms / 1000.0
+        simulations = 0
+        try:
+            while (self.iterations is None or simulations < self.iterations) and time.perf_counter() < deadline:
+                self._simulate(team, opponent, root)
+                pokemon.restore(token)
+                simulations += 1
+        finally:
+            pokemon.restore(token)
+
+        self.root = root
+        self.simulations = simulations
+        counts = root.countsA
+        return max(root.actionsA, key=lambda a: (counts[a], root.valuesA[a] / counts[a] if counts[a] else -math.inf))
+
+    # Returns the Node of the battle state, creating it if the table does not hold one
+    def _node(self, team, opponent):
+        key = stateKey(team, opponent, self.hp_bucket, self.round_bucket)
+        node = self.table.get(key)
+        if node is None:
+            node = self.table[key] = Node(self.generation, legalActionList(team), legalActionList(opponent))
+        else:
+            node.generation = self.generation
+        return node
+
+    # Keeps only the nodes of matchup's table visited by the last two decisions
+    def _prune(self, matchup):
+        oldest = self.generation - 2
+        self.table = self.tables[matchup] = {key: node for key, node in self.table.items()
+                                             if node.generation >= oldest}
+
+    # Walks down the tree from root choosing both actions at every node, evaluates the first new state
+    # (or the end of the game) with a playout and credits the value to every action on the way
+    def _simulate(self, team, opponent, root):
+        path = []
+        node = root
+        value = None
+        for _ in range(self.max_depth):
+            a = selectAction(node.countsA, node.valuesA, node.visits, self.exploration, node.actionsA)
+            b = selectAction(node.countsB, node.valuesB, node.visits, self.exploration, node.actionsB)
+            path.append((node, a, b))
+            pokemon.seatedFightSim(team, opponent, a + 1, b + 1, self.seat, self.rng)
+            if pokemon.isGameOver(team, opponent):
+                value = rollout.gameValue(team, opponent)
+                break
+            key = stateKey(team, opponent, self.hp_bucket, self.round_bucket)
+            child = self.table.get(key)
+            if child is None:
+                self.table[key] = Node(self.generation, legalActionList(team), legalActionList(opponent))
+                break
+            child.generation = self.generation
+            node = child
+
+        if value is None:
+            value = rollout.playout(team, opponent, self.policy(team, opponent, self.rnd), self.policy, self.rnd,
+                                    self.rng, self.max_turns, self.seat)
+
+        for node, a, b in path:
+            node.visits += 1
+            node.countsA[a] += 1
+            node.valuesA[a] += value
+            node.countsB[b] += 1
+            node.valuesB[b] -= value
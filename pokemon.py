@@ -4,7 +4,7 @@
 # function to get the state of the game that returns every relevant variable
 
 import time
-import random
+import functools
 import numpy as np
 import sys
 import math
@@ -90,11 +90,96 @@ reward_pokemon_faint = 0.4
 # The intention is to minimize switching repeatedly
 reward_punish_switch = 0.05
 
+# ------------- Observation Layout -------------
 
+# Fields written by getState for each Pokemon, each of its 4 moves and each team
+pokemon_state_fields = ['type1', 'type2', 'healthPercentage', 'attack', 'spattack', 'defense', 'spdefense', 'speed',
+                        'maxHp']
+move_state_fields = ['moveType', 'category', 'basePower', 'accuracy']
+team_state_fields = ['activePokemonN', 'hasAvailablePokemon', 'roundNumber']
+
+
+# Returns the names of every value in the observation, in order. Names look like
+# 'team1.pokemon2.healthPercentage', 'team1.pokemon2.move3.basePower' and 'team2.roundNumber'
+def _stateFieldNames():
+    names = []
+    for t in (1, 2):
+        for p in (1, 2, 3):
+            prefix = 'team%i.pokemon%i.' % (t, p)
+            names += [prefix + field for field in pokemon_state_fields]
+            names += [prefix + 'move%i.' % m + field for m in (1, 2, 3, 4) for field in move_state_fields]
+        names += ['team%i.' % t + field for field in team_state_fields]
+    return names
+
+
+# The observation layout is stable: state_index['team2.pokemon1.healthPercentage'] is always the same column
+state_fields = _stateFieldNames()
+state_index = {name: i for i, name in enumerate(state_fields)}
+state_size = len(state_fields)  # 156
+pokemon_state_size = len(pokemon_state_fields) + 4 * len(move_state_fields)  # 25
+team_state_size = 3 * pokemon_state_size + len(team_state_fields)  # 78
 
 # -------------------------------------------------------------------------------------
 
 
+# ---------- Random Number Streams ----------
+# Every random number used by a battle comes from a BattleRNG, so a game can be reproduced from its seed.
+# Numbers are drawn from NumPy in blocks and handed out one at a time, so the hot path does not pay for a
+# NumPy call per random number. Separate streams per game come from gameSeed(root_seed, game_index).
+
+class BattleRNG:
+    __slots__ = ('generator', 'blockSize', 'accuracyRolls', 'criticalRolls', 'damageRolls',
+                 'accuracyIndex', 'criticalIndex', 'damageIndex', 'accuracyBlock', 'criticalBlock', 'damageBlock')
+
+    # seed may be an int, a numpy SeedSequence (see gameSeed) or None for a random seed
+    def __init__(self, seed=None, blockSize=256):
+        self.generator = np.random.default_rng(seed)
+        self.blockSize = blockSize
+        # Indexes start at the end of empty blocks, so each block is drawn on first use
+        self.accuracyRolls = self.criticalRolls = self.damageRolls = ()
+        self.accuracyIndex = self.criticalIndex = self.damageIndex = blockSize
+        # The blocks as NumPy arrays, so readers such as recorder.Recorder can copy rolls out in bulk
+        self.accuracyBlock = self.criticalBlock = self.damageBlock = np.zeros(0)
+
+    # Integer from 1 to 100 (inclusive) for the accuracy check
+    def accuracyRoll(self):
+        if self.accuracyIndex == self.blockSize:
+            self.accuracyBlock = self.generator.integers(1, 101, size=self.blockSize)
+            self.accuracyRolls = self.accuracyBlock.tolist()
+            self.accuracyIndex = 0
+        self.accuracyIndex += 1
+        return self.accuracyRolls[self.accuracyIndex - 1]
+
+    # Integer from 0 to 15 (inclusive), a critical hit happens on 15
+    def criticalRoll(self):
+        if self.criticalIndex == self.blockSize:
+            self.criticalBlock = self.generator.integers(0, 16, size=self.blockSize)
+            self.criticalRolls = self.criticalBlock.tolist()
+            self.criticalIndex = 0
+        self.criticalIndex += 1
+        return self.criticalRolls[self.criticalIndex - 1]
+
+    # High or low damage roll between 0.85 and 1.0
+    def damageRoll(self):
+        if self.damageIndex == self.blockSize:
+            self.damageBlock = self.generator.uniform(0.85, 1.0, size=self.blockSize)
+            self.damageRolls = self.damageBlock.tolist()
+            self.damageIndex = 0
+        self.damageIndex += 1
+        return self.damageRolls[self.damageIndex - 1]
+
+
+# Returns the seed of game game_index in a run seeded with root_seed
+# Every (root_seed, game_index) pair gives an independent stream, no matter which worker plays the game,
+# so any game of a run can be replayed on its own with BattleRNG(gameSeed(root_seed, game_index))
+def gameSeed(root_seed, game_index):
+    return np.random.SeedSequence(root_seed, spawn_key=(0, game_index))
+
+
+# Used by battles that are not given a BattleRNG
+default_rng = BattleRNG()
+
+
 # Delay Printing like a Gameboy
 def delayPrint(s):
     for c in s:
@@ -103,13 +188,77 @@ def delayPrint(s):
         time.sleep(0.01)  # How fast to print
 
 
+# ---------- Renderers ----------
+# battleSim sends all of its text through a renderer, so the battle logic does not depend on how
+# (or whether) the text is shown
+
+# Front-end that prints one character at a time like a Gameboy
+class GameboyRenderer:
+    def __init__(self, delay=0.01, stream=None):
+        self.delay = delay  # Seconds to wait after every character
+        self.stream = stream
+
+    def write(self, s):
+        stream = self.stream if self.stream is not None else sys.stdout
+        for c in s:
+            stream.write(c)
+            stream.flush()
+            time.sleep(self.delay)
+
+    def flush(self):
+        (self.stream if self.stream is not None else sys.stdout).flush()
+
+
+# Fast renderer that buffers text and never sleeps
+# With a stream, the buffer is written out on flush (battleSim flushes when it waits for input and at the end
+# of a game). Without a stream, the text is only kept and can be read back with text()
+class HeadlessRenderer:
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.parts = []
+
+    def write(self, s):
+        self.parts.append(s)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.write(''.join(self.parts))
+            self.stream.flush()
+            self.parts.clear()
+
+    # Returns the text that has not been flushed to a stream
+    def text(self):
+        return ''.join(self.parts)
+
+
+# ---------- Players ----------
+# A player chooses actions for one side in battleSim. It is called with (team, opponent, observation)
+# and returns an action from 0 to 5, the same numbering used by Agents and evaluator functions
+# The observation always shows the player's own team first: getState(team, opponent), whichever seat it plays
+
+# Player driven by an evaluator function such as evaluator_highest_damage_action
+def evaluatorPlayer(evaluator):
+    return lambda team, opponent, observation: evaluator(team, opponent)
+
+
+# Player driven by an object with a choose_action(observation, mask) method, such as training.Agent
+# mask holds the team's legal actions, see teamLegalActions
+def agentPlayer(agent):
+    return lambda team, opponent, observation: agent.choose_action(observation, teamLegalActions(team))
+
+
 # Team Class
 class Team:
+    __slots__ = ('teamName', 'Pokemon1', 'Pokemon2', 'Pokemon3', 'roster', 'activePokemon', 'activePokemonN',
+                 'hasAvailablePokemon', 'reward', 'roundNumber', 'faintedFlag', 'matchupTable', 'seat')
+
     def __init__(self, teamName, Pokemon1, Pokemon2, Pokemon3):
         self.teamName = teamName
         self.Pokemon1 = Pokemon1
         self.Pokemon2 = Pokemon2
         self.Pokemon3 = Pokemon3
+        # The three Pokemon indexed by (activePokemonN - 1)
+        self.roster = (Pokemon1, Pokemon2, Pokemon3)
         self.activePokemon = Pokemon1
         self.activePokemonN = 1
         self.hasAvailablePokemon = True
@@ -117,6 +266,35 @@ class Team:
         self.roundNumber = 0
         # Set to true within fightSim if the previous Pokemon fainted prior to an automatic switch
         self.faintedFlag = False
+        # Cached MatchupTable against the last opposing team, see getMatchupTable
+        self.matchupTable = None
+        # Seat the team took in its last fightSim: 1 as Team1, 2 as Team2, None before its first turn
+        self.seat = None
+
+    # Restores every Pokemon and the team's battle state to the start of a game, in place
+    def reset(self):
+        self.Pokemon1.reset()
+        self.Pokemon2.reset()
+        self.Pokemon3.reset()
+        self.activePokemon = self.Pokemon1
+        self.activePokemonN = 1
+        self.hasAvailablePokemon = True
+        self.reward = 0
+        self.roundNumber = 0
+        self.faintedFlag = False
+
+    # Makes the Pokemon in slot n (1 to 3) the active Pokemon
+    def setActive(self, n):
+        self.activePokemon = self.roster[n - 1]
+        self.activePokemonN = n
+
+    # Writes the same values as toArray into out[offset:offset + team_state_size]
+    def writeArray(self, out, offset):
+        self.Pokemon1.writeArray(out, offset)
+        self.Pokemon2.writeArray(out, offset + pokemon_state_size)
+        self.Pokemon3.writeArray(out, offset + 2 * pokemon_state_size)
+        offset += 3 * pokemon_state_size
+        out[offset:offset + 3] = (self.activePokemonN, self.hasAvailablePokemon, self.roundNumber)
 
     # Returns an array that represents parameters about this object
     def toArray(self):
@@ -126,70 +304,483 @@ class Team:
                  int(self.hasAvailablePokemon), self.roundNumber])
 
 
-# Pokemon Class
-class Pokemon:
-    def __init__(self, name, type1, type2, healthPercentage, moves, status, hp, attack, spattack, defense, spdefense,
-                 speed, ability, item, ):
+# Creates a property for a Pokemon field that the matchup table depends on
+# Assigning the field invalidates every cached matchup table involving the Pokemon
+def _matchupField(name):
+    private = '_' + name
+
+    def getter(self):
+        return getattr(self, private)
+
+    def setter(self, value):
+        setattr(self, private, value)
+        self.matchupVersion += 1
+
+    return property(getter, setter)
+
+
+# Creates a read-only property that returns a field of the Pokemon's Species
+def _speciesField(name):
+    return property(lambda self: getattr(self.species, name))
+
+
+# Immutable data about a kind of Pokemon, shared by every Pokemon built from it
+class Species:
+    __slots__ = ('name', 'type1', 'type2', 'moves', 'hp', 'attack', 'spattack', 'defense', 'spdefense', 'speed',
+                 'ability', 'item', 'level', 'startHealthPercentage', 'startStatus')
+
+    def __init__(self, name, type1, type2, moves, hp, attack, spattack, defense, spdefense, speed, ability, item,
+                 level=100.0, startHealthPercentage=100, startStatus=pokemon_conditions_dict["None"]):
         self.name = name
-        self.type1 = type1  # changed this variable name from types to type1, updated in the toArray
+        self.type1 = type1
         self.type2 = type2
-        self.healthPercentage = healthPercentage
-        self.moves = moves
-        self.status = status
+        self.moves = tuple(moves)
         self.hp = hp
         self.attack = attack
         self.spattack = spattack
         self.defense = defense
         self.spdefense = spdefense
         self.speed = speed
-        self.maxHp = hp
         self.ability = ability  # implement last
         self.item = item  # implement last
-        self.level = 100.0  # pokemon are automatically set to level 100
+        self.level = level
+        # Battle state a Pokemon of this species starts a game with
+        self.startHealthPercentage = startHealthPercentage
+        self.startStatus = startStatus
+
+
+# Pokemon Class
+# Holds the mutable battle state of one Pokemon; the fixed data lives in its Species
+class Pokemon:
+    __slots__ = ('species', 'matchupVersion', 'baseVersion', 'healthPercentage', 'hp', 'maxHp', 'speed',
+                 'movesState', 'movesStateKey',
+                 '_type1', '_type2', '_moves', '_status', '_attack', '_spattack', '_defense', '_spdefense', '_level')
+
+    type1 = _matchupField('type1')
+    type2 = _matchupField('type2')
+    moves = _matchupField('moves')
+    status = _matchupField('status')
+    attack = _matchupField('attack')
+    spattack = _matchupField('spattack')
+    defense = _matchupField('defense')
+    spdefense = _matchupField('spdefense')
+    level = _matchupField('level')
+
+    name = _speciesField('name')
+    ability = _speciesField('ability')
+    item = _speciesField('item')
+
+    def __init__(self, name, type1, type2, healthPercentage, moves, status, hp, attack, spattack, defense, spdefense,
+                 speed, ability, item, ):
+        self.species = Species(name, type1, type2, moves, hp, attack, spattack, defense, spdefense, speed,
+                               ability, item, startHealthPercentage=healthPercentage, startStatus=status)
+        # Incremented whenever a field used by the matchup table changes
+        self.matchupVersion = 0
+        # matchupVersion right after the matchup fields were last restored from the species
+        self.baseVersion = -1
+        # Cached observation values of the moves, see writeArray
+        self.movesState = None
+        self.movesStateKey = None
+        self.reset()
+
+    # Creates a Pokemon that shares the given species instead of building a new one
+    @classmethod
+    def fromSpecies(cls, species):
+        pokemon = cls.__new__(cls)
+        pokemon.species = species
+        pokemon.matchupVersion = 0
+        pokemon.baseVersion = -1
+        pokemon.movesState = None
+        pokemon.movesStateKey = None
+        pokemon.reset()
+        return pokemon
+
+    # Restores the battle state of the Pokemon from its species, in place
+    def reset(self):
+        species = self.species
+        self.hp = species.hp
+        self.maxHp = species.hp
+        self.speed = species.speed
+        self.healthPercentage = species.startHealthPercentage
+        # Only reassign the matchup fields if one of them changed, so cached matchup tables stay valid
+        if self.matchupVersion != self.baseVersion:
+            self.type1 = species.type1
+            self.type2 = species.type2
+            self.moves = species.moves
+            self.status = species.startStatus
+            self.attack = species.attack
+            self.spattack = species.spattack
+            self.defense = species.defense
+            self.spdefense = species.spdefense
+            self.level = species.level  # pokemon are automatically set to level 100
+            self.baseVersion = self.matchupVersion
 
     # Returns an array that represents parameters about this object
     def toArray(self):
         # Generate integer values for these strings
 
+        # Read the matchup fields directly to skip their property getters
         return [
-                   self.type1,
-                   self.type2 if self.type2 is not None else 0,
+                   self._type1,
+                   self._type2 if self._type2 is not None else 0,
                    self.healthPercentage,
-                   self.attack,
-                   self.spattack,
-                   self.defense,
-                   self.spdefense,
+                   self._attack,
+                   self._spattack,
+                   self._defense,
+                   self._spdefense,
                    self.speed,
                    self.maxHp,
-               ] + [item for items in self.moves for item in items.toArray()]
+               ] + [item for items in self._moves for item in items.toArray()]
+
+    # Writes the same values as toArray into out[offset:offset + pokemon_state_size]
+    # Slice assignments are used since they are much cheaper than one NumPy write per value
+    def writeArray(self, out, offset):
+        out[offset:offset + 9] = (self._type1,
+                                  self._type2 if self._type2 is not None else 0,
+                                  self.healthPercentage,
+                                  self._attack,
+                                  self._spattack,
+                                  self._defense,
+                                  self._spdefense,
+                                  self.speed,
+                                  self.maxHp)
+        # The moves block only changes if the moves are reassigned
+        if self.movesStateKey is not self._moves:
+            self.movesState = np.concatenate([move.stateArray for move in self._moves])
+            self.movesStateKey = self._moves
+        out[offset + 9:offset + pokemon_state_size] = self.movesState
+
+
+# Integer codes for move categories, these are the values written by Move.toArray
+CATEGORY_NONE = 0
+CATEGORY_SPECIAL = 1
+CATEGORY_STATUS = 2
+CATEGORY_PHYSICAL = -1
+
+move_categories_dict = {None: CATEGORY_NONE, "special": CATEGORY_SPECIAL, "status": CATEGORY_STATUS,
+                        "physical": CATEGORY_PHYSICAL}
 
 
 # Moves Class
 class Move:
+    __slots__ = ('moveName', 'moveType', 'physpc', 'category', 'basePower', 'accuracy', 'effect', 'stateArray')
+
     def __init__(self, moveName, moveType, physpc, basePower, accuracy,
                  effect):
         self.moveName = moveName
         self.moveType = moveType
         self.physpc = physpc
+        self.category = move_categories_dict[physpc]  # integer code of physpc
         self.basePower = basePower
         self.accuracy = accuracy  # moves with 101 accuracy cannot be lowered
         self.effect = effect  # implement last
+        # Moves never change, so their part of the observation is built once
+        self.stateArray = np.array(self.toArray(), dtype=np.float32)
 
     # Returns an array that represents parameters about this object
     def toArray(self):
-        physpc_int = (0 if self.physpc is None else 1 if self.physpc
-                                                         == "special" else 2 if self.physpc == "status" else -1)
         basePower_int = self.basePower if self.basePower is not None else -1
         return [
             self.moveType,
-            physpc_int,
+            self.category,
             basePower_int,
             self.accuracy,
         ]
 
 
+# Returns the damage of move before the critical hit, roll and burn multipliers are applied
+# These are the deterministic terms of the damage formula in damageCalc
+def baseDamage(attacker, move, defender):
+    # determine if the move gets STAB (Same Type Attack Bonus)
+    stab = 1.0
+    if move.moveType == attacker.type1 or move.moveType == attacker.type2:
+        stab = 1.5
+
+    # determine the type effectiveness
+    typeEffectiveness = damage_array[move.moveType][defender.type1]
+    if defender.type2 is not None:  # if the defending pokemon is dual type
+        typeEffectiveness *= damage_array[move.moveType][defender.type2]
+
+    # physical moves use attack and defense, special moves use special attack and special defense
+    if move.category == CATEGORY_PHYSICAL:
+        ratio = attacker.attack / defender.defense
+    else:
+        ratio = attacker.spattack / defender.spdefense
+
+    return ((((2.0 * attacker.level) / 5.0) + 2.0) * move.basePower * ratio / 50.0 + 2.0) * stab * typeEffectiveness
+
+
+# Returns the sum of the matchup versions of a team's Pokemon
+# Versions only increase, so the sum changes whenever any Pokemon's matchup fields change
+def rosterVersion(team):
+    return team.Pokemon1.matchupVersion + team.Pokemon2.matchupVersion + team.Pokemon3.matchupVersion
+
+
+# Deterministic part of every hit between an attacking team and a defending team
+# entries[attacker slot][move][defender slot] = (accuracy, isDamaging, damage before critical hit and roll)
+# Slots and moves are 0 based. The burn penalty of the attacker is already applied.
+class MatchupTable:
+    def __init__(self, TeamAttacker, TeamDefender):
+        self.defender = TeamDefender
+        self.version = (rosterVersion(TeamAttacker), rosterVersion(TeamDefender))
+        attackers = (TeamAttacker.Pokemon1, TeamAttacker.Pokemon2, TeamAttacker.Pokemon3)
+        defenders = (TeamDefender.Pokemon1, TeamDefender.Pokemon2, TeamDefender.Pokemon3)
+        self.entries = [[[self._entry(attacker, move, defender) for defender in defenders]
+                         for move in attacker.moves] for attacker in attackers]
+        # DamageDistribution of each entry, built on first use, see distribution
+        self.distributions = {}
+
+    # Returns the DamageDistribution of one hit of move (0 based) from attacker slot to defender slot
+    def distribution(self, attackerSlot, move, defenderSlot):
+        key = (attackerSlot, move, defenderSlot)
+        distribution = self.distributions.get(key)
+        if distribution is None:
+            accuracy, isDamaging, damage = self.entries[attackerSlot][move][defenderSlot]
+            distribution = self.distributions[key] = DamageDistribution(accuracy, isDamaging, damage)
+        return distribution
+
+    @staticmethod
+    def _entry(attacker, move, defender):
+        if move.category != CATEGORY_PHYSICAL and move.category != CATEGORY_SPECIAL:
+            return move.accuracy, False, 0.0
+
+        # Attacker gets a damage reduction for being burned and using a physical move
+        burn = 1.0
+        if attacker.status == pokemon_conditions_dict["Burned"] and move.category == CATEGORY_PHYSICAL:
+            burn = 0.5
+        return move.accuracy, True, float(baseDamage(attacker, move, defender)) * burn
+
+
+# Returns the cached MatchupTable of TeamAttacker hitting TeamDefender, rebuilding it if
+# a stat, type, move or status of either team changed since it was built
+def getMatchupTable(TeamAttacker, TeamDefender):
+    table = TeamAttacker.matchupTable
+    if (table is None or table.defender is not TeamDefender
+            or table.version != (rosterVersion(TeamAttacker), rosterVersion(TeamDefender))):
+        table = MatchupTable(TeamAttacker, TeamDefender)
+        TeamAttacker.matchupTable = table
+    return table
+
+
+# ---------- Damage Distributions ----------
+# One use of a move deals a random amount of damage: nothing if the accuracy check fails, otherwise the
+# precomputed damage b times a uniform roll in [0.85, 1.0], times 1.5 on a 1 in 16 critical hit. So the damage
+# is a mixture of a point mass and two uniform pieces: [0.85b, b] and [1.275b, 1.5b]. DamageDistribution keeps
+# these pieces and answers questions about them exactly instead of by sampling.
+
+critical_chance = 1.0 / 16.0
+
+
+# Returns P(X + Y >= x) for independent X ~ U[low1, low1 + width1] and Y ~ U[low2, low2 + width2]
+# A width of 0 is a point mass
+def _sumSurvival(x, low1, width1, low2, width2):
+    x -= low1 + low2
+    if width1 == 0 or width2 == 0:
+        width = width1 + width2
+        if width == 0:
+            return 1.0 if x <= 0 else 0.0
+        return min(1.0, max(0.0, 1.0 - x / width))
+    if x <= 0:
+        return 1.0
+    if x >= width1 + width2:
+        return 0.0
+
+    # CDF of the sum of two uniforms (a trapezoid), from the ramp function r(t) = max(t, 0)^2 / 2
+    def r(t):
+        return t * t / 2.0 if t > 0 else 0.0
+
+    return 1.0 - (r(x) - r(x - width1) - r(x - width2) + r(x - width1 - width2)) / (width1 * width2)
+
+
+# Distribution of the damage of one use of a move, see above
+# pieces is a list of (probability, low, width); a width of 0 is a point mass
+class DamageDistribution:
+    __slots__ = ('pieces', 'breakpoints')
+
+    def __init__(self, accuracy, isDamaging, damage):
+        # damageCalc hits when accuracy >= a roll from 1 to 100
+        hit = min(1.0, max(0.0, accuracy / 100.0))
+        pieces = []
+        if hit < 1.0:
+            pieces.append((1.0 - hit, 0.0, 0.0))
+        if hit > 0.0:
+            if isDamaging:
+                pieces.append((hit * (1.0 - critical_chance), 0.85 * damage, 0.15 * damage))
+                pieces.append((hit * critical_chance, 1.275 * damage, 0.225 * damage))
+            else:
+                # Non-damaging moves use the same placeholder damage as damageCalc
+                pieces.append((hit, 100.0, 0.0))
+        self.pieces = pieces
+        # Damage values between which the CDF is linear, used by quantile
+        self.breakpoints = sorted({x for _, low, width in pieces for x in (low, low + width)})
+
+    # Expected damage
+    def mean(self):
+        return sum(probability * (low + width / 2.0) for probability, low, width in self.pieces)
+
+    # P(damage <= x)
+    def cdf(self, x):
+        total = 0.0
+        for probability, low, width in self.pieces:
+            if x >= low + width:
+                total += probability
+            elif x > low:
+                total += probability * (x - low) / width
+        return total
+
+    # Smallest damage d with P(damage <= d) >= q
+    def quantile(self, q):
+        previous = self.breakpoints[0]
+        previousCdf = self.cdf(previous)
+        if q <= previousCdf:
+            return previous
+        for x in self.breakpoints[1:]:
+            cdf = self.cdf(x)
+            if q <= cdf:
+                # The CDF is linear between breakpoints, except for point masses which jump at x
+                atX = sum(probability for probability, low, width in self.pieces if width == 0 and low == x)
+                if cdf - atX >= q:
+                    return previous + (x - previous) * (q - previousCdf) / (cdf - atX - previousCdf)
+                return x
+            previous, previousCdf = x, cdf
+        return previous
+
+    # Probability of knocking out a defender with hp left within hits uses of the move (1 or 2)
+    # A Pokemon faints when the damage taken is at least its hp
+    def koProbability(self, hp, hits=1):
+        if hp <= 0:
+            return 1.0
+        if hits == 1:
+            return sum(probability * _sumSurvival(hp, low, width, 0.0, 0.0)
+                       for probability, low, width in self.pieces)
+        if hits == 2:
+            return sum(p1 * p2 * _sumSurvival(hp, low1, width1, low2, width2)
+                       for p1, low1, width1 in self.pieces for p2, low2, width2 in self.pieces)
+        raise ValueError('koProbability supports 1 or 2 hits, not %i' % hits)
+
+
+# Returns the cached DamageDistribution of move (1 to 4) used by TeamAttacker's active Pokemon on
+# TeamDefender's active Pokemon
+def getDamageDistribution(TeamAttacker, TeamDefender, move):
+    return getMatchupTable(TeamAttacker, TeamDefender).distribution(TeamAttacker.activePokemonN - 1, move - 1,
+                                                                   TeamDefender.activePokemonN - 1)
+
+
+# Returns what move (1 to 4) of TeamAttacker's active Pokemon does to TeamDefender's active Pokemon at its
+# current hp: expected damage, damage quantiles, and the probability of a knock out in one and in two hits
+def damageSummary(TeamAttacker, TeamDefender, move, quantiles=(0.1, 0.5, 0.9)):
+    distribution = getDamageDistribution(TeamAttacker, TeamDefender, move)
+    hp = TeamDefender.activePokemon.hp
+    return {'expected': distribution.mean(),
+            'quantiles': [distribution.quantile(q) for q in quantiles],
+            'ko1': distribution.koProbability(hp, 1),
+            'ko2': distribution.koProbability(hp, 2)}
+
+
+# Returns the slot number (1 to 3) that switch action 5 or 6 brings in, or 0 if no switch is possible
+# Action 5 picks the first Pokemon in slot order that is able to battle, action 6 the first in reverse order
+def switchTarget(team, action):
+    for n in ((1, 2, 3) if action == 5 else (3, 2, 1)):
+        if n != team.activePokemonN and team.roster[n - 1].hp > 0:
+            return n
+    return 0
+
+
+# Returns the first slot number (1 to 3) holding a Pokemon that is able to battle, or 0 if all have fainted
+def firstAvailable(team):
+    for n in (1, 2, 3):
+        if team.roster[n - 1].hp > 0:
+            return n
+    return 0
+
+
+# Returns how many Pokemon on team's bench (not the active one) are able to battle
+def benchAvailable(team):
+    n = 0
+    for slot in (1, 2, 3):
+        if slot != team.activePokemonN and team.roster[slot - 1].hp > 0:
+            n += 1
+    return n
+
+
+# ---------- Legal Actions ----------
+# An action is legal if it does something. Moves 1 to 4 need an active Pokemon that is able to battle.
+# Switch 5 needs a benched Pokemon that is able to battle; switch 6 brings in a different Pokemon than 5 only
+# if two are, so it is legal only then. fightSim still accepts illegal actions and ignores them.
+# Masks are indexed by 0 based action, like the Q values of training.Agent
+
+# Returns a list of 6 booleans, True for the legal actions of team
+def teamLegalActions(team):
+    alive = team.activePokemon.hp > 0
+    bench = benchAvailable(team)
+    return [alive, alive, alive, alive, bench >= 1, bench >= 2]
+
+
+# Returns a uniformly random legal action (1 to 6, fightSim's numbering) of team, drawn from the random.Random rnd
+# While the game is on the active Pokemon is able to battle, so only the switches can be illegal
+def randomLegalAction(team, rnd):
+    return rnd.randint(1, 4 + benchAvailable(team))
+
+
+# Returns a (2, 6) boolean array: the legal actions of team1 in row 0, those of team2 in row 1
+def legal_actions(team1, team2):
+    return np.array([teamLegalActions(team1), teamLegalActions(team2)], dtype=bool)
+
+
+# Array version of legal_actions for many games at once
+# hp has shape (..., 2, 3) (every Pokemon's hp, or anything that is above 0 exactly when hp is) and active
+# shape (..., 2) holding the 0 based active slot of each team. Returns a boolean array of shape (..., 2, 6)
+def legal_actions_batch(hp, active):
+    alive = np.asarray(hp) > 0
+    active = np.asarray(active)
+    activeAlive = np.take_along_axis(alive, active[..., None], axis=-1)[..., 0]
+    bench = alive.sum(axis=-1) - activeAlive
+    masks = np.empty(alive.shape[:-1] + (6,), dtype=bool)
+    masks[..., :4] = activeAlive[..., None]
+    masks[..., 4] = bench >= 1
+    masks[..., 5] = bench >= 2
+    return masks
+
+
+_health_columns = [state_index['team%i.pokemon%i.healthPercentage' % (t, p)] for t in (1, 2) for p in (1, 2, 3)]
+_active_columns = [state_index['team%i.activePokemonN' % t] for t in (1, 2)]
+
+
+# Legal actions read from getState observations of shape (..., state_size). Returns shape (..., 2, 6)
+# A Pokemon's healthPercentage is above 0 exactly when its hp is
+def observation_legal_actions(observations):
+    observations = np.asarray(observations)
+    health = observations[..., _health_columns].reshape(observations.shape[:-1] + (2, 3))
+    active = observations[..., _active_columns].astype(np.int64) - 1
+    return legal_actions_batch(health, active)
+
+
+# Returns one uniformly random legal action (0 based) per row of masks, drawn from the NumPy Generator rng
+# A row without any legal action (a finished game) allows every action
+def random_legal_actions(masks, rng):
+    masks = np.asarray(masks)
+    masks = masks | ~masks.any(axis=-1, keepdims=True)
+    return np.argmax(rng.random(masks.shape) * masks, axis=-1)
+
+
+# Returns q_values with the illegal actions of masks set to -inf, so argmax picks a legal action
+# A row without any legal action is left as it is
+def masked_q_values(q_values, masks):
+    masks = np.asarray(masks)
+    return np.where(masks | ~masks.any(axis=-1, keepdims=True), q_values, -np.inf)
+
+
 # a function that takes an integer as an action, an int/bool as team and pokemon info
-def fightSim(Team1, Team2, team1Action, team2Action):
+# rng is the BattleRNG to draw from, default_rng if None
+# recorder, if given, is told about the turn before and after it is played (see recorder.Recorder); it reads
+# the rolls of the turn from the BattleRNG
+def fightSim(Team1, Team2, team1Action, team2Action, rng=None, recorder=None):
+    if rng is None:
+        rng = default_rng
+    if recorder is not None:
+        recorder.beginTurn(Team1, Team2, team1Action, team2Action, rng)
+    Team1.seat = 1
+    Team2.seat = 2
     Team1.reward = 0
     Team2.reward = 0
     Team1.faintedFlag = False
@@ -199,69 +790,33 @@ def fightSim(Team1, Team2, team1Action, team2Action):
     # switching Team1 pokemon
     if team1Action == 5 or team1Action == 6:
         Team1.reward -= reward_punish_switch
-        if (team1Action == 5 and Team1.Pokemon1.hp > 0 and Team1.activePokemon != Team1.Pokemon1):
-            Team1.activePokemon = Team1.Pokemon1
-            Team1.activePokemonN = 1
-        elif (team1Action == 5 and Team1.Pokemon2.hp > 0 and Team1.activePokemon != Team1.Pokemon2):
-            Team1.activePokemon = Team1.Pokemon2
-            Team1.activePokemonN = 2
-        elif (team1Action == 5 and Team1.Pokemon3.hp > 0 and Team1.activePokemon != Team1.Pokemon3):
-            Team1.activePokemon = Team1.Pokemon3
-            Team1.activePokemonN = 3
-
-        elif (team1Action == 6 and Team1.Pokemon3.hp > 0 and Team1.activePokemon != Team1.Pokemon3):
-            Team1.activePokemon = Team1.Pokemon3
-            Team1.activePokemonN = 3
-        elif (team1Action == 6 and Team1.Pokemon2.hp > 0 and Team1.activePokemon != Team1.Pokemon2):
-            Team1.activePokemon = Team1.Pokemon2
-            Team1.activePokemonN = 2
-        elif (team1Action == 6 and Team1.Pokemon1.hp > 0 and Team1.activePokemon != Team1.Pokemon1):
-            Team1.activePokemon = Team1.Pokemon1
-            Team1.activePokemonN = 1
-        else:
-            # Attempt to select a Pokemon that has fainted
-            pass
+        n = switchTarget(Team1, team1Action)
+        if n:
+            Team1.setActive(n)
+        # otherwise the attempt selected a Pokemon that has fainted
 
     # switching Team2 pokemon
     if team2Action == 5 or team2Action == 6:
         Team2.reward -= reward_punish_switch
-        if (team2Action == 5 and Team2.Pokemon1.hp > 0 and Team2.activePokemon != Team2.Pokemon1):
-            Team2.activePokemon = Team2.Pokemon1
-            Team2.activePokemonN = 1
-        elif (team2Action == 5 and Team2.Pokemon2.hp > 0 and Team2.activePokemon != Team2.Pokemon2):
-            Team2.activePokemon = Team2.Pokemon2
-            Team2.activePokemonN = 2
-        elif (team2Action == 5 and Team2.Pokemon3.hp > 0 and Team2.activePokemon != Team2.Pokemon3):
-            Team2.activePokemon = Team2.Pokemon3
-            Team2.activePokemonN = 3
-
-        elif (team2Action == 6 and Team2.Pokemon3.hp > 0 and Team2.activePokemon != Team2.Pokemon3):
-            Team2.activePokemon = Team2.Pokemon3
-            Team2.activePokemonN = 3
-        elif (team2Action == 6 and Team2.Pokemon2.hp > 0 and Team2.activePokemon != Team2.Pokemon2):
-            Team2.activePokemon = Team2.Pokemon2
-            Team2.activePokemonN = 2
-        elif (team2Action == 6 and Team2.Pokemon1.hp > 0 and Team2.activePokemon != Team2.Pokemon1):
-            Team2.activePokemon = Team2.Pokemon1
-            Team2.activePokemonN = 1
-        else:
-            # Attempt to select a Pokemon that has fainted
-            pass
+        n = switchTarget(Team2, team2Action)
+        if n:
+            Team2.setActive(n)
+        # otherwise the attempt selected a Pokemon that has fainted
 
     # if Team1 moves first
     if Team1.activePokemon.speed >= Team2.activePokemon.speed:
         # do calc
-        damageCalc(Team1, Team2, team1Action)
+        damageCalc(Team1, Team2, team1Action, rng)
         # other pokemon attacks if they didn't just faint
         if Team1.activePokemon.hp > 0 and Team2.activePokemon.hp > 0:
-            damageCalc(Team2, Team1, team2Action)
+            damageCalc(Team2, Team1, team2Action, rng)
     # if Team2 moves first
     else:
         # do calc
-        damageCalc(Team2, Team1, team2Action)
+        damageCalc(Team2, Team1, team2Action, rng)
         # other pokemon attacks if they didn't just faint
         if Team1.activePokemon.hp > 0 and Team2.activePokemon.hp > 0:
-            damageCalc(Team1, Team2, team1Action)
+            damageCalc(Team1, Team2, team1Action, rng)
 
     # Automatically pick an available Pokemon if one of the teams' active pokemon fainted
     if (Team1.activePokemon.hp <= 0 and Team2.activePokemon.hp > 0 and Team1.hasAvailablePokemon):
@@ -270,36 +825,20 @@ def fightSim(Team1, Team2, team1Action, team2Action):
         Team1.reward -= reward_pokemon_faint
         Team2.reward += reward_pokemon_faint
         # Automatically pick a Pokemon for Team 1
-        if Team1.Pokemon1.hp > 0:
-            Team1.activePokemon = Team1.Pokemon1
-            Team1.activePokemonN = 1
-        elif Team1.Pokemon2.hp > 0:
-            Team1.activePokemon = Team1.Pokemon2
-            Team1.activePokemonN = 2
-        elif Team1.Pokemon3.hp > 0:
-            Team1.activePokemon = Team1.Pokemon3
-            Team1.activePokemonN = 3
-        else:
-            # All pokemon are fainted, this shouldn't happen from the above check
-            pass
+        n = firstAvailable(Team1)
+        if n:
+            Team1.setActive(n)
+        # otherwise all pokemon are fainted, this shouldn't happen from the above check
     elif (Team1.activePokemon.hp > 0 and Team2.activePokemon.hp <= 0 and Team2.hasAvailablePokemon):
         Team2.faintedFlag = True
         # A Pokemon has fainted, punish the team
         Team1.reward += reward_pokemon_faint
         Team2.reward -= reward_pokemon_faint
         # Automatically pick a Pokemon for Team 2
-        if Team2.Pokemon1.hp > 0:
-            Team2.activePokemon = Team2.Pokemon1
-            Team2.activePokemonN = 1
-        elif Team2.Pokemon2.hp > 0:
-            Team2.activePokemon = Team2.Pokemon2
-            Team2.activePokemonN = 2
-        elif Team2.Pokemon3.hp > 0:
-            Team2.activePokemon = Team2.Pokemon3
-            Team2.activePokemonN = 3
-        else:
-            # All pokemon are fainted, this shouldn't happen from the above check
-            pass
+        n = firstAvailable(Team2)
+        if n:
+            Team2.setActive(n)
+        # otherwise all pokemon are fainted, this shouldn't happen from the above check
     else:
         # I don't think both pokemon will faint on the same turn in this limited simulation,
         # therefore assume they're both alive
@@ -339,159 +878,277 @@ def fightSim(Team1, Team2, team1Action, team2Action):
     Team1.roundNumber += 1
     Team2.roundNumber += 1
 
+    if recorder is not None:
+        recorder.endTurn(Team1, Team2)
 
-# Returns an array of parameters
-def getState(team1: Team, team2: Team):
-    return team1.toArray() + team2.toArray()
 
+# Returns the seat team plays in against opponent: 1 if it is fightSim's Team1, which wins speed ties, or 2
+# Taken from seatTeams or the last turn either team played; without either the team is assumed to be Team1
+def seatOf(team, opponent):
+    if team.seat is not None:
+        return team.seat
+    return 3 - opponent.seat if opponent.seat is not None else 1
 
 
+# Seats team1 as fightSim's Team1 and team2 as its Team2 (see seatOf). fightSim does this every turn; game
+# loops call it when a game starts, so players that look at their seat see it before the first turn
+def seatTeams(team1, team2):
+    team1.seat = 1
+    team2.seat = 2
 
 
-def battleSim(Team1, Team2, ai=None, ai_is_a=True):
-    txt = "default"
-    chooseTeam1Move = ""
-    chooseTeam2Move = ""
+# Plays one turn of team against opponent with both teams in their seats (see seatOf), so speed ties are
+# settled as in the real game. Search code uses it to play turns from the point of view of team
+def seatedFightSim(team, opponent, teamAction, opponentAction, seat, rng=None):
+    if seat == 1:
+        fightSim(team, opponent, teamAction, opponentAction, rng)
+    else:
+        fightSim(opponent, team, opponentAction, teamAction, rng)
+
+
+# Returns an array of parameters
+# If out is given, the parameters are written into it instead (a float32 NumPy row of state_size values,
+# such as a row of a batch or replay buffer) and out is returned. Fields are laid out as in state_fields
+def getState(team1: Team, team2: Team, out=None):
+    if out is None:
+        return team1.toArray() + team2.toArray()
+    team1.writeArray(out, 0)
+    team2.writeArray(out, team_state_size)
+    return out
+
+
+# Returns getState observations (shape (..., state_size)) seen from the other seat: the Team 1 and Team 2
+# blocks are swapped, so the result equals getState(team2, team1). out must not be observations itself
+# Every player is shown the board with its own team first, so a player in seat 2 gets its observations
+# through this. ObservationEncoder observations also hold one block per team and are swapped the same way
+def swap_observation(observations, out=None):
+    observations = np.asarray(observations)
+    if out is None:
+        out = np.empty_like(observations)
+    half = observations.shape[-1] // 2
+    out[..., :half] = observations[..., half:]
+    out[..., half:] = observations[..., :half]
+    return out
+
+
+# Scale each field is divided by when an ObservationEncoder normalizes, so values fall roughly within [-1, 1]
+state_scales = {'type1': 18.0, 'type2': 18.0, 'healthPercentage': 100.0, 'attack': 500.0, 'spattack': 500.0,
+                'defense': 500.0, 'spdefense': 500.0, 'speed': 500.0, 'maxHp': 500.0, 'moveType': 18.0,
+                'category': 2.0, 'basePower': 250.0, 'accuracy': 100.0, 'activePokemonN': 3.0,
+                'hasAvailablePokemon': 1.0, 'roundNumber': float(max_round)}
+_type_fields = ('type1', 'type2', 'moveType')
+_dynamic_fields = ('healthPercentage', 'activePokemonN', 'hasAvailablePokemon', 'roundNumber')
+
+
+# Builds observations from a static block per team and the 12 fields that change during a game
+# Types, stats, maxHp and moves never change in a battle, so their part of the observation is encoded once per
+# team and copied; only each Pokemon's healthPercentage and each team's activePokemonN, hasAvailablePokemon and
+# roundNumber are written every turn. Without options the observation is the same as getState's
+# normalize      = Divide every field by its scale in state_scales
+# one_hot_types  = Replace every type and move type by 18 columns, one per type (all 0 for a missing type2)
+#
+#     encoder = ObservationEncoder(normalize=True)
+#     encoder.reset(team1, team2)  # after the teams are reset or changed
+#     encoder.encode(team1, team2, out=observation)  # after every fightSim
+class ObservationEncoder:
+    def __init__(self, normalize=False, one_hot_types=False):
+        self.normalize = normalize
+        self.one_hot_types = one_hot_types
+
+        # Columns of the encoded observation: one per field, or one per type of the type fields
+        self.fields = []
+        self.columns = []  # Encoded column (or first of 18 columns) of every getState column
+        for name in state_fields:
+            self.columns.append(len(self.fields))
+            field = name.rsplit('.', 1)[1]
+            if one_hot_types and field in _type_fields:
+                self.fields += ['%s.%s' % (name, t) for t in pokemon_types]
+            else:
+                self.fields.append(name)
+        self.index = {name: i for i, name in enumerate(self.fields)}
+        self.size = len(self.fields)
+        self.teamSize = self.columns[team_state_size]
+
+        # Encoded columns of the dynamic fields, in the order update writes them, and their scales
+        dynamic = [i for i, name in enumerate(state_fields) if name.rsplit('.', 1)[1] in _dynamic_fields]
+        self.dynamicColumns = [self.columns[i] for i in dynamic]
+        self.healthScale = 1.0 / state_scales['healthPercentage'] if normalize else 1.0
+        self.activeScale = 1.0 / state_scales['activePokemonN'] if normalize else 1.0
+        self.roundScale = 1.0 / state_scales['roundNumber'] if normalize else 1.0
+
+        self.teams = {}  # (Pokemon versions, static block) of every team seen, by team
+        self.static = np.zeros(self.size, dtype=np.float32)  # Static blocks of the current teams side by side
+
+    # Returns the encoded static block of team, building it only if the team is new or one of its
+    # Pokemon changed
+    def teamBlock(self, team):
+        key = tuple((p.matchupVersion, p.speed, p.maxHp) for p in team.roster)
+        cached = self.teams.get(team)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        raw = np.zeros(team_state_size, dtype=np.float32)
+        team.writeArray(raw, 0)
+        block = np.zeros(self.teamSize, dtype=np.float32)
+        for i, value in enumerate(raw.tolist()):
+            field = state_fields[i].rsplit('.', 1)[1]
+            column = self.columns[i]
+            if self.one_hot_types and field in _type_fields:
+                if value >= 1:
+                    block[column + int(value) - 1] = 1.0
+            else:
+                block[column] = value / state_scales[field] if self.normalize else value
+        self.teams[team] = (key, block)
+        return block
+
+    # Prepares the static part of the observations of team1 against team2
+    # Must be called again whenever a Pokemon's types, stats or moves change, such as after Team.reset
+    def reset(self, team1, team2):
+        self.static[:self.teamSize] = self.teamBlock(team1)
+        self.static[self.teamSize:] = self.teamBlock(team2)
+
+    # Writes the observation into out (a float32 row of size values, allocated if None) and returns it
+    def encode(self, team1, team2, out=None):
+        if out is None:
+            out = np.empty(self.size, dtype=np.float32)
+        out[:] = self.static
+        self.update(team1, team2, out)
+        return out
+
+    # Writes only the 12 dynamic fields into out, which must already hold an observation of the same teams
+    def update(self, team1, team2, out):
+        c = self.dynamicColumns
+        health = self.healthScale
+        p1, p2, p3 = team1.roster
+        q1, q2, q3 = team2.roster
+        out[c[0]] = p1.healthPercentage * health
+        out[c[1]] = p2.healthPercentage * health
+        out[c[2]] = p3.healthPercentage * health
+        out[c[3]] = team1.activePokemonN * self.activeScale
+        out[c[4]] = team1.hasAvailablePokemon
+        out[c[5]] = team1.roundNumber * self.roundScale
+        out[c[6]] = q1.healthPercentage * health
+        out[c[7]] = q2.healthPercentage * health
+        out[c[8]] = q3.healthPercentage * health
+        out[c[9]] = team2.activePokemonN * self.activeScale
+        out[c[10]] = team2.hasAvailablePokemon
+        out[c[11]] = team2.roundNumber * self.roundScale
+        return out
+
+
+# Plays a game between Team1 and Team2 and renders it as text
+# Each side is driven by player1 / player2 (see Players above) or, if it has no player, by a human typing
+# commands. ai is kept for callers that pass an Agent: it drives Team 1 if ai_is_a, otherwise Team 2
+# renderer defaults to a GameboyRenderer; use a HeadlessRenderer to play games without any delays
+# rng and recorder are passed on to fightSim
+def battleSim(Team1, Team2, ai=None, ai_is_a=True, renderer=None, player1=None, player2=None, rng=None,
+              recorder=None):
+    if renderer is None:
+        renderer = GameboyRenderer()
+    if ai is not None:
+        if ai_is_a:
+            player1 = agentPlayer(ai)
+        else:
+            player2 = agentPlayer(ai)
+
+    seatTeams(Team1, Team2)
     # players start out with a predetermined pokemon1
     # If both teams have usable pokemon: loop:
     while Team1.hasAvailablePokemon and Team2.hasAvailablePokemon:
-        # if both active pokemon have health: loop:
-        while Team1.activePokemon.hp >= 0 and Team2.activePokemon.hp >= 0:
-            # print out fight info
-            delayPrint("Team 1's active Pokemon: ")
-            delayPrint(Team1.activePokemon.name)
-            delayPrint("\n")
-            delayPrint("Health percentage: ")
-            print(Team1.activePokemon.healthPercentage)
-            delayPrint("Team 2's active Pokemon: ")
-            delayPrint(Team2.activePokemon.name)
-            delayPrint("\n")
-            delayPrint("Health percentage: ")
-            print(Team2.activePokemon.healthPercentage)
-
-            if ai is not None and ai_is_a:
-                # Playing against AI, and AI is player 1
-                chooseTeam1Move = ai.choose_action(getState(Team1, Team2)) + 1
-                delayPrint('[AI chose %i]\n' % chooseTeam1Move)
-            else:
-                validInput1 = False
-                # moves are chosen for Team 1
-                while validInput1 == False:
-                    delayPrint(
-                        "Team 1, Enter an integer for the following command\n" +
-                        "1: " + Team1.activePokemon.moves[0].moveName +
-                        "   2: " + Team1.activePokemon.moves[1].moveName +
-                        "   3: " + Team1.activePokemon.moves[2].moveName +
-                        "   4: " + Team1.activePokemon.moves[3].moveName +
-                        "\n5: Switch to first available Pokemon   6: Switch to second available Pokemon\n"
-                    )
-                    chooseTeam1Move = input()
-                    # If they chose 1-4
-                    if (chooseTeam1Move == "1" or chooseTeam1Move == "2"
-                            or chooseTeam1Move == "3" or chooseTeam1Move == "4"):
-                        validInput1 = True
-                    # make sure "5" is a valid input (first benched pokemon)"
-                    elif chooseTeam1Move == "5" and Team1.Pokemon1.hp > 0:
-                        validInput1 = True
-                    elif chooseTeam1Move == "5" and Team1.Pokemon2.hp > 0:
-                        validInput1 = True
-                    elif chooseTeam1Move == "5" and Team1.Pokemon3.hp > 0:
-                        validInput1 = True
-                    # make sure "6" is a valid input (second benched pokemon)
-                    elif (chooseTeam1Move == "6" and Team1.Pokemon1.hp > 0
-                          and Team1.Pokemon2.hp > 0 and Team1.Pokemon2.hp > 0):
-                        validInput1 = True
-                    elif chooseTeam1Move == "6" and Team1.Pokemon2.hp > 0:
-                        validInput1 = True
-                    elif chooseTeam1Move == "6" and Team1.Pokemon3.hp > 0:
-                        validInput1 = True
-                    else:
-                        validInput1 = False  # remains false
-
-            if ai is not None and not ai_is_a:
-                # Playing against AI and AI is Player 2
-                chooseTeam2Move = ai.choose_action(getState(Team1, Team2)) + 1
-                delayPrint('[AI chose %i]\n' % chooseTeam2Move)
-            else:
-                validInput2 = False
-                # moves are chosen for Team 2
-                while validInput2 == False:
-                    delayPrint(
-                        "Team 2, Enter an integer for the following command\n" +
-                        "1: " + Team2.activePokemon.moves[0].moveName +
-                        "   2: " + Team2.activePokemon.moves[1].moveName +
-                        "   3: " + Team2.activePokemon.moves[2].moveName +
-                        "   4: " + Team2.activePokemon.moves[3].moveName +
-                        "\n5: Switch to first available Pokemon   6: Switch to second available Pokemon\n"
-                    )
-                    chooseTeam2Move = input()
-                    # If they choose 1-4
-                    if (chooseTeam2Move == "1" or chooseTeam2Move == "2"
-                            or chooseTeam2Move == "3" or chooseTeam2Move == "4"):
-                        validInput2 = True
-                    # make sure "5" is a valid input (first benched pokemon)"
-                    elif chooseTeam2Move == "5" and Team2.Pokemon1.hp > 0:
-                        validInput2 = True
-                    elif chooseTeam2Move == "5" and Team2.Pokemon2.hp > 0:
-                        validInput2 = True
-                    elif chooseTeam2Move == "5" and Team2.Pokemon3.hp > 0:
-                        validInput2 = True
-                    # make sure "6" is a valid input (second benched pokemon)
-                    elif (chooseTeam2Move == "6" and Team2.Pokemon1.hp > 0
-                          and Team2.Pokemon2.hp > 0 and Team2.Pokemon2.hp > 0):
-                        validInput2 = True
-                    elif chooseTeam2Move == "6" and Team2.Pokemon2.hp > 0:
-                        validInput2 = True
-                    elif chooseTeam2Move == "6" and Team2.Pokemon3.hp > 0:
-                        validInput2 = True
-                    else:
-                        validInput2 = False  # remains false
-
-            # convert move choices from strings to ints
-            chooseTeam1Move = int(chooseTeam1Move)
-            chooseTeam2Move = int(chooseTeam2Move)
-
-            # turn happens
-            fightSim(Team1, Team2, chooseTeam1Move, chooseTeam2Move)
-
-            if chooseTeam1Move > 4:
-                delayPrint("Team 1 switched to %s!\n" % Team1.activePokemon.name)
-            if chooseTeam2Move > 4:
-                delayPrint("Team 2 switched to %s!\n" % Team2.activePokemon.name)
-
-            # print out action info
-            if (chooseTeam1Move < 5 and Team1.activePokemon.hp > 0 and not Team1.faintedFlag):
-                delayPrint(Team1.activePokemon.name)
-                delayPrint(" used ")
-                delayPrint(Team1.activePokemon.moves[(
-                        chooseTeam1Move - 1)].moveName)
-                delayPrint("!\n")
-                if (Team2.activePokemon.hp > 0):
-                    delayPrint(Team2.activePokemon.name + " has ")
-                    print(Team2.activePokemon.healthPercentage, end='')
-                    delayPrint(" percent health\n")
-            if (chooseTeam2Move < 5 and Team2.activePokemon.hp > 0 and not Team2.faintedFlag):
-                delayPrint(Team2.activePokemon.name)
-                delayPrint(" used ")
-                delayPrint(Team2.activePokemon.moves[(
-                        chooseTeam2Move - 1)].moveName)
-                delayPrint("!\n")
-                if (Team1.activePokemon.hp > 0):
-                    delayPrint(Team1.activePokemon.name + " has ")
-                    print(Team1.activePokemon.healthPercentage, end='')
-                    delayPrint(" percent health\n")
-
-            # if a pokemon faints:
-            if Team1.faintedFlag:
-                delayPrint("Team 1's pokemon fainted! Automatically switched to %s\n" % Team1.activePokemon.name)
-            if Team2.faintedFlag:
-                delayPrint("Team 2's pokemon fainted! Automatically switched to %s\n" % Team2.activePokemon.name)
+        # print out fight info
+        renderer.write("Team 1's active Pokemon: %s\n" % Team1.activePokemon.name)
+        renderer.write("Health percentage: %s\n" % Team1.activePokemon.healthPercentage)
+        renderer.write("Team 2's active Pokemon: %s\n" % Team2.activePokemon.name)
+        renderer.write("Health percentage: %s\n" % Team2.activePokemon.healthPercentage)
+
+        # moves are chosen for Team 1, then for Team 2
+        chooseTeam1Move = _chooseMove(Team1, Team2, 1, player1, renderer)
+        chooseTeam2Move = _chooseMove(Team2, Team1, 2, player2, renderer)
+
+        # turn happens
+        fightSim(Team1, Team2, chooseTeam1Move, chooseTeam2Move, rng, recorder)
+
+        if chooseTeam1Move > 4:
+            renderer.write("Team 1 switched to %s!\n" % Team1.activePokemon.name)
+        if chooseTeam2Move > 4:
+            renderer.write("Team 2 switched to %s!\n" % Team2.activePokemon.name)
+
+        # print out action info
+        if (chooseTeam1Move < 5 and Team1.activePokemon.hp > 0 and not Team1.faintedFlag):
+            renderer.write("%s used %s!\n" % (Team1.activePokemon.name,
+                                               Team1.activePokemon.moves[(chooseTeam1Move - 1)].moveName))
+            if (Team2.activePokemon.hp > 0):
+                renderer.write("%s has %s percent health\n" % (Team2.activePokemon.name,
+                                                               Team2.activePokemon.healthPercentage))
+        if (chooseTeam2Move < 5 and Team2.activePokemon.hp > 0 and not Team2.faintedFlag):
+            renderer.write("%s used %s!\n" % (Team2.activePokemon.name,
+                                               Team2.activePokemon.moves[(chooseTeam2Move - 1)].moveName))
+            if (Team1.activePokemon.hp > 0):
+                renderer.write("%s has %s percent health\n" % (Team1.activePokemon.name,
+                                                               Team1.activePokemon.healthPercentage))
+
+        # if a pokemon faints:
+        if Team1.faintedFlag:
+            renderer.write("Team 1's pokemon fainted! Automatically switched to %s\n" % Team1.activePokemon.name)
+        if Team2.faintedFlag:
+            renderer.write("Team 2's pokemon fainted! Automatically switched to %s\n" % Team2.activePokemon.name)
 
     # print winning team
     if Team1.hasAvailablePokemon and (Team2.hasAvailablePokemon == False):
-        delayPrint("Team 1 wins!\n")
+        renderer.write("Team 1 wins!\n")
     else:
-        delayPrint("Team 2 wins!\n")
+        renderer.write("Team 2 wins!\n")
+    renderer.flush()
+
+
+# Returns the action (1 to 6) for team in battleSim, asking player or, without a player, a human
+def _chooseMove(team, opponent, teamNumber, player, renderer):
+    if player is not None:
+        # Each player sees its own team first, see swap_observation
+        observation = getState(team, opponent)
+        move = int(player(team, opponent, observation)) + 1
+        renderer.write('[Team %i chose %i]\n' % (teamNumber, move))
+        return move
+
+    validInput = False
+    while validInput == False:
+        renderer.write(
+            "Team %i, Enter an integer for the following command\n" % teamNumber +
+            "1: " + team.activePokemon.moves[0].moveName +
+            "   2: " + team.activePokemon.moves[1].moveName +
+            "   3: " + team.activePokemon.moves[2].moveName +
+            "   4: " + team.activePokemon.moves[3].moveName +
+            "\n5: Switch to first available Pokemon   6: Switch to second available Pokemon\n"
+        )
+        # Waiting for a human, so show everything rendered so far
+        renderer.flush()
+        move = input()
+        # Accept 1 to 6 if it is legal, the same check the agents' action masks use
+        if move in ("1", "2", "3", "4", "5", "6"):
+            validInput = teamLegalActions(team)[int(move) - 1]
+    return int(move)
+
+
+# Plays n_games rendered games between two players without any human input
+# Teams are built once and reset between games. Returns the number of wins of Team 1 and Team 2
+# With a root_seed, game i draws from BattleRNG(gameSeed(root_seed, i)) and can be replayed on its own
+def spectateGames(n_games, player1, player2, team_1_generator=None, team_2_generator=None, renderer=None,
+                  root_seed=None):
+    Team1 = (team_1_generator or generate_team_1)()
+    Team2 = (team_2_generator or generate_team_2)()
+    if renderer is None:
+        renderer = HeadlessRenderer(sys.stdout)
+
+    wins = [0, 0]
+    for game in range(n_games):
+        Team1.reset()
+        Team2.reset()
+        renderer.write("---------- Game %i ----------\n" % (game + 1))
+        rng = BattleRNG(gameSeed(root_seed, game)) if root_seed is not None else None
+        battleSim(Team1, Team2, renderer=renderer, player1=player1, player2=player2, rng=rng)
+        wins[0] += 1 if Team1.hasAvailablePokemon else 0
+        wins[1] += 1 if Team2.hasAvailablePokemon else 0
+    return wins
 
 
 def isGameOver(team1: Team, team2: Team):
@@ -499,12 +1156,18 @@ def isGameOver(team1: Team, team2: Team):
 
 
 # Perform a step in the game simulation. This is primarily used by the AI
-def step(team1: Team, team2: Team, team1_action, team2_action):
+# If out is given, the observation is written into it, see getState
+# rng is the BattleRNG of the game, default_rng if None. recorder is passed on to fightSim
+# encoder, if given, is an ObservationEncoder reset for these teams that builds the observation instead of getState
+def step(team1: Team, team2: Team, team1_action, team2_action, out=None, rng=None, recorder=None, encoder=None):
     # Perform the turn/round
-    fightSim(team1, team2, team1_action, team2_action)
+    fightSim(team1, team2, team1_action, team2_action, rng, recorder)
 
     # Determine observation, or new state space
-    observation = getState(team1, team2)
+    if encoder is not None:
+        observation = encoder.encode(team1, team2, out)
+    else:
+        observation = getState(team1, team2, out)
 
     # Clamp rewards between [-1.0, 1.0]
     team1_reward = max(-1.0, min(1.0, team1.reward))
@@ -516,75 +1179,88 @@ def step(team1: Team, team2: Team, team1_action, team2_action):
     return observation, [team1_reward, team2_reward], gameOver
 
 
-def damageCalc(TeamAttacker, TeamDefender, move):  # damage calculation function
-    Pokemon1 = TeamAttacker.activePokemon
-    Pokemon2 = TeamDefender.activePokemon
-
-    # Pokemon1 is the attacking pokemon, Pokemon2 is the defending pokemon
+# ---------- Battle Snapshots ----------
+# snapshot(team1, team2) captures only the state a battle changes: the hp, health percentage and status of
+# every Pokemon, and each team's active slot, flags, reward and round number. The token is an immutable tuple,
+# so it can be restored any number of times, e.g. once per simulated branch of a lookahead search:
+#
+#     token = snapshot(team1, team2)
+#     for action in range(1, 7):
+#         fightSim(team1, team2, action, 1)
+#         ...evaluate...
+#         restore(token)
+
+# Returns the mutable battle state of one team as a flat tuple
+def _teamState(team):
+    p1, p2, p3 = team.roster
+    return (p1.hp, p1.healthPercentage, p1._status,
+            p2.hp, p2.healthPercentage, p2._status,
+            p3.hp, p3.healthPercentage, p3._status,
+            team.activePokemonN, team.hasAvailablePokemon, team.reward, team.roundNumber, team.faintedFlag)
+
+
+# Writes a state returned by _teamState back into team
+def _restoreTeam(team, state):
+    p1, p2, p3 = team.roster
+    (p1.hp, p1.healthPercentage, status1,
+     p2.hp, p2.healthPercentage, status2,
+     p3.hp, p3.healthPercentage, status3,
+     activePokemonN, team.hasAvailablePokemon, team.reward, team.roundNumber, team.faintedFlag) = state
+    # Status is a matchup field; only assign it when it differs so cached matchup tables stay valid
+    if p1._status != status1:
+        p1.status = status1
+    if p2._status != status2:
+        p2.status = status2
+    if p3._status != status3:
+        p3.status = status3
+    team.activePokemon = team.roster[activePokemonN - 1]
+    team.activePokemonN = activePokemonN
+
+
+# Returns a token holding the current battle state of team1 and team2, see restore
+def snapshot(team1: Team, team2: Team):
+    return team1, team2, _teamState(team1), _teamState(team2)
+
+
+# Puts the teams of a token returned by snapshot back into the state they had when it was taken
+def restore(token):
+    team1, team2, state1, state2 = token
+    _restoreTeam(team1, state1)
+    _restoreTeam(team2, state2)
+
+
+def damageCalc(TeamAttacker, TeamDefender, move, rng=None):  # damage calculation function
     # do nothing if the move is 5 or 6 (a switch)
     if move == 5 or move == 6:
         return
 
+    # Pokemon2 is the defending pokemon
+    Pokemon2 = TeamDefender.activePokemon
+    # Everything deterministic about this hit comes from the matchup table
+    accuracy, isDamaging, damage = getMatchupTable(TeamAttacker, TeamDefender).entries[
+        TeamAttacker.activePokemonN - 1][move - 1][TeamDefender.activePokemonN - 1]
+
+    if rng is None:
+        rng = default_rng
+
     # accuracy check
-    accuracyGenerator = random.randint(1, 100)
-    if (Pokemon1.moves[(move - 1)].accuracy < accuracyGenerator):
+    accuracyGenerator = rng.accuracyRoll()
+    if accuracy < accuracyGenerator:
         return
 
-    # if Pokemon1 uses a damage dealing move
-    if (Pokemon1.moves[(move - 1)].physpc == "physical"
-            or Pokemon1.moves[(move - 1)].physpc == "special"):
-        # get the base power of the move
-        bp = Pokemon1.moves[(move - 1)].basePower
-
+    # if the attacker uses a damage dealing move
+    if isDamaging:
         # determine if it's a critical hit
-        criticalGenerator = random.randint(0, 15)
+        criticalGenerator = rng.criticalRoll()
         criticalMultiplier = 1.0
-        isCriticalHit = False  # For printing later
         if criticalGenerator == 15:
             criticalMultiplier = 1.5
-            isCriticalHit = True
 
         # determine the roll (high or low damage roll between .85 and 1.0)
-        roll = random.uniform(0.85, 1.0)
-
-        # determine if the move gets STAB (Same Type Attack Bonus) (happens if the move's type matches one of the Pokemon's type)
-        stab = 1.0
-        if (Pokemon1.moves[(move - 1)].moveType == Pokemon1.type1
-                or Pokemon1.moves[(move - 1)].moveType == Pokemon1.type2):
-            stab = 1.5
-
-        # determine the type effectiveness
-        if Pokemon2.type2 == None:  # If the defending pokemon only has one type
-            typeEffectiveness = damage_array[Pokemon1.moves[(
-                    move - 1)].moveType][Pokemon2.type1]
-        else:  # if the defending pokemon is dual type
-            typeEffectiveness = (damage_array[Pokemon1.moves[(
-                    move - 1)].moveType][Pokemon2.type1] * damage_array[Pokemon1.moves[(move - 1)].moveType][
-                                     Pokemon2.type2])
-
-        # Determine if the Attacker gets a damage reduction for being burned and using a physical move
-        burn = 1.0
-        if (Pokemon1.status == pokemon_conditions_dict["Burned"]
-                and Pokemon1.moves[(move - 1)].physpc == "physical"):
-            burn = 0.5
-
-        # Possibly implement later: damage boosts from items or abilities
-        other = 1.0
+        roll = rng.damageRoll()
 
-        # combine all previous variables into a single variable
-        modifier = criticalMultiplier * roll * stab * typeEffectiveness * burn * other
-
-        # determine final damage number
-        # if the move is physical
-        if Pokemon1.moves[(move - 1)].physpc == "physical":
-            damage = (((
-                               ((((2.0 * Pokemon1.level) / 5.0) + 2.0) * bp *
-                                (Pokemon1.attack / Pokemon2.defense)) / 50.0) + 2.0) * modifier)
-        # if the move is special
-        else:
-            damage = ((((
-                                (((2.0 * Pokemon1.level) / 5.0) + 2.0) * bp *
-                                (Pokemon1.spattack / Pokemon2.spdefense)) / 50.0) + 2.0) * modifier)
+        # apply the stochastic part of the modifier to the precomputed damage
+        damage = damage * criticalMultiplier * roll
 
         # apply damage
         Pokemon2.hp -= damage
@@ -594,7 +1270,7 @@ def damageCalc(TeamAttacker, TeamDefender, move):  # damage calculation function
         # Pokemon2.healthPercentage = (Pokemon2.hp / Pokemon2.maxHp) * 100
         Pokemon2.healthPercentage = math.ceil(
             ((Pokemon2.hp / Pokemon2.maxHp) * 100))
-    # Pokemon1 used a non-damaging move
+    # the attacker used a non-damaging move
     else:
         # temp -----------------------------------------------------
         damage = 100
@@ -614,8 +1290,22 @@ def damageCalc(TeamAttacker, TeamDefender, move):  # damage calculation function
     # damage = [( [ (([2*Pokemon1.level]/5)+2) *pokemon1.moves.basePower * (Pokemon1.attackOrSpecialAttack/Pokemon2.defenseOrSpecialDefense)] /50) +2] * Modifier
 
 
-# Generates a Team object for Team 1 and returns it
-def generate_team_1():
+# Species of a team, built once and shared by every Team created from it
+class TeamTemplate:
+    __slots__ = ('teamName', 'species')
+
+    def __init__(self, teamName, species1, species2, species3):
+        self.teamName = teamName
+        self.species = (species1, species2, species3)
+
+    # Creates a new Team in its starting state. Reuse it between games with Team.reset()
+    def build(self):
+        return Team(self.teamName, *[Pokemon.fromSpecies(species) for species in self.species])
+
+
+# Builds the moves and species of Team 1 once and returns its template
+@functools.lru_cache(maxsize=None)
+def team_1_template():
     # -------------------------creating moves---------------------------------------
     # pikachu moves
     Thunderbolt = Move(
@@ -797,11 +1487,17 @@ def generate_team_1():
         "Oblivious: does nothing useful, feel free to make up your own ability",
         "Halves damag taken from a supereffective grass type attack, single use",
     )
-    return Team("Team1", Pikachu, Snorlax, WishCash)
+    return TeamTemplate("Team1", Pikachu.species, Snorlax.species, WishCash.species)
 
 
-# Generates a Team object for Team 2 and returns it
-def generate_team_2():
+# Generates a Team object for Team 1 and returns it
+def generate_team_1():
+    return team_1_template().build()
+
+
+# Builds the moves and species of Team 2 once and returns its template
+@functools.lru_cache(maxsize=None)
+def team_2_template():
     # -------------------------creating moves---------------------------------------
     # Charizard Moves
     Flamethrower = Move(
@@ -930,23 +1626,30 @@ def generate_team_2():
         "Overgrow: when  under 1/3 health, your grass moves do 1.5 damage",
         "At the end of every turn, the user restores 1/16 of its maximum hp",
     )
-    return Team("Team2", Charizard, Blastoise, Venusaur)
+    return TeamTemplate("Team2", Charizard.species, Blastoise.species, Venusaur.species)
+
+
+# Generates a Team object for Team 2 and returns it
+def generate_team_2():
+    return team_2_template().build()
 
 # Returns the (n - 1) move that does the highest damage, from 0 to 3.
-def evaluator_highest_damage_action(team: Team):
+# Evaluator functions are called with the team to choose for and the opposing team, and return an action from
+# 0 to 5. This one picks the move with the highest base power times accuracy and ignores the opponent
+def evaluator_highest_damage_action(team: Team, opponent: Team = None):
     active = team.activePokemon
     best = 0
     highest_damage_move = active.moves[0].basePower \
                           * float(active.moves[0].accuracy) / 100.0
 
-    for i in range(1, 3):
+    for i in range(1, len(active.moves)):
         tmp = active.moves[i].basePower * float(active.moves[i].accuracy) / 100.0
 
         if tmp > highest_damage_move:
             highest_damage_move = tmp
             best = i
 
-    return i
+    return best
 
 
 # Pokemon simulation game when running pokemon.py
@@ -0,0 +1,155 @@
+# Low-overhead per-phase timing for the training loop
+# A PhaseTimer is told when an episode begins and when each phase of a turn ends. Every lap costs one
+# monotonic clock read and a list append, and a disabled timer returns immediately.
+#
+#     timer = PhaseTimer(['choose_actions', 'step'])
+#     timer.begin()
+#     ...choose actions...
+#     timer.lap('choose_actions')
+#     ...step...
+#     timer.lap('step')
+#     summary = timer.end_episode()
+#
+# Only the last window episodes and running totals are kept in memory, so a timer can stay on for long runs.
+# Given a csv_file, the timer appends one row per phase of every finished episode to it as the episode ends;
+# call close when done.
+
+import collections
+import csv
+import json
+import time
+
+import numpy as np
+
+
+class PhaseTimer:
+    def __init__(self, phases, enabled=True, window=100, csv_file=None):
+        self.phases = list(phases)
+        self.enabled = enabled
+        self.window = window  # Number of episodes covered by the rolling summary
+        self.last = 0  # Clock reading at the end of the previous lap, in nanoseconds
+        self.episode_start = 0
+        self.laps = {phase: [] for phase in self.phases}  # Lap durations of the current episode, in nanoseconds
+        self.counters = collections.Counter()  # Counters of the current episode
+        self.recent = collections.deque(maxlen=window)  # (laps, wall time) of the last window episodes
+        # Totals over every finished episode
+        self.episodes = 0
+        self.total_counts = {phase: 0 for phase in self.phases}
+        self.total_laps = {phase: 0 for phase in self.phases}  # Nanoseconds
+        self.total_wall = 0
+        self.total_counters = collections.Counter()
+        self.csv_file = csv_file
+        self.csv = None  # Open file and writer of csv_file, created when the first episode ends
+
+    # Starts timing an episode. Time until the first lap is charged to that lap's phase
+    def begin(self):
+        if not self.enabled:
+            return
+        self.last = self.episode_start = time.perf_counter_ns()
+
+    # Records the time since the previous lap (or begin) as one occurrence of phase
+    def lap(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        self.laps[phase].append(now - self.last)
+        self.last = now
+
+    # Adds n to a named counter of the current episode, such as the number of turns played
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        self.counters[name] += n
+
+    # Finishes the episode and returns its summary, see summarize. Returns None when disabled
+    def end_episode(self):
+        if not self.enabled:
+            return None
+        wall = time.perf_counter_ns() - self.episode_start
+        laps = {phase: np.array(durations, dtype=np.int64) for phase, durations in self.laps.items()}
+        summary = summarize(laps, wall)
+        summary['episode'] = self.episodes
+        summary['counters'] = dict(self.counters)
+        self.recent.append((laps, wall))
+
+        self.episodes += 1
+        for phase, durations in laps.items():
+            self.total_counts[phase] += int(durations.size)
+            self.total_laps[phase] += int(durations.sum())
+        self.total_wall += wall
+        self.total_counters.update(self.counters)
+        if self.csv_file is not None:
+            self._write_rows(summary)
+
+        self.laps = {phase: [] for phase in self.phases}
+        self.counters = collections.Counter()
+        return summary
+
+    # Returns the summary of the last window episodes taken together
+    def rolling_summary(self):
+        laps = {phase: np.concatenate([episode[phase] for episode, _ in self.recent] or [np.zeros(0, np.int64)])
+                for phase in self.phases}
+        return summarize(laps, sum(wall for _, wall in self.recent))
+
+    # Returns count, total, mean and share of every phase over all finished episodes
+    # Percentiles need every lap, so they are only part of the per-episode and rolling summaries
+    def total_summary(self):
+        phases = {}
+        for phase in self.phases:
+            count = self.total_counts[phase]
+            total = self.total_laps[phase]
+            phases[phase] = {
+                'count': count,
+                'total_ms': total / 1e6,
+                'mean_us': total / count / 1e3 if count else 0.0,
+                'share': total / self.total_wall if self.total_wall else 0.0,
+            }
+        return {'wall_ms': self.total_wall / 1e6, 'phases': phases, 'episodes': self.episodes,
+                'counters': dict(self.total_counters)}
+
+    # Writes the totals over every episode and the rolling summary to a JSON file
+    def export_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'phases': self.phases, 'total': self.total_summary(),
+                       'rolling': self.rolling_summary()}, f, indent=2)
+
+    # Appends the rows of one episode summary to csv_file, one per phase
+    def _write_rows(self, summary):
+        if self.csv is None:
+            f = open(self.csv_file, 'w', newline='')
+            writer = csv.writer(f)
+            writer.writerow(['episode', 'phase', 'count', 'total_ms', 'mean_us', 'p50_us', 'p99_us', 'share'])
+            self.csv = (f, writer)
+        writer = self.csv[1]
+        for phase in self.phases:
+            stats = summary['phases'][phase]
+            writer.writerow([summary['episode'], phase, stats['count'], stats['total_ms'], stats['mean_us'],
+                             stats['p50_us'], stats['p99_us'], stats['share']])
+
+    # Closes csv_file
+    def close(self):
+        if self.csv is not None:
+            self.csv[0].close()
+            self.csv = None
+
+
+# Returns the statistics of each phase's laps (nanoseconds) and their share of wall (nanoseconds)
+def summarize(laps, wall):
+    phases = {}
+    for phase, durations in laps.items():
+        total = int(durations.sum())
+        phases[phase] = {
+            'count': int(durations.size),
+            'total_ms': total / 1e6,
+            'mean_us': float(durations.mean()) / 1e3 if durations.size else 0.0,
+            'p50_us': float(np.percentile(durations, 50)) / 1e3 if durations.size else 0.0,
+            'p99_us': float(np.percentile(durations, 99)) / 1e3 if durations.size else 0.0,
+            'share': total / wall if wall else 0.0,
+        }
+    return {'wall_ms': wall / 1e6, 'phases': phases}
+
+
+# Returns a one line description of a summary, such as '[step 41% 12us] [learn 55% 480us]'
+def format_summary(summary):
+    return ' '.join('[%s %.0f%% %.0fus]' % (phase, stats['share'] * 100, stats['mean_us'])
+                    for phase, stats in summary['phases'].items())
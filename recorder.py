@@ -0,0 +1,314 @@
+# Binary battle recorder
+# A Recorder passed to pokemon.step or pokemon.fightSim keeps one fixed-width record per turn: the actions,
+# the accuracy, critical hit and damage rolls, every Pokemon's hp after the turn and its change, the rewards,
+# the active slots and the switch and faint events. Each finished game is appended to two files:
+#
+#     <path>.turns   records (record_dtype), one per turn, games one after another
+#     <path>.index   one entry (index_dtype) per game: its first record, number of turns, winner and
+#                    starting hp
+#
+# Both files are plain arrays, so BattleLog can jump to any turn of any game in O(1) through a memory map,
+# without simulating anything:
+#
+#     with Recorder('battles') as recorder:
+#         ...pokemon.step(team1, team2, action1, action2, recorder=recorder)...
+#     log = BattleLog('battles')
+#     log.episode(12)['hp']  # hp of the 6 Pokemon after every turn of game 12
+#
+# A game can also be played again turn by turn from its start with the recorded rolls:
+#
+#     rng = ReplayRNG(log.episode(12))
+#     for record in log.episode(12):
+#         pokemon.fightSim(team1, team2, *record['actions'].tolist(), rng)
+#
+# While a game is played the recorder keeps the actions, the hp, active slots, faint flags and rewards after
+# each turn and the positions of the BattleRNG; the rolls, first movers and events are worked out from them
+# with NumPy when a batch of games is written. A game starts when a turn begins at round 0 and ends when a team
+# has no Pokemon left. Each game must draw from one BattleRNG, and nothing else may draw from it between the
+# game's turns. Games are written in batches; call flush (or close) before reading a file that is still being
+# recorded.
+
+import numpy as np
+import pokemon
+
+# Bits of record['events']
+EVENT_SWITCH_1 = 1  # Team 1 switched Pokemon with action 5 or 6
+EVENT_SWITCH_2 = 2
+EVENT_FAINT_1 = 4  # Team 1's active Pokemon fainted and was replaced automatically
+EVENT_FAINT_2 = 8
+
+# One turn. The rolls are the numbers the turn drew from its BattleRNG, in the order they were drawn: the
+# team that moved first draws before the other, and a team draws nothing when it switches. A miss or a
+# non-damaging move draws no critical hit and damage roll, so the second critical and damage roll may belong
+# to either team. Unused entries are 0 (accuracy, roll) or -1 (critical). ReplayRNG feeds them back to fightSim
+# Pokemon values are ordered Team 1 slots 1 to 3, then Team 2 slots 1 to 3. Rewards are the unclamped
+# Team.reward values; pokemon.step clamps them to [-1, 1]
+record_dtype = np.dtype([
+    ('round', '<u2'),  # Round number the turn was played in, starting at 0
+    ('actions', 'u1', 2),  # Actions of Team 1 and 2, 1 to 6
+    ('first', 'u1'),  # Team whose Pokemon moved first, 1 or 2
+    ('events', 'u1'),  # EVENT_ bits
+    ('active', 'u1', 2),  # Active slot of each team after the turn, 1 to 3
+    ('accuracy', 'u1', 2),  # Accuracy rolls, 1 to 100
+    ('critical', 'i1', 2),  # Critical hit rolls, 0 to 15
+    ('roll', '<f8', 2),  # Damage rolls, 0.85 to 1.0
+    ('hp', '<f4', 6),  # hp after the turn
+    ('hpDelta', '<f4', 6),  # Change of hp during the turn
+    ('reward', '<f4', 2),
+])
+
+# One game. winner is 1 or 2, or 0 for a draw
+index_dtype = np.dtype([
+    ('start', '<i8'),  # Position of the first record in the .turns file
+    ('turns', '<u2'),
+    ('winner', 'u1'),
+    ('startHp', '<f4', 6),
+])
+
+
+# Returns the rolls consecutive games drew from one BattleRNG stream, as pieces of its blocks. startBlocks and
+# startIndexes are the stream's block and index when each game started, endBlocks and endIndexes when it ended.
+# A game draws fewer numbers per stream than a block holds (pokemon.max_round), so at most one new block was
+# drawn during it. Games that start where the previous one ended share a piece
+def _streamRolls(startBlocks, startIndexes, endBlocks, endIndexes):
+    games = len(startBlocks)
+    startIds = np.fromiter(map(id, startBlocks), dtype=np.uintp, count=games)
+    endIds = np.fromiter(map(id, endBlocks), dtype=np.uintp, count=games)
+    startIndexes = np.array(startIndexes)
+    endIndexes = np.array(endIndexes)
+    crossed = startIds != endIds
+    firsts = np.flatnonzero(np.concatenate(([True], (startIds[1:] != endIds[:-1]) |
+                                            (startIndexes[1:] != endIndexes[:-1]))))
+    lasts = np.append(firsts[1:], games) - 1
+    crossings = np.flatnonzero(crossed).tolist()
+    pieces = []
+    crossing = 0
+    for first, last in zip(firsts.tolist(), lasts.tolist()):
+        block = startBlocks[first]
+        index = int(startIndexes[first])
+        while crossing < len(crossings) and crossings[crossing] <= last:
+            pieces.append(block[index:])
+            block = endBlocks[crossings[crossing]]
+            index = 0
+            crossing += 1
+        pieces.append(block[index:int(endIndexes[last])])
+    return pieces
+
+
+# BattleRNG that hands out the rolls of recorded turns again, so fightSim plays them exactly as they were
+# played. records are consecutive records of a BattleLog, such as an episode
+class ReplayRNG:
+    def __init__(self, records):
+        self.accuracyRolls = iter([int(v) for v in np.ravel(records['accuracy']) if v != 0])
+        self.criticalRolls = iter([int(v) for v in np.ravel(records['critical']) if v != -1])
+        self.damageRolls = iter([float(v) for v in np.ravel(records['roll']) if v != 0])
+
+    def accuracyRoll(self):
+        return next(self.accuracyRolls)
+
+    def criticalRoll(self):
+        return next(self.criticalRolls)
+
+    def damageRoll(self):
+        return next(self.damageRolls)
+
+
+# Returns the slot (1 to 3) each team switches to in each turn, or 0 where it does not switch, the way
+# pokemon.switchTarget finds it: the first other Pokemon able to battle from slot 1 for action 5, from slot 3 for
+# action 6. hp holds the team's 3 hp values before each turn, active its active slot and actions its actions
+def _switchTargets(hp, active, actions):
+    able = hp > 0
+    able[np.arange(len(able)), active - 1] = False
+    target = np.where(actions == 5, np.argmax(able, axis=1) + 1, 3 - np.argmax(able[:, ::-1], axis=1))
+    return np.where((actions >= 5) & able.any(axis=1), target, 0)
+
+
+# Records every turn played with it and appends the finished games to <path>.turns and <path>.index
+# A turn costs two method calls, two list appends and one tuple of what the turn left behind; the records are
+# worked out from those tuples with NumPy once per batch of about flush_turns turns
+class Recorder:
+    def __init__(self, path, flush_turns=4096):
+        self.path = path
+        self.flush_turns = flush_turns
+        self.turnsFile = open(path + '.turns', 'ab')
+        self.indexFile = open(path + '.index', 'ab')
+        # Records in the .turns file, including the finished games not written yet
+        self.position = self.turnsFile.tell() // record_dtype.itemsize
+        self.actions = []  # Actions of the games not written yet, Team 1 and 2 of every turn
+        self.turns = []  # Turn tuples of the games not written yet, see endTurn
+        # Finished games not written yet: their head, rng stream positions at the end, end in self.turns and winner
+        self.games = []
+        self.gameStart = 0  # Position in self.turns where the game being played starts
+        self.rng = None  # BattleRNG of the game being played, None between games
+        # Starting hp, active slots and round, speeds and rng stream positions of the game being played
+        self.head = None
+
+    # Called by fightSim before the turn with the BattleRNG the turn draws from
+    def beginTurn(self, Team1, Team2, team1Action, team2Action, rng):
+        if Team1.roundNumber == 0 or rng is not self.rng:
+            self._beginGame(Team1, Team2, rng)
+        self.actions.append(team1Action)
+        self.actions.append(team2Action)
+
+    # Called by fightSim after the turn
+    def endTurn(self, Team1, Team2):
+        p1, p2, p3 = Team1.roster
+        q1, q2, q3 = Team2.roster
+        rng = self.rng
+        self.turns.append((p1.hp, p2.hp, p3.hp, q1.hp, q2.hp, q3.hp, Team1.activePokemonN, Team2.activePokemonN,
+                           Team1.faintedFlag, Team2.faintedFlag, Team1.reward, Team2.reward,
+                           rng.accuracyIndex, rng.criticalIndex, rng.damageIndex))
+        if not Team1.hasAvailablePokemon or not Team2.hasAvailablePokemon:
+            value = (sum(p.healthPercentage for p in Team1.roster) - sum(p.healthPercentage for p in Team2.roster)
+                     if Team1.hasAvailablePokemon == Team2.hasAvailablePokemon else
+                     1 if Team1.hasAvailablePokemon else -1)
+            self._endGame(1 if value > 0 else 2 if value < 0 else 0)
+
+    # Notes what a game starts with
+    def _beginGame(self, Team1, Team2, rng):
+        # A game abandoned before it ended is kept as a draw, without a turn that never ended
+        del self.actions[2 * len(self.turns):]
+        if len(self.turns) > self.gameStart:
+            self._endGame(0)
+        p1, p2, p3 = Team1.roster
+        q1, q2, q3 = Team2.roster
+        self.rng = rng
+        self.head = ((p1.hp, p2.hp, p3.hp, q1.hp, q2.hp, q3.hp), Team1.activePokemonN, Team2.activePokemonN,
+                     Team1.roundNumber, (p1.speed, p2.speed, p3.speed, q1.speed, q2.speed, q3.speed), rng.blockSize,
+                     rng.accuracyBlock, rng.accuracyIndex, rng.criticalBlock, rng.criticalIndex, rng.damageBlock,
+                     rng.damageIndex)
+
+    # Closes the game being played with winner and writes the batch if it is full
+    # Only references are kept here; the rolls are cut out of the rng blocks when the batch is written
+    def _endGame(self, winner):
+        rng = self.rng
+        self.gameStart = len(self.turns)
+        self.games.append((*self.head, rng.accuracyBlock, rng.accuracyIndex, rng.criticalBlock, rng.criticalIndex,
+                           rng.damageBlock, rng.damageIndex, self.gameStart, winner))
+        self.rng = None
+        if self.gameStart >= self.flush_turns:
+            self._write()
+
+    # Converts the turns of the finished games to records and appends them and their index entries to the files
+    def _write(self):
+        if not self.games:
+            return
+        startHp, active1, active2, rounds, speeds, blockSizes, *marks, ends, winners = zip(*self.games)
+        ends = np.array(ends, dtype=np.int64)
+        turns = np.diff(ends, prepend=0)
+        firsts = ends - turns
+        count = int(ends[-1])
+        rows = np.array(self.turns[:count], dtype=np.float64)
+        actions = np.array(self.actions[:2 * count], dtype=np.int64).reshape(count, 2)
+        game = np.repeat(np.arange(len(ends)), turns)
+        turn = np.arange(count)
+
+        records = np.zeros(count, dtype=record_dtype)
+        records['round'] = np.array(rounds)[game] + turn - firsts[game]
+        records['actions'] = actions
+        records['active'] = rows[:, 6:8]
+        records['hp'] = rows[:, :6]
+        records['reward'] = rows[:, 10:12]
+        # hp and active slots before each turn are those after the previous one, or the game's starting ones on
+        # its first turn
+        hp = np.empty_like(rows[:, :6])
+        hp[1:] = rows[:-1, :6]
+        hp[firsts] = startHp
+        records['hpDelta'] = rows[:, :6] - hp
+        active = np.empty((count, 2), dtype=np.int64)
+        active[1:] = rows[:-1, 6:8]
+        active[firsts, 0] = active1
+        active[firsts, 1] = active2
+
+        # Who switches and who moves first, the same way fightSim worked it out
+        events = np.where(rows[:, 8] != 0, EVENT_FAINT_1, 0) | np.where(rows[:, 9] != 0, EVENT_FAINT_2, 0)
+        speeds = np.array(speeds)[game]
+        moving = []
+        for team, event in enumerate((EVENT_SWITCH_1, EVENT_SWITCH_2)):
+            target = _switchTargets(hp[:, 3 * team:3 * team + 3], active[:, team], actions[:, team])
+            events |= np.where(target > 0, event, 0)
+            moving.append(speeds[turn, 3 * team + np.where(target > 0, target, active[:, team]) - 1])
+        records['first'] = np.where(moving[0] >= moving[1], 1, 2)
+        records['events'] = events
+
+        # A turn draws at most 2 numbers from each stream, so the stream positions after each turn tell how many
+        # it drew, even across a new block
+        positions = rows[:, 12:15].astype(np.int64)
+        previous = np.empty_like(positions)
+        previous[1:] = positions[:-1]
+        previous[firsts] = np.array(marks[1:6:2]).T
+        drawn = (positions - previous) % np.array(blockSizes)[game, None]
+        for stream, (field, unused) in enumerate((('accuracy', 0), ('critical', -1), ('roll', 0))):
+            rolls = np.concatenate(_streamRolls(marks[2 * stream], marks[2 * stream + 1],
+                                                marks[6 + 2 * stream], marks[7 + 2 * stream]))
+            counts = drawn[:, stream]
+            offsets = np.cumsum(counts) - counts
+            values = np.full((count, 2), unused, dtype=np.float64)
+            for k in range(2):
+                hit = counts > k
+                values[hit, k] = rolls[offsets[hit] + k]
+            records[field] = values
+
+        index = np.zeros(len(ends), dtype=index_dtype)
+        index['start'] = self.position + firsts
+        index['turns'] = turns
+        index['winner'] = winners
+        index['startHp'] = startHp
+        self.position += count
+
+        self.turnsFile.write(records.tobytes())
+        self.indexFile.write(index.tobytes())
+        del self.turns[:count]
+        del self.actions[:2 * count]
+        self.games = []
+        self.gameStart = 0
+
+    # Writes the finished games to disk
+    def flush(self):
+        self._write()
+        self.turnsFile.flush()
+        self.indexFile.flush()
+
+    # Keeps a game still in progress as a draw, writes everything and closes the files
+    def close(self):
+        del self.actions[2 * len(self.turns):]
+        if len(self.turns) > self.gameStart:
+            self._endGame(0)
+        self._write()
+        self.turnsFile.close()
+        self.indexFile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Read access to the files written by a Recorder. Nothing is read until it is asked for
+class BattleLog:
+    def __init__(self, path):
+        self.index = np.fromfile(path + '.index', dtype=index_dtype)
+        self.turns = np.memmap(path + '.turns', dtype=record_dtype, mode='r') if len(self.index) else \
+            np.zeros(0, dtype=record_dtype)
+
+    # Number of games
+    def __len__(self):
+        return len(self.index)
+
+    # Records of every turn of game i
+    def episode(self, i):
+        start = self.index['start'][i]
+        return self.turns[start:start + self.index['turns'][i]]
+
+    # Record of turn t (0 based) of game i
+    def turn(self, i, t):
+        if not 0 <= t < self.index['turns'][i]:
+            raise IndexError('Game %i has %i turns, not %i' % (i, self.index['turns'][i], t + 1))
+        return self.turns[self.index['start'][i] + t]
+
+    # hp of the 6 Pokemon after turn t of game i, or at the start of the game if t is -1
+    def hp(self, i, t=-1):
+        if t < 0:
+            return np.array(self.index['startHp'][i])
+        return np.array(self.turn(i, t)['hp'])
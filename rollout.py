@@ -0,0 +1,211 @@
+# Monte Carlo rollout evaluator
+# Estimates the value of each of the 6 actions by playing many games to the end from the current battle
+# state, and picks the action with the best average outcome. Playouts are spread over a process pool and
+# stop at a per-decision time budget or rollout count, so the cost of a decision is predictable.
+#
+# A RolloutEvaluator is called like any evaluator function, with the team to choose for and the opposing
+# team, and returns an action from 0 to 5:
+#
+#     evaluator = RolloutEvaluator(n_workers=4, time_budget=0.02)
+#     action = evaluator(team, opponent)
+#     evaluator.close()
+#
+# The teams are never modified; playouts run on copies inside the workers (or are restored afterwards
+# when running in-process).
+
+import multiprocessing as mp
+import pickle
+import random
+import time
+import numpy as np
+import pokemon
+
+
+# ---------- Playout policies ----------
+# A playout policy is called with (team, opponent, rnd), rnd being a random.Random, and returns an action
+# from 1 to 6 using fightSim's numbering
+
+# Picks any of the legal actions uniformly, see pokemon.randomLegalAction
+def randomPolicy(team, opponent, rnd):
+    return pokemon.randomLegalAction(team, rnd)
+
+
+# Picks the move with the highest expected damage against the opponent's active Pokemon, taking types,
+# stats and accuracy into account. Never switches
+def greedyPolicy(team, opponent, rnd):
+    moves = pokemon.getMatchupTable(team, opponent).entries[team.activePokemonN - 1]
+    defender = opponent.activePokemonN - 1
+    best = 1
+    bestDamage = -1.0
+    for m in range(len(moves)):
+        accuracy, isDamaging, damage = moves[m][defender]
+        expected = accuracy * damage if isDamaging else 0.0
+        if expected > bestDamage:
+            bestDamage = expected
+            best = m + 1
+    return best
+
+
+# Picks the greedy move most of the time and a random legal action otherwise, so playouts stay varied
+def mixedPolicy(team, opponent, rnd, explore=0.3):
+    if rnd.random() < explore:
+        return pokemon.randomLegalAction(team, rnd)
+    return greedyPolicy(team, opponent, rnd)
+
+
+playout_policies = {'random': randomPolicy, 'greedy': greedyPolicy, 'mixed': mixedPolicy}
+
+
+# ---------- Playouts ----------
+
+# Plays the game out from the current state, team starting with action (1 to 6), and returns its value
+# for team, see gameValue. Games that hit max_round, or max_turns when given, are scored by remaining health
+# seat is the seat of team in the real game (see pokemon.seatOf), so speed ties are settled the same way
+def playout(team, opponent, action, policy, rnd, rng, max_turns=None, seat=1):
+    pokemon.seatedFightSim(team, opponent, action, policy(opponent, team, rnd), seat, rng)
+    turns = 1
+    while team.hasAvailablePokemon and opponent.hasAvailablePokemon and (max_turns is None or turns < max_turns):
+        pokemon.seatedFightSim(team, opponent, policy(team, opponent, rnd), policy(opponent, team, rnd), seat, rng)
+        turns += 1
+    return gameValue(team, opponent)
+
+
+# Returns the value of the current state for team: 1 if it won, -1 if it lost, otherwise the difference
+# in summed health percentages scaled to [-1, 1]
+def gameValue(team, opponent):
+    if team.hasAvailablePokemon and not opponent.hasAvailablePokemon:
+        return 1.0
+    if opponent.hasAvailablePokemon and not team.hasAvailablePokemon:
+        return -1.0
+    teamHealth = sum(p.healthPercentage for p in team.roster)
+    opponentHealth = sum(p.healthPercentage for p in opponent.roster)
+    return max(-1.0, min(1.0, (teamHealth - opponentHealth) / 300.0))
+
+
+# Runs playouts from the state saved in token, cycling through actions starting at actions[first]
+# Stops after n_rollouts playouts or time_budget seconds, whichever comes first (None for no limit)
+# Returns the summed values and the number of playouts of each of the 6 actions
+def runRollouts(token, actions, first, n_rollouts, time_budget, policy, seed, max_turns, seat=1):
+    team, opponent = token[0], token[1]
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    rnd = random.Random(int(seed.generate_state(1)[0]))
+    rng = pokemon.BattleRNG(seed)
+    sums = [0.0] * 6
+    counts = [0] * 6
+    i = 0
+    while (n_rollouts is None or i < n_rollouts) and (deadline is None or time.perf_counter() < deadline):
+        action = actions[(first + i) % len(actions)]
+        value = playout(team, opponent, action, policy, rnd, rng, max_turns, seat)
+        pokemon.restore(token)
+        sums[action - 1] += value
+        counts[action - 1] += 1
+        i += 1
+    return sums, counts
+
+
+# Teams unpickled by a worker process, keyed by RolloutEvaluator.teamsKey
+_worker_teams = {}
+
+
+# Entry point of a pool task: restores the state into the worker's copy of the teams and runs playouts
+def _rolloutTask(key, teamsData, state1, state2, actions, first, n_rollouts, time_budget, policy, seed, max_turns,
+                 seat):
+    teams = _worker_teams.get(key)
+    if teams is None:
+        # Only the last few rosters are kept; a new one usually means a new game or opponent
+        if len(_worker_teams) >= 8:
+            _worker_teams.clear()
+        teams = _worker_teams[key] = pickle.loads(teamsData)
+    token = (teams[0], teams[1], state1, state2)
+    pokemon.restore(token)
+    return runRollouts(token, actions, first, n_rollouts, time_budget, playout_policies[policy], seed, max_turns,
+                       seat)
+
+
+# Evaluator function that chooses by Monte Carlo playouts
+# n_workers   = Number of worker processes. 0 runs every playout in the calling process
+# time_budget = Seconds spent per decision, None for no time limit
+# rollouts    = Total playouts per decision, None for no limit. At least one of the two budgets must be set
+# policy      = Playout policy for both teams after the first action: 'random', 'greedy' or 'mixed'
+# max_turns   = Turns after which a playout is scored by remaining health, None plays to the end of the game
+# actions     = Actions (1 to 6) that are considered; only the ones legal at a decision are played out
+# seed        = Seed of the playouts (an int or numpy SeedSequence), None for a random seed
+class RolloutEvaluator:
+    def __init__(self, n_workers=0, time_budget=0.05, rollouts=None, policy='mixed', max_turns=None,
+                 actions=(1, 2, 3, 4, 5, 6), seed=None):
+        if time_budget is None and rollouts is None:
+            raise ValueError('RolloutEvaluator needs a time_budget or a number of rollouts')
+        if policy not in playout_policies:
+            raise ValueError('Unknown playout policy \'%s\'' % policy)
+        self.n_workers = n_workers
+        self.time_budget = time_budget
+        self.rollouts = rollouts
+        self.policy = policy
+        self.max_turns = max_turns
+        self.actions = tuple(actions)
+        self.seed = np.random.SeedSequence(seed)
+        self.pool = None
+        # Last teams sent to the workers with their roster versions, and the key and pickled copy sent
+        self.teams = None
+        self.teamsKey = 0
+        self.teamsData = None
+        self.values = np.zeros(6)  # Mean playout value of each action at the last decision
+        self.counts = np.zeros(6, dtype=np.int64)  # Number of playouts of each action at the last decision
+
+    # Returns the 0 based action with the best mean playout value for team
+    def __call__(self, team, opponent=None):
+        if opponent is None:
+            raise ValueError('RolloutEvaluator needs the opposing team')
+
+        # Illegal actions do nothing, so playing them out only spends the budget
+        legal = pokemon.teamLegalActions(team)
+        actions = tuple(a for a in self.actions if legal[a - 1]) or self.actions
+        seat = pokemon.seatOf(team, opponent)
+        token = pokemon.snapshot(team, opponent)
+        n_tasks = max(1, self.n_workers)
+        seeds = self.seed.spawn(n_tasks)
+        rollouts = [None] * n_tasks if self.rollouts is None else \
+            [self.rollouts // n_tasks + (1 if i < self.rollouts % n_tasks else 0) for i in range(n_tasks)]
+        # Workers start at different actions so a short budget does not favor the first ones
+        firsts = [i * len(actions) // n_tasks for i in range(n_tasks)]
+
+        if self.n_workers == 0:
+            results = [runRollouts(token, actions, firsts[0], rollouts[0], self.time_budget,
+                                   playout_policies[self.policy], seeds[0], self.max_turns, seat)]
+        else:
+            if self.pool is None:
+                self.pool = mp.Pool(self.n_workers)
+            key, data = self._teamsData(team, opponent)
+            tasks = [self.pool.apply_async(_rolloutTask, (key, data, token[2], token[3], actions, firsts[i],
+                                                          rollouts[i], self.time_budget, self.policy, seeds[i],
+                                                          self.max_turns, seat))
+                     for i in range(n_tasks)]
+            results = [task.get() for task in tasks]
+
+        sums = np.sum([result[0] for result in results], axis=0)
+        self.counts = np.sum([result[1] for result in results], axis=0)
+        self.values = np.where(self.counts > 0, sums / np.maximum(self.counts, 1), -np.inf)
+        return int(np.argmax(self.values))
+
+    # Returns the key and pickled copy of the teams for the workers, pickling them again only when the
+    # rosters change (another pair of teams, or a stat, type, move or status of either)
+    def _teamsData(self, team, opponent):
+        teams = (team, opponent, pokemon.rosterVersion(team), pokemon.rosterVersion(opponent))
+        if (self.teams is None or self.teams[0] is not team or self.teams[1] is not opponent
+                or self.teams[2:] != teams[2:]):
+            self.teams = teams
+            self.teamsKey += 1
+            self.teamsData = pickle.dumps((team, opponent))
+        return self.teamsKey, self.teamsData
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
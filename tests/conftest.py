@@ -0,0 +1,42 @@
+# The modules under test live at the top of the repository, next to this directory
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pokemon  # noqa: E402
+
+
+# Plays n_games seeded random games of legal actions with one pair of teams, reset between games
+# check(team1, team2), if given, is called before the first turn and after every turn. rng_factory(game)
+# returns the BattleRNG of a game (default_rng without one) and recorder is passed on to step. With hurt, every
+# third game starts with a hurt Pokemon instead of right after a reset. Returns the hp of the 6 Pokemon at the
+# end of each game
+def playGames(check=None, n_games=30, seed=3, rng_factory=None, recorder=None, hurt=False):
+    rnd = random.Random(seed)
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    hp = []
+    for game in range(n_games):
+        team1.reset()
+        team2.reset()
+        if hurt and game % 3 == 2:
+            team1.Pokemon2.hp -= 50
+        rng = rng_factory(game) if rng_factory is not None else None
+        if check is not None:
+            check(team1, team2)
+        done = False
+        while not done:
+            _, _, done = pokemon.step(team1, team2, pokemon.randomLegalAction(team1, rnd),
+                                      pokemon.randomLegalAction(team2, rnd), rng=rng, recorder=recorder)
+            if check is not None:
+                check(team1, team2)
+        hp.append([p.hp for p in team1.roster + team2.roster])
+    return hp
+
+
+@pytest.fixture
+def play_games():
+    return playGames
@@ -0,0 +1,87 @@
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+import actor_learner
+import pokemon
+
+
+# Pushes transitions numbered first to first + n - 1 (the number is the action and every state value)
+def pushNumbered(ring, first, n, stop=None):
+    results = []
+    for k in range(first, first + n):
+        state = np.full(ring.state_size, k, dtype=np.float32)
+        results.append(ring.push(state, k, float(k), state, False, np.ones(6, dtype=bool), stop))
+    return results
+
+
+def test_drain_returns_transitions_in_order():
+    ring = actor_learner.TransitionRing(8, 3)
+    assert ring.drain() is None
+    pushNumbered(ring, 0, 5)
+    states, actions, rewards, new_states, dones, masks = ring.drain()
+    assert actions.tolist() == [0, 1, 2, 3, 4]
+    np.testing.assert_array_equal(states[:, 0], rewards)
+    assert ring.drain() is None
+    pushNumbered(ring, 5, 6)
+    assert ring.drain()[1].tolist() == list(range(5, 11))
+    assert ring.dropped.value == 0
+
+
+# A full overwriting ring keeps the newest capacity transitions and counts the rest as dropped
+def test_overwrite_keeps_the_newest():
+    ring = actor_learner.TransitionRing(8, 3, 'overwrite')
+    assert all(pushNumbered(ring, 0, 20))
+    states, actions = ring.drain()[:2]
+    # The oldest transition left may be the one an actor is writing over right now, so it is skipped too
+    assert actions.tolist() == list(range(13, 20))
+    np.testing.assert_array_equal(states[:, 0], actions)
+    assert ring.dropped.value == 13
+
+
+def test_drop_keeps_the_oldest():
+    ring = actor_learner.TransitionRing(8, 3, 'drop')
+    assert all(pushNumbered(ring, 0, 20))
+    assert ring.drain()[1].tolist() == list(range(8))
+    assert ring.dropped.value == 12
+
+
+# A blocking ring makes the actor wait, until stop is set
+def test_block_waits_for_room():
+    ring = actor_learner.TransitionRing(4, 3, 'block')
+    stop = mp.RawValue('b', 1)
+    assert pushNumbered(ring, 0, 5, stop) == [True, True, True, True, False]
+    assert ring.drain()[1].tolist() == [0, 1, 2, 3]
+    assert ring.dropped.value == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        actor_learner.TransitionRing(4, 3, 'wait')
+
+
+# Actors keep playing while nobody drains their overwriting rings, and what is drained is whole transitions
+def test_actors_do_not_wait_for_the_learner():
+    rng = np.random.default_rng(0)
+    layers = [rng.normal(size=(pokemon.state_size, 16)), np.zeros(16), rng.normal(size=(16, 6)), np.zeros(6)]
+    weights = actor_learner.SharedWeights([w.shape for w in layers])
+    weights.publish(layers, 0.5)
+    processes, rings, stop, stats = actor_learner.start_actors(
+        2, weights, pokemon.generate_team_1, pokemon.generate_team_2, None, ring_capacity=64, seed=1)
+    try:
+        while stats.totals()[0] < 30:
+            actor_learner.check_actors(processes)
+    finally:
+        stop.value = 1
+        for process in processes:
+            process.join()
+    for ring in rings:
+        assert ring.written.value > ring.capacity
+        states, actions, rewards, new_states, dones, masks = ring.drain()
+        assert len(actions) == ring.capacity - 1
+        assert ring.dropped.value == ring.written.value - len(actions)
+        # Each transition starts where the previous one ended, unless that one ended its game
+        running = ~dones[:-1]
+        np.testing.assert_array_equal(new_states[:-1][running], states[1:][running])
+        assert (masks.any(axis=1) | dones).all()
@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+
+import batch_battle
+import pokemon
+
+
+# Stands in for the NumPy Generator of a BatchBattle of one game
+# rolls holds one (accuracy, critical, damage) triple per attack of the turn, in the order the attacks happen
+class BatchRolls:
+    def __init__(self):
+        self.accuracy = []
+        self.critical = []
+        self.damage = []
+
+    def setTurn(self, rolls):
+        self.accuracy = [accuracy for accuracy, _, _ in rolls]
+        self.critical = [critical for _, critical, _ in rolls]
+        self.damage = [damage for _, _, damage in rolls]
+
+    def integers(self, low, high, size):
+        values = self.accuracy if low == 1 else self.critical
+        return np.array([values.pop(0) for _ in range(size)])
+
+    def uniform(self, low, high, size):
+        return np.array([self.damage.pop(0) for _ in range(size)])
+
+
+# BattleRNG handing fightSim the same triples. fightSim skips the critical hit and damage roll of a miss or a
+# non-damaging move while BatchBattle always draws them, so every attack reads its own triple
+class GameRolls:
+    def __init__(self, rolls):
+        self.rolls = rolls
+        self.attack = -1
+
+    def accuracyRoll(self):
+        self.attack += 1
+        return self.rolls[self.attack][0]
+
+    def criticalRoll(self):
+        return self.rolls[self.attack][1]
+
+    def damageRoll(self):
+        return self.rolls[self.attack][2]
+
+
+# With the same rolls, BatchBattle and fightSim play every turn to the same observation, rewards and end
+def test_batch_battle_matches_fight_sim():
+    rnd = random.Random(7)
+    for game in range(200):
+        battle = batch_battle.BatchBattle(1)
+        battle.rng = BatchRolls()
+        team1 = pokemon.generate_team_1()
+        team2 = pokemon.generate_team_2()
+        done = False
+        while not done:
+            action1 = rnd.randint(1, 6)
+            action2 = rnd.randint(1, 6)
+            rolls = [(rnd.randint(1, 100), rnd.randint(0, 15), rnd.uniform(0.85, 1.0))
+                     for _ in range(2)]
+            battle.rng.setTurn(rolls)
+            observation, rewards, done = pokemon.step(team1, team2, action1, action2, rng=GameRolls(rolls))
+            batchObservation, batchRewards, batchDone = battle.step([action1], [action2])
+
+            np.testing.assert_allclose(batchObservation[0], observation, rtol=1e-6)
+            np.testing.assert_allclose(batchRewards[0], rewards, rtol=1e-6, atol=1e-9)
+            assert batchDone[0] == done
+
+
+# The observations of a fresh batch are those of getState for fresh teams
+def test_batch_battle_starts_like_get_state():
+    battle = batch_battle.BatchBattle(4, seed=1)
+    expected = pokemon.getState(pokemon.generate_team_1(), pokemon.generate_team_2())
+    np.testing.assert_allclose(battle.getState(), np.tile(expected, (4, 1)))
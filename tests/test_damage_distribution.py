@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import pokemon
+
+
+# Damage dealt by n_hits calls of damageCalc with move, each from the same starting state
+def sampleDamage(attacker, defender, move, n_hits, seed):
+    rng = pokemon.BattleRNG(seed)
+    token = pokemon.snapshot(attacker, defender)
+    hp = defender.activePokemon.hp
+    damage = np.empty(n_hits)
+    for i in range(n_hits):
+        pokemon.damageCalc(attacker, defender, move, rng)
+        damage[i] = hp - defender.activePokemon.hp
+        pokemon.restore(token)
+    return damage
+
+
+# Every move of the Pokemon in slot n of Team 1 against slot n of Team 2 agrees with what damageCalc deals
+@pytest.mark.parametrize('slot', [1, 2, 3])
+@pytest.mark.parametrize('move', [1, 2, 3, 4])
+def test_distribution_matches_damage_calc(slot, move):
+    attacker = pokemon.generate_team_1()
+    defender = pokemon.generate_team_2()
+    for team in (attacker, defender):
+        team.activePokemonN = slot
+        team.activePokemon = team.roster[slot - 1]
+    distribution = pokemon.getDamageDistribution(attacker, defender, move)
+    damage = sampleDamage(attacker, defender, move, 40000, seed=10 * slot + move)
+
+    assert distribution.mean() == pytest.approx(damage.mean(), rel=0.02, abs=0.5)
+    for hp in np.quantile(damage, [0.2, 0.5, 0.8]).tolist() + [defender.activePokemon.hp]:
+        assert distribution.koProbability(hp) == pytest.approx((damage >= hp).mean(), abs=0.015)
+        assert distribution.cdf(hp) == pytest.approx((damage <= hp).mean(), abs=0.015)
+    # Away from a miss's probability mass at 0, where any value of the jump is a valid quantile
+    for q in (0.3, 0.5, 0.7):
+        assert distribution.quantile(q) == pytest.approx(np.quantile(damage, q), rel=0.02, abs=0.5)
+
+
+# koProbability over two hits against the sum of two independent hits, for misses, crits and placeholders
+@pytest.mark.parametrize('accuracy, isDamaging, damage', [(100, True, 120.0), (70, True, 300.0),
+                                                           (90, False, 0.0), (101, True, 50.0)])
+def test_two_hit_ko_probability_matches_monte_carlo(accuracy, isDamaging, damage):
+    distribution = pokemon.DamageDistribution(accuracy, isDamaging, damage)
+    rng = np.random.default_rng(0)
+    n = 200000
+
+    def hits():
+        hit = accuracy >= rng.integers(1, 101, n)
+        critical = np.where(rng.integers(0, 16, n) == 15, 1.5, 1.0)
+        dealt = damage * critical * rng.uniform(0.85, 1.0, n) if isDamaging else np.full(n, 100.0)
+        return np.where(hit, dealt, 0.0)
+
+    first = hits()
+    second = hits()
+    assert distribution.mean() == pytest.approx(first.mean(), rel=0.01)
+    for hp in (50.0, 110.0, 200.0, 350.0):
+        assert distribution.koProbability(hp) == pytest.approx((first >= hp).mean(), abs=0.006)
+        assert distribution.koProbability(hp, 2) == pytest.approx((first + second >= hp).mean(), abs=0.006)
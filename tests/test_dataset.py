@@ -0,0 +1,55 @@
+import json
+import os
+
+import numpy as np
+
+import dataset
+import pokemon
+
+
+# The rows of array name a shard directory holds
+def shardArrays(directory, name):
+    count = int(np.load(os.path.join(directory, 'meta.npy'))[0])
+    return np.load(os.path.join(directory, name + '.npy'))[:count]
+
+
+# Every transition written to the shards comes back from ShardedDataset in dataset order, and every shard ends
+# with the end of a game
+def test_shards_round_trip(tmp_path):
+    directory = str(tmp_path / 'dataset')
+    summary = dataset.generate_dataset(directory, 2, shard_size=250, n_workers=0, root_seed=1)
+    data = dataset.ShardedDataset(directory, rng=np.random.default_rng(0))
+    assert len(data) == summary['transitions'] <= 2 * 250
+    with open(os.path.join(directory, 'dataset.json')) as f:
+        assert summary == json.load(f)
+
+    states, actions, rewards, new_states, doneflags, next_masks = data.gather(np.arange(len(data))[::-1])
+    shards = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.startswith('shard_'))
+    for column, name in ((states, 'state_memory'), (actions, 'action_memory'), (rewards, 'reward_memory'),
+                         (new_states, 'new_state_memory'), (doneflags, 'doneflags_memory'),
+                         (next_masks, 'next_mask_memory')):
+        np.testing.assert_array_equal(column[::-1], np.concatenate([shardArrays(shard, name) for shard in shards]))
+
+    for shard in shards:
+        shard_states = shardArrays(shard, 'state_memory')
+        shard_new_states = shardArrays(shard, 'new_state_memory')
+        shard_doneflags = shardArrays(shard, 'doneflags_memory')
+        assert shard_doneflags[-1] == 0
+        # Transitions of a game follow each other
+        going = np.flatnonzero(shard_doneflags[:-1] == 1)
+        np.testing.assert_array_equal(shard_states[going + 1], shard_new_states[going])
+    assert summary['games'] == int((doneflags == 0).sum())
+
+    sample = data.sample_memory(32)
+    assert [column.shape for column in sample] == [(32, pokemon.state_size), (32,), (32,), (32, pokemon.state_size),
+                                                   (32,), (32, 6)]
+
+
+# A shard holds the same games whether it is written in the calling process or in a worker
+def test_shards_do_not_depend_on_workers(tmp_path):
+    dataset.generate_dataset(str(tmp_path / 'local'), 2, shard_size=120, n_workers=0, root_seed=4)
+    dataset.generate_dataset(str(tmp_path / 'pool'), 2, shard_size=120, n_workers=2, root_seed=4)
+    for shard in ('shard_00000', 'shard_00001'):
+        for name, _, _ in dataset._memories:
+            np.testing.assert_array_equal(shardArrays(str(tmp_path / 'local' / shard), name),
+                                          shardArrays(str(tmp_path / 'pool' / shard), name))
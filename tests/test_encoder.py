@@ -0,0 +1,40 @@
+import numpy as np
+
+import pokemon
+
+
+# Without normalization or one-hot types the encoder writes exactly what getState returns
+def test_encoder_matches_get_state(play_games):
+    encoder = pokemon.ObservationEncoder()
+    assert encoder.size == pokemon.state_size
+
+    def check(team1, team2):
+        if team1.roundNumber == 0:
+            encoder.reset(team1, team2)
+        np.testing.assert_array_equal(encoder.encode(team1, team2),
+                                      np.array(pokemon.getState(team1, team2), dtype=np.float32))
+
+    play_games(check)
+
+
+# A normalized encoder scales every getState field and one-hot encodes the types
+def test_normalized_encoder_matches_get_state(play_games):
+    encoder = pokemon.ObservationEncoder(normalize=True, one_hot_types=True)
+
+    def check(team1, team2):
+        if team1.roundNumber == 0:
+            encoder.reset(team1, team2)
+        encoded = encoder.encode(team1, team2)
+        state = pokemon.getState(team1, team2)
+        for name, column in pokemon.state_index.items():
+            field = name.rsplit('.', 1)[1]
+            if field in ('type1', 'type2', 'moveType'):
+                start = encoder.index[name + '.Normal']
+                expected = np.zeros(18, dtype=np.float32)
+                if state[column] >= 1:
+                    expected[int(state[column]) - 1] = 1
+                np.testing.assert_array_equal(encoded[start:start + 18], expected)
+            else:
+                assert np.isclose(encoded[encoder.index[name]], state[column] / pokemon.state_scales[field])
+
+    play_games(check, n_games=5)
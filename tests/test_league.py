@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import actor_learner
+import league
+import pokemon
+
+
+def randomWeights(rng, hidden=8):
+    shapes = [(pokemon.state_size, hidden), (hidden,), (hidden, 6), (6,)]
+    return [rng.normal(size=shape).astype(np.float32) for shape in shapes]
+
+
+# Opponents are drawn with weight (1 - win rate) ** hardness, plus latest_share of games against the newest
+def test_sampling_follows_win_rates():
+    rng = np.random.default_rng(0)
+    pool = league.CheckpointPool(max_size=5, hardness=2.0, latest_share=0.2)
+    checkpoints = [pool.add('c%i' % i, randomWeights(rng)) for i in range(3)]
+    for checkpoint, score in zip(checkpoints, (9.0, 4.5, 0.0)):
+        for game in range(9):
+            pool.record(checkpoint, score / 9)
+    assert [c.win_rate() for c in checkpoints] == pytest.approx([0.95, 0.5, 0.05])
+
+    n = 100000
+    counts = {c.name: 0 for c in checkpoints}
+    for _ in range(n):
+        counts[pool.sample(rng).name] += 1
+    weights = np.array([0.05 ** 2, 0.5 ** 2, 0.95 ** 2]) + 1e-6
+    expected = 0.8 * weights / weights.sum() + np.array([0.0, 0.0, 0.2])
+    np.testing.assert_allclose([counts[c.name] / n for c in checkpoints], expected, atol=0.005)
+
+
+# A full pool drops the checkpoint the learner beats most often
+def test_full_pool_drops_the_easiest():
+    rng = np.random.default_rng(1)
+    pool = league.CheckpointPool(max_size=3)
+    for i in range(3):
+        pool.add('c%i' % i, randomWeights(rng))
+    pool.record(pool.checkpoints['c1'], 1.0)
+    pool.record(pool.checkpoints['c2'], 0.0)
+    pool.add('c3', randomWeights(rng))
+    assert list(pool.checkpoints) == ['c0', 'c2', 'c3']
+    assert [name for name, _, _ in pool.summary()] == ['c0', 'c2', 'c3']
+
+
+# The cache builds one network per checkpoint on top of the checkpoint's own arrays and picks the same actions
+# as a network per row would
+def test_inference_cache():
+    rng = np.random.default_rng(2)
+    pool = league.CheckpointPool(max_size=2)
+    cache = league.InferenceCache(pool)
+    first = pool.add('c0', randomWeights(rng))
+    second = pool.add('c1', randomWeights(rng))
+
+    network = cache.network(first)
+    assert cache.network(first) is network
+    assert all(np.shares_memory(kernel, w) for (kernel, _), w in zip(network.layers, first.weights[::2]))
+    assert not first.weights[0].flags.writeable
+
+    observations = rng.uniform(0, 100, size=(12, pokemon.state_size)).astype(np.float32)
+    masks = rng.random((12, 6)) < 0.7
+    masks[:, 0] = True
+    opponents = [first if row % 3 else second for row in range(12)]
+    actions = cache.choose_actions(opponents, observations, masks)
+    for row, checkpoint in enumerate(opponents):
+        q_values = actor_learner.NumpyQNetwork(checkpoint.weights).predict(observations[row])
+        assert actions[row] == np.argmax(pokemon.masked_q_values(q_values, masks[row]))
+        assert masks[row, actions[row]]
+
+    # Networks of dropped checkpoints are forgotten once the cache fills up
+    pool.record(first, 1.0)
+    third = pool.add('c2', randomWeights(rng))
+    cache.network(third)
+    assert set(cache.networks) == {'c1', 'c2'}
@@ -0,0 +1,70 @@
+import numpy as np
+
+import batch_battle
+import pokemon
+
+
+# The masks fightSim's switchTarget implies: moves need an active Pokemon able to battle, switch 5 needs a
+# target and switch 6 a target other than switch 5's
+def fightSimMask(team):
+    target5 = pokemon.switchTarget(team, 5)
+    target6 = pokemon.switchTarget(team, 6)
+    alive = team.activePokemon.hp > 0
+    return [alive] * 4 + [target5 != 0, target6 not in (0, target5)]
+
+
+# Every way of building the masks gives the same answer as fightSim in every state of seeded games
+def test_masks_match_fight_sim(play_games):
+    battle = batch_battle.BatchBattle(1)
+
+    def check(team1, team2):
+        expected = np.array([fightSimMask(team1), fightSimMask(team2)])
+        np.testing.assert_array_equal(pokemon.legal_actions(team1, team2), expected)
+        hp = np.array([[p.hp for p in team.roster] for team in (team1, team2)])
+        active = np.array([team1.activePokemonN, team2.activePokemonN]) - 1
+        np.testing.assert_array_equal(pokemon.legal_actions_batch(hp[None], active[None])[0], expected)
+        np.testing.assert_array_equal(pokemon.observation_legal_actions(pokemon.getState(team1, team2)), expected)
+        battle.hp[0] = hp
+        battle.active[0] = active
+        np.testing.assert_array_equal(battle.legalActions()[0], expected)
+
+    play_games(check, hurt=True)
+
+
+# Switches to a fainted Pokemon are masked, and fightSim ignores them
+def test_switches_to_fainted_pokemon_are_blocked():
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    team1.Pokemon2.hp = 0
+    assert pokemon.legal_actions(team1, team2)[0].tolist() == [True] * 5 + [False]
+    assert pokemon.switchTarget(team1, 5) == pokemon.switchTarget(team1, 6) == 3
+
+    team1.Pokemon3.hp = 0
+    assert pokemon.legal_actions(team1, team2)[0].tolist() == [True] * 4 + [False, False]
+    pokemon.fightSim(team1, team2, 5, 1, pokemon.BattleRNG(0))
+    assert team1.activePokemonN == 1
+
+    # The batch versions agree, also for a fainted active Pokemon
+    hp = np.array([[[0, 10, 0], [5, 5, 5]], [[10, 0, 10], [0, 0, 0]]])
+    active = np.array([[0, 0], [2, 1]])
+    np.testing.assert_array_equal(pokemon.legal_actions_batch(hp, active),
+                                  [[[False] * 4 + [True, False], [True] * 6],
+                                   [[True] * 5 + [False], [False] * 6]])
+
+
+# The random and greedy pickers only choose legal actions; rows without one allow every action
+def test_pickers_choose_legal_actions():
+    rng = np.random.default_rng(3)
+    masks = rng.random((500, 6)) < 0.3
+    masks[:20] = False
+    legal = masks | ~masks.any(axis=1, keepdims=True)
+
+    actions = pokemon.random_legal_actions(masks, rng)
+    assert legal[np.arange(len(masks)), actions].all()
+    assert set(actions[:20].tolist()) == set(range(6))
+
+    q_values = rng.normal(size=(500, 6))
+    masked = pokemon.masked_q_values(q_values, masks)
+    assert legal[np.arange(len(masks)), masked.argmax(axis=1)].all()
+    np.testing.assert_array_equal(masked[legal], q_values[legal])
+    assert np.isneginf(masked[~legal]).all()
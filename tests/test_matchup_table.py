@@ -0,0 +1,63 @@
+import pokemon
+
+
+# Entries a MatchupTable built from scratch holds for the teams as they are now
+def freshEntries(attacker, defender):
+    return pokemon.MatchupTable(attacker, defender).entries
+
+
+def test_table_is_cached_until_a_matchup_field_changes():
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    table = pokemon.getMatchupTable(team1, team2)
+    # hp, speed and the active slot are not part of the table
+    team2.Pokemon1.hp -= 40
+    team1.setActive(2)
+    assert pokemon.getMatchupTable(team1, team2) is table
+    # Neither is a reset that restores nothing the table depends on
+    team1.reset()
+    team2.reset()
+    assert pokemon.getMatchupTable(team1, team2) is table
+    # A table is built per opposing team
+    other = pokemon.generate_team_2()
+    assert pokemon.getMatchupTable(team1, other) is not table
+
+
+# Changing a stat or the status of either team's Pokemon rebuilds the table with the new values
+def test_stat_and_status_changes_invalidate_the_table():
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    changes = [(team1.Pokemon1, 'attack', 2.0), (team1.Pokemon2, 'spattack', 0.5),
+               (team2.Pokemon1, 'defense', 1.5), (team2.Pokemon3, 'spdefense', 0.75)]
+    for target, field, factor in changes:
+        table = pokemon.getMatchupTable(team1, team2)
+        setattr(target, field, getattr(target, field) * factor)
+        rebuilt = pokemon.getMatchupTable(team1, team2)
+        assert rebuilt is not table
+        assert rebuilt.entries == freshEntries(team1, team2)
+
+    # A burn halves the damage of physical moves only
+    table = pokemon.getMatchupTable(team1, team2)
+    team1.Pokemon1.status = pokemon.pokemon_conditions_dict['Burned']
+    burned = pokemon.getMatchupTable(team1, team2)
+    assert burned is not table
+    for move, (entry, before) in enumerate(zip(burned.entries[0], table.entries[0])):
+        physical = team1.Pokemon1.moves[move].category == pokemon.CATEGORY_PHYSICAL
+        for (_, _, damage), (_, _, damageBefore) in zip(entry, before):
+            assert damage == (damageBefore * 0.5 if physical else damageBefore)
+
+    # A reset restores the species' values, so the table matches the one of fresh teams again
+    team1.reset()
+    team2.reset()
+    assert pokemon.getMatchupTable(team1, team2).entries == \
+        freshEntries(pokemon.generate_team_1(), pokemon.generate_team_2())
+
+
+# The defending team's table is invalidated too, since both rosters' versions are checked
+def test_changes_invalidate_the_opposing_table():
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    table = pokemon.getMatchupTable(team2, team1)
+    team1.Pokemon3.spdefense *= 2
+    assert pokemon.getMatchupTable(team2, team1) is not table
+    assert pokemon.getMatchupTable(team2, team1).entries == freshEntries(team2, team1)
@@ -0,0 +1,39 @@
+import time
+
+import mcts
+import pokemon
+
+
+# Every decision returns a legal action within its time budget (plus one simulation, since the budget is only
+# checked between simulations) and leaves the teams as they were
+def test_decisions_stay_within_budget():
+    agent = mcts.MCTSAgent(time_budget_ms=20, seed=1)
+    team = pokemon.generate_team_1()
+    opponent = pokemon.generate_team_2()
+    rng = pokemon.BattleRNG(2)
+    elapsed = []
+    done = False
+    while not done:
+        pokemon.seatTeams(team, opponent)
+        before = pokemon.snapshot(team, opponent)
+        start = time.perf_counter()
+        action = agent(team, opponent)
+        elapsed.append(time.perf_counter() - start)
+        assert pokemon.snapshot(team, opponent) == before
+        assert pokemon.teamLegalActions(team)[action]
+        assert agent.simulations > 0
+        _, _, done = pokemon.step(team, opponent, action + 1, pokemon.randomLegalAction(opponent, agent.rnd),
+                                  rng=rng)
+
+    elapsed.sort()
+    assert elapsed[len(elapsed) // 2] < 0.030
+    assert elapsed[-1] < 0.100
+
+
+# An iteration limit ends the search before the time budget
+def test_iteration_limit():
+    agent = mcts.MCTSAgent(time_budget_ms=10000, iterations=25, seed=3)
+    start = time.perf_counter()
+    agent(pokemon.generate_team_1(), pokemon.generate_team_2())
+    assert agent.simulations == 25
+    assert time.perf_counter() - start < 5.0
@@ -0,0 +1,27 @@
+import random
+
+import numpy as np
+
+import pokemon
+
+
+def test_get_state_out_matches_list(play_games):
+    out = np.zeros(pokemon.state_size, dtype=np.float32)
+
+    def check(team1, team2):
+        pokemon.getState(team1, team2, out=out)
+        np.testing.assert_array_equal(out, np.array(pokemon.getState(team1, team2), dtype=np.float32))
+
+    play_games(check)
+
+
+def test_step_out_matches_get_state():
+    rnd = random.Random(4)
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    out = np.zeros(pokemon.state_size, dtype=np.float32)
+    done = False
+    while not done:
+        _, _, done = pokemon.step(team1, team2, rnd.randint(1, 6), rnd.randint(1, 6), out=out)
+        np.testing.assert_array_equal(out, np.array(pokemon.getState(team1, team2), dtype=np.float32))
+
@@ -0,0 +1,43 @@
+import csv
+import json
+
+import profiling
+
+
+# A timer keeps only its window of episodes in memory while every episode reaches the CSV file and the totals
+def test_timer_memory_is_bounded(tmp_path):
+    timer = profiling.PhaseTimer(['a', 'b'], window=5, csv_file=str(tmp_path / 'timings.csv'))
+    for episode in range(40):
+        timer.begin()
+        for _ in range(3):
+            timer.lap('a')
+            timer.lap('b')
+            timer.count('turns')
+        timer.end_episode()
+    timer.close()
+    timer.export_json(str(tmp_path / 'timings.json'))
+
+    assert len(timer.recent) == 5
+    assert timer.rolling_summary()['phases']['a']['count'] == 15
+    with open(tmp_path / 'timings.csv') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 80
+    assert [int(row['episode']) for row in rows[::2]] == list(range(40))
+    with open(tmp_path / 'timings.json') as f:
+        total = json.load(f)['total']
+    assert total['episodes'] == 40
+    assert total['phases']['b']['count'] == 120
+    assert total['counters'] == {'turns': 120}
+    assert abs(total['phases']['a']['total_ms'] - sum(float(row['total_ms']) for row in rows
+                                                      if row['phase'] == 'a')) < 1e-6
+
+
+# A disabled timer records nothing and never creates its CSV file
+def test_disabled_timer_writes_nothing(tmp_path):
+    timer = profiling.PhaseTimer(['a'], enabled=False, csv_file=str(tmp_path / 'timings.csv'))
+    timer.begin()
+    timer.lap('a')
+    assert timer.end_episode() is None
+    timer.close()
+    assert timer.episodes == 0
+    assert not (tmp_path / 'timings.csv').exists()
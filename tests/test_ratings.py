@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+import pytest
+
+import pokemon
+import tournament
+
+
+def test_wilson_interval():
+    assert tournament.wilsonInterval(8, 10) == pytest.approx((0.4902, 0.9433), abs=1e-4)
+    assert tournament.wilsonInterval(50, 100) == pytest.approx((0.4038, 0.5962), abs=1e-4)
+    low, high = tournament.wilsonInterval(0, 10)
+    assert low == 0.0 and high == pytest.approx(0.2775, abs=1e-4)
+    assert tournament.wilsonInterval(0, 0) == (0.0, 1.0)
+    # More games give a narrower interval around the same rate
+    assert np.diff(tournament.wilsonInterval(80, 100)) < np.diff(tournament.wilsonInterval(8, 10))
+
+
+# Two players: the fit is the closed-form Bradley-Terry rating gap, including the virtual draw
+def test_elo_two_players():
+    elo = tournament.eloRatings([[0, 75], [25, 0]], [[0, 100], [100, 0]])
+    assert elo.mean() == pytest.approx(1500.0)
+    assert elo[0] - elo[1] == pytest.approx(400.0 * math.log10(75.5 / 25.5))
+
+
+# Scores that follow Bradley-Terry strengths 1, 2 and 4 exactly give gaps of 400 log10(2) Elo
+def test_elo_recovers_consistent_strengths():
+    strength = np.array([1.0, 2.0, 4.0])
+    games = np.full((3, 3), 99.0) - np.diag(np.full(3, 99.0))
+    # Expected scores over the games plus the virtual draw, minus the virtual draw's half point
+    scores = 100.0 * strength[:, None] / (strength[:, None] + strength[None, :]) - 0.5
+    np.fill_diagonal(scores, 0.0)
+    elo = tournament.eloRatings(scores, games)
+    np.testing.assert_allclose(np.diff(elo), 400.0 * math.log10(2.0), rtol=1e-6)
+
+
+# The example of Glickman's description of the Glicko system: a 1500 (RD 200) player beats a 1400 (RD 30)
+# player and loses to a 1550 (RD 100) and a 1700 (RD 300) player in one rating period
+def test_glicko_matches_glickman_example():
+    rating, deviation = tournament.glickoRatings(
+        4, [[(0, 1, 1.0), (0, 2, 0.0), (0, 3, 0.0)]], initial_rating=np.array([1500.0, 1400.0, 1550.0, 1700.0]),
+        initial_deviation=np.array([200.0, 30.0, 100.0, 300.0]))
+    assert rating[0] == pytest.approx(1464.1, abs=0.1)
+    assert deviation[0] == pytest.approx(151.4, abs=0.1)
+
+
+# Players without games in a period keep their rating and deviation
+def test_glicko_leaves_idle_players_alone():
+    rating, deviation = tournament.glickoRatings(3, [[(0, 1, 1.0)], []])
+    assert rating[0] > 1500.0 > rating[1]
+    assert rating[2] == 1500.0 and deviation[2] == 350.0
+
+
+# A seeded in-process tournament ranks the damage-maximizing evaluator above random play, and repeats
+def test_tournament_report():
+    entrants = [tournament.randomEntrant(),
+                tournament.evaluatorEntrant('highest_damage', pokemon.evaluator_highest_damage_action)]
+    report = tournament.run_tournament(entrants, games_per_pair=40, n_workers=0, root_seed=1)
+    assert report == tournament.run_tournament(entrants, games_per_pair=40, n_workers=0, root_seed=1)
+    random, greedy = report['players']
+    assert random['games'] == greedy['games'] == 40
+    assert random['score'] + greedy['score'] == 40
+    assert greedy['elo'] > random['elo'] and greedy['glicko'] > random['glicko']
+    low, high = greedy['win_rate_interval']
+    assert low <= greedy['win_rate'] <= high
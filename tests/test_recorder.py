@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+import pokemon
+import recorder
+
+
+# Checks every game of the log at path against the hp each game really ended with
+def checkLog(path, hp):
+    log = recorder.BattleLog(path)
+    assert len(log) == len(hp)
+    assert os.path.getsize(path + '.turns') == log.index['turns'].sum() * recorder.record_dtype.itemsize
+    for i, final in enumerate(hp):
+        episode = log.episode(i)
+        np.testing.assert_array_equal(episode['hp'][-1], np.array(final, dtype=np.float32))
+        np.testing.assert_allclose(log.hp(i, -1) + episode['hpDelta'].sum(axis=0), episode['hp'][-1], atol=1e-3)
+        assert episode['round'].tolist() == list(range(len(episode)))
+        assert log.index['winner'][i] in (1, 2)
+        assert log.turn(i, len(episode) - 1).tobytes() == episode[-1].tobytes()
+    return log
+
+
+# The records of each game end with the hp the game really ended with
+def test_records_are_exact_with_a_shared_rng(tmp_path, play_games):
+    path = str(tmp_path / 'battles')
+    shared = pokemon.BattleRNG(5)
+    with recorder.Recorder(path, flush_turns=50) as battle_recorder:
+        hp = play_games(n_games=60, seed=1, rng_factory=lambda game: shared, recorder=battle_recorder, hurt=True)
+    checkLog(path, hp)
+
+
+def test_records_are_exact_with_a_rng_per_game(tmp_path, play_games):
+    path = str(tmp_path / 'battles')
+    with recorder.Recorder(path) as battle_recorder:
+        hp = play_games(n_games=60, seed=2, rng_factory=lambda game: pokemon.BattleRNG(pokemon.gameSeed(9, game)),
+                        recorder=battle_recorder, hurt=True)
+    checkLog(path, hp)
+
+
+# A second Recorder on the same path appends its games after the first one's
+def test_recorders_append(tmp_path, play_games):
+    path = str(tmp_path / 'battles')
+    shared = pokemon.BattleRNG(6)
+    with recorder.Recorder(path) as battle_recorder:
+        hp = play_games(n_games=20, seed=3, rng_factory=lambda game: shared, recorder=battle_recorder, hurt=True)
+    with recorder.Recorder(path) as battle_recorder:
+        hp += play_games(n_games=20, seed=4, rng_factory=lambda game: shared, recorder=battle_recorder, hurt=True)
+    checkLog(path, hp)
+
+
+# ReplayRNG plays a recorded episode again turn by turn
+def test_replay_rng_plays_an_episode_again(tmp_path, play_games):
+    path = str(tmp_path / 'battles')
+    with recorder.Recorder(path) as battle_recorder:
+        hp = play_games(n_games=3, seed=5, rng_factory=lambda game: pokemon.BattleRNG(game),
+                        recorder=battle_recorder, hurt=True)
+    episode = recorder.BattleLog(path).episode(1)
+
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    rng = recorder.ReplayRNG(episode)
+    for record in episode:
+        pokemon.fightSim(team1, team2, *record['actions'].tolist(), rng)
+        np.testing.assert_array_equal(np.array([p.hp for p in team1.roster + team2.roster], dtype=np.float32),
+                                      record['hp'])
+    assert [p.hp for p in team1.roster + team2.roster] == hp[1]
+
+
+# Every record holds the hp and active slots the teams had right after its turn
+def test_records_match_every_turn(tmp_path, play_games):
+    path = str(tmp_path / 'battles')
+    seen = []
+
+    def check(team1, team2):
+        if team1.roundNumber:
+            seen.append([p.hp for p in team1.roster + team2.roster] + [team1.activePokemonN, team2.activePokemonN])
+
+    shared = pokemon.BattleRNG(7)
+    with recorder.Recorder(path, flush_turns=30) as battle_recorder:
+        play_games(check, n_games=20, seed=6, rng_factory=lambda game: shared, recorder=battle_recorder, hurt=True)
+    turns = recorder.BattleLog(path).turns
+    np.testing.assert_array_equal(turns['hp'], np.array(seen, dtype=np.float32)[:, :6])
+    np.testing.assert_array_equal(turns['active'], np.array(seen)[:, 6:])
+    switched = turns['events'] & (recorder.EVENT_SWITCH_1 | recorder.EVENT_SWITCH_2) != 0
+    assert not (switched & (turns['actions'] < 5).all(axis=1)).any()
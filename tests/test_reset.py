@@ -0,0 +1,47 @@
+import numpy as np
+
+import pokemon
+
+
+# Everything a battle or a caller may change about a team, per Pokemon and for the team itself
+def teamState(team):
+    pokemonState = [(p.hp, p.maxHp, p.speed, p.healthPercentage, p.type1, p.type2, p.moves, p.status, p.attack,
+                     p.spattack, p.defense, p.spdefense, p.level) for p in team.roster]
+    return pokemonState, (team.activePokemon, team.activePokemonN, team.hasAvailablePokemon, team.reward,
+                          team.roundNumber, team.faintedFlag)
+
+
+# After a played game and changed stats, reset gives the same objects back in the state of new teams
+def test_reset_restores_teams_in_place():
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    objects = [team1, team2, *team1.roster, *team2.roster]
+    fresh1 = pokemon.generate_team_1()
+    fresh2 = pokemon.generate_team_2()
+
+    rng = pokemon.BattleRNG(1)
+    done = False
+    while not done:
+        _, _, done = pokemon.step(team1, team2, 1, 1, rng=rng)
+    team1.Pokemon1.attack *= 2
+    team2.Pokemon2.status = pokemon.pokemon_conditions_dict['Burned']
+    team2.Pokemon3.speed = 1
+    team1.reset()
+    team2.reset()
+
+    assert all(a is b for a, b in zip([team1, team2, *team1.roster, *team2.roster], objects))
+    assert teamState(team1)[0] == teamState(fresh1)[0]
+    assert teamState(team2)[0] == teamState(fresh2)[0]
+    assert teamState(team1)[1][1:] == teamState(fresh1)[1][1:]
+    assert team1.activePokemon is team1.Pokemon1
+    np.testing.assert_array_equal(pokemon.getState(team1, team2), pokemon.getState(fresh1, fresh2))
+
+
+# Teams built from one template share its species, so building and resetting copies no static data
+def test_teams_share_their_template_species():
+    team1 = pokemon.generate_team_1()
+    other = pokemon.generate_team_1()
+    for p, q, species in zip(team1.roster, other.roster, pokemon.team_1_template().species):
+        assert p.species is species and q.species is species
+        assert p is not q
+        assert p.moves is species.moves
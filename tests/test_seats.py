@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+import pokemon
+import tournament
+
+
+# Swapping the team blocks gives the board as Team 2 sees it
+def test_swap_observation_matches_get_state_from_team_2(play_games):
+    def check(team1, team2):
+        swapped = pokemon.swap_observation(np.array(pokemon.getState(team1, team2), dtype=np.float32))
+        np.testing.assert_array_equal(swapped, np.array(pokemon.getState(team2, team1), dtype=np.float32))
+
+    play_games(check, n_games=5)
+
+
+# Encoded observations hold one block per team too, so they are swapped the same way
+def test_swap_observation_swaps_encoded_observations(play_games):
+    encoder = pokemon.ObservationEncoder(normalize=True, one_hot_types=True)
+    other = pokemon.ObservationEncoder(normalize=True, one_hot_types=True)
+
+    def check(team1, team2):
+        if team1.roundNumber == 0:
+            encoder.reset(team1, team2)
+            other.reset(team2, team1)
+        np.testing.assert_array_equal(pokemon.swap_observation(encoder.encode(team1, team2)),
+                                      other.encode(team2, team1))
+
+    play_games(check, n_games=5)
+
+
+# Seat 2 player that keeps every observation it is shown and plays its first legal action
+class SeatTwoPlayer:
+    def __init__(self):
+        self.rows = []
+
+    def __call__(self, team, opponent, observation):
+        return self.choose_action(observation, pokemon.teamLegalActions(team))
+
+    # Agent interface, see pokemon.agentPlayer and training.choose_actions
+    def choose_action(self, observation, mask):
+        self.rows.append(np.array(observation, dtype=np.float32))
+        assert len(self.rows[-1]) == pokemon.state_size
+        return int(np.argmax(mask))
+
+
+playerOne = pokemon.evaluatorPlayer(pokemon.evaluator_highest_damage_action)
+
+
+def playBattleSim(seed):
+    player = SeatTwoPlayer()
+    pokemon.battleSim(pokemon.generate_team_1(), pokemon.generate_team_2(), renderer=pokemon.HeadlessRenderer(),
+                      player1=playerOne, player2=player, rng=pokemon.BattleRNG(seed))
+    return player.rows
+
+
+def playTournamentGame(seed):
+    player = SeatTwoPlayer()
+    tournament.playGame(playerOne, player, pokemon.generate_team_1(), pokemon.generate_team_2(),
+                        pokemon.BattleRNG(seed), np.zeros(pokemon.state_size, dtype=np.float32))
+    return player.rows
+
+
+# The same seeded game shows the seat 2 player the same rows in battleSim and a tournament game, each with its
+# own team first
+def test_battle_sim_and_tournament_show_seat_two_the_same_rows():
+    for seed in range(5):
+        rows = playBattleSim(seed)
+        assert len(rows) > 1
+        np.testing.assert_array_equal(np.array(rows), np.array(playTournamentGame(seed)))
+
+    # The first row is Team 2's own view of the starting board
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    np.testing.assert_array_equal(rows[0], np.array(pokemon.getState(team2, team1), dtype=np.float32))
+
+
+# train() shows Model B, playing Team 2 against the evaluator function, the same rows as well
+def test_train_shows_seat_two_the_same_rows(monkeypatch):
+    pytest.importorskip('tensorflow')
+    pytest.importorskip('matplotlib')
+    import training
+    monkeypatch.setattr(training, 'evaluator_function', pokemon.evaluator_highest_damage_action)
+
+    for seed in range(5):
+        # The turn loop of train() with Player B training
+        model_b = SeatTwoPlayer()
+        team_a = pokemon.generate_team_1()
+        team_b = pokemon.generate_team_2()
+        pokemon.seatTeams(team_a, team_b)
+        rng = pokemon.BattleRNG(seed)
+        observation = np.zeros(pokemon.state_size, dtype=np.float32)
+        pokemon.getState(team_a, team_b, out=observation)
+        done = False
+        while not done:
+            action_a, action_b = training.choose_actions(team_a, team_b, observation, False, model_b=model_b)
+            _, _, done = pokemon.step(team_a, team_b, action_a + 1, action_b + 1, out=observation, rng=rng)
+        np.testing.assert_array_equal(np.array(model_b.rows), np.array(playTournamentGame(seed)))
@@ -0,0 +1,57 @@
+import random
+
+import numpy as np
+
+import batch_battle
+import pokemon
+
+
+# Plays game game_index of a run seeded with root_seed and returns every observation and reward it produced
+# The actions come from their own seeded stream, so only the battle's rolls depend on root_seed
+def playGame(root_seed, game_index):
+    rnd = random.Random(game_index)
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    rng = pokemon.BattleRNG(pokemon.gameSeed(root_seed, game_index))
+    trajectory = []
+    done = False
+    while not done:
+        observation, rewards, done = pokemon.step(team1, team2, pokemon.randomLegalAction(team1, rnd),
+                                                  pokemon.randomLegalAction(team2, rnd), rng=rng)
+        trajectory.append(np.array(observation + rewards))
+    return np.array(trajectory)
+
+
+# Every game of a seeded run is the same, bit for bit, whether it is played in order or on its own
+def test_same_root_seed_gives_identical_games():
+    run = [playGame(21, game) for game in range(20)]
+    for game in reversed(range(20)):
+        np.testing.assert_array_equal(playGame(21, game), run[game])
+    # Other seeds give other games
+    assert any(not np.array_equal(playGame(22, game), run[game]) for game in range(20))
+
+
+# Rendered seeded games are identical, including who won each of them
+def test_spectated_games_repeat():
+    def spectate():
+        renderer = pokemon.HeadlessRenderer()
+        player = pokemon.evaluatorPlayer(pokemon.evaluator_highest_damage_action)
+        wins = pokemon.spectateGames(10, player, player, renderer=renderer, root_seed=5)
+        return wins, renderer.text()
+
+    assert spectate() == spectate()
+
+
+# A seeded BatchBattle plays the same games again
+def test_batch_battle_repeats_with_a_seed():
+    def play(seed):
+        battle = batch_battle.BatchBattle(8, seed=pokemon.gameSeed(seed, 0))
+        actions = np.random.default_rng(0)
+        results = []
+        for _ in range(40):
+            observations, rewards, dones = battle.step(actions.integers(1, 7, 8), actions.integers(1, 7, 8))
+            results += [observations.copy(), rewards.copy(), dones.copy()]
+        return results
+
+    for a, b in zip(play(3), play(3)):
+        np.testing.assert_array_equal(a, b)
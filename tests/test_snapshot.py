@@ -0,0 +1,74 @@
+import random
+
+import numpy as np
+
+import batch_battle
+import pokemon
+
+
+# Everything snapshot captures, read back from the teams
+def battleState(team1, team2):
+    return [(p.hp, p.healthPercentage, p.status) for p in team1.roster + team2.roster] + \
+        [(t.activePokemon, t.activePokemonN, t.hasAvailablePokemon, t.reward, t.roundNumber, t.faintedFlag)
+         for t in (team1, team2)]
+
+
+# Restoring a snapshot taken mid-game puts the teams back, and replaying from there with the same rolls gives
+# the same game; one token can be restored any number of times
+def test_snapshot_restore_round_trip():
+    rnd = random.Random(2)
+    team1 = pokemon.generate_team_1()
+    team2 = pokemon.generate_team_2()
+    rng = pokemon.BattleRNG(4)
+    for _ in range(3):
+        pokemon.step(team1, team2, 1, 2, rng=rng)
+    team1.Pokemon2.status = pokemon.pokemon_conditions_dict['Burned']
+    token = pokemon.snapshot(team1, team2)
+    before = battleState(team1, team2)
+    actions = [(pokemon.randomLegalAction(team1, rnd), pokemon.randomLegalAction(team2, rnd)) for _ in range(30)]
+
+    endings = []
+    for branch in range(3):
+        pokemon.restore(token)
+        assert battleState(team1, team2) == before
+        branchRng = pokemon.BattleRNG(10)
+        observations = []
+        for action1, action2 in actions:
+            observation, _, done = pokemon.step(team1, team2, action1, action2, rng=branchRng)
+            observations.append(observation)
+            if done:
+                break
+        endings.append(observations)
+    assert endings[0] == endings[1] == endings[2]
+    pokemon.restore(token)
+    assert battleState(team1, team2) == before
+
+
+# Copy-on-write and copied snapshots of a BatchBattle restore the same state. A copy-on-write token keeps its
+# values when the battle steps on, and can be restored again after a step
+def test_batch_snapshot_copy_on_write():
+    battle = batch_battle.BatchBattle(6, seed=1)
+    actions = np.random.default_rng(2)
+    for _ in range(3):
+        battle.step(actions.integers(1, 7, 6), actions.integers(1, 7, 6))
+    expected = battle.snapshot()
+    token = battle.snapshot(copy_on_write=True)
+    assert all(a is getattr(battle, name) for a, name in zip(token, battle.state_arrays))
+
+    for _ in range(2):
+        battle.step(actions.integers(1, 7, 6), actions.integers(1, 7, 6))
+        # Stepping gave the battle its own arrays instead of writing into the token's
+        for array, value in zip(token, expected):
+            np.testing.assert_array_equal(array, value)
+        battle.restore(token)
+        for name, value in zip(battle.state_arrays, expected):
+            np.testing.assert_array_equal(getattr(battle, name), value)
+
+    # Restoring and stepping with the same rolls plays the same turn again
+    battle.rng = np.random.default_rng(7)
+    after = battle.step(np.full(6, 1), np.full(6, 2))
+    battle.restore(token)
+    battle.rng = np.random.default_rng(7)
+    again = battle.step(np.full(6, 1), np.full(6, 2))
+    for a, b in zip(after, again):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+# training.py imports TensorFlow and matplotlib at the top
+pytest.importorskip('tensorflow')
+pytest.importorskip('matplotlib')
+from training import SumTree  # noqa: E402
+
+
+# find returns the leaf whose cumulative priority range [prefix, prefix + priority) holds each value
+def test_find_matches_prefix_sums():
+    rng = np.random.default_rng(0)
+    tree = SumTree(100)
+    priorities = rng.uniform(0.0, 2.0, 100)
+    priorities[rng.integers(0, 100, 10)] = 0.0
+    tree.update(np.arange(100), priorities)
+
+    assert tree.total() == pytest.approx(priorities.sum())
+    values = rng.uniform(0.0, tree.total(), 5000)
+    expected = np.searchsorted(np.cumsum(priorities), values, side='right')
+    np.testing.assert_array_equal(tree.find(values), expected)
+
+
+# update_one and a batch update build the same tree, also when indices repeat
+def test_update_one_matches_update():
+    rng = np.random.default_rng(1)
+    single = SumTree(37)
+    batch = SumTree(37)
+    for _ in range(20):
+        indices = rng.integers(0, 37, 8)
+        priorities = rng.uniform(0.0, 1.0, 8)
+        for index, priority in zip(indices, priorities):
+            single.update_one(index, priority)
+        # Repeated indices keep the last priority, like the loop above
+        last = {index: priority for index, priority in zip(indices.tolist(), priorities.tolist())}
+        batch.update(list(last), list(last.values()))
+    np.testing.assert_allclose(single.tree, batch.tree)
+
+
+# Leaves are sampled in proportion to their priority
+def test_sampling_is_proportional():
+    rng = np.random.default_rng(2)
+    tree = SumTree(8)
+    priorities = np.array([1.0, 0.0, 2.0, 3.0, 0.5, 0.0, 1.5, 2.0])
+    tree.update(np.arange(8), priorities)
+    counts = np.bincount(tree.find(rng.uniform(0.0, tree.total(), 200000)), minlength=8)
+    np.testing.assert_allclose(counts / counts.sum(), priorities / priorities.sum(), atol=0.005)
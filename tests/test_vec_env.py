@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import pokemon
+import vec_env
+
+
+# Plays n_steps of seeded random actions in a VecEnv and returns everything it handed back
+def playSteps(env, n_steps, seed):
+    rng = np.random.default_rng(seed)
+    results = [env.reset()]
+    for _ in range(n_steps):
+        observations, rewards, dones = env.step(rng.integers(1, 7, env.n_games), rng.integers(1, 7, env.n_games))
+        results += [observations, rewards, dones, env.terminal_observations.copy()]
+    return results
+
+
+# With a root_seed, workers stepping their games in parallel play exactly what the calling process plays
+def test_async_matches_sync():
+    with vec_env.VecEnv(2, 3, asynchronous=False, root_seed=11) as env:
+        expected = playSteps(env, 120, seed=0)
+    with vec_env.VecEnv(2, 3, asynchronous=True, root_seed=11) as env:
+        results = playSteps(env, 120, seed=0)
+    for result, value in zip(results, expected):
+        np.testing.assert_array_equal(result, value)
+
+
+def brokenTeam():
+    raise KeyError('no such roster')
+
+
+def brokenDamageCalc(TeamAttacker, TeamDefender, move, rng=None):
+    raise ZeroDivisionError('broken damage')
+
+
+# An exception raised in a worker, while building its teams or stepping its games, is raised again by the
+# VecEnv, which can still be closed afterwards
+@pytest.mark.parametrize('broken', ['generator', 'step'])
+def test_worker_exceptions_reach_the_caller(broken, monkeypatch):
+    if broken == 'step':
+        # Workers are forked, so they inherit the patched module
+        monkeypatch.setattr(pokemon, 'damageCalc', brokenDamageCalc)
+        env = vec_env.VecEnv(2, 2)
+        error = ZeroDivisionError
+    else:
+        env = vec_env.VecEnv(2, 2, team_2_generator=brokenTeam)
+        error = KeyError
+    with pytest.raises(error) as raised:
+        env.reset()
+        env.step(np.ones(4), np.ones(4))
+    assert isinstance(raised.value.__cause__, vec_env.WorkerTraceback)
+    assert 'VecEnv worker 0 failed' in str(raised.value.__cause__)
+    env.close()
+    assert all(not process.is_alive() for process in env.processes)
@@ -0,0 +1,314 @@
+# Round-robin tournament runner
+# Plays every pairing of a set of players over a process pool without rendering, then reports win rates
+# with Wilson confidence intervals, Elo ratings (a Bradley-Terry fit of every game on the Elo scale) and
+# Glicko ratings with their rating deviation.
+#
+# Players are described by Entrants, which every worker turns into a player once (see pokemon.evaluatorPlayer),
+# so only the description has to be sent to the workers:
+#
+#     entrants = [randomEntrant(), evaluatorEntrant('highest_damage', pokemon.evaluator_highest_damage_action),
+#                 modelEntrant('model_a', 'model_a.h5')]
+#     report = run_tournament(entrants, games_per_pair=100, n_workers=8)
+#     print(format_report(report))
+#
+# Usage:
+#   python tournament.py --models model_a.h5 model_b.h5 --games 100 --workers 8 --output report.json
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import numpy as np
+import pokemon
+import rollout
+import mcts
+
+
+# ---------- Entrants ----------
+
+# A named player. factory(seed, *args) is called in each worker and returns a player function
+# (team, opponent, observation) -> action from 0 to 5. factory and args must be picklable
+class Entrant:
+    def __init__(self, name, factory, *args):
+        self.name = name
+        self.factory = factory
+        self.args = args
+
+    def make(self, seed):
+        return self.factory(seed, *self.args)
+
+
+def _randomPlayer(seed):
+    rnd = random.Random(seed)
+    return lambda team, opponent, observation: pokemon.randomLegalAction(team, rnd) - 1
+
+
+def _evaluatorPlayer(seed, evaluator):
+    return pokemon.evaluatorPlayer(evaluator)
+
+
+def _mctsPlayer(seed, time_budget_ms):
+    return pokemon.evaluatorPlayer(mcts.MCTSAgent(time_budget_ms=time_budget_ms, seed=seed))
+
+
+def _rolloutPlayer(seed, time_budget):
+    return pokemon.evaluatorPlayer(rollout.RolloutEvaluator(time_budget=time_budget, seed=seed))
+
+
+# Agents always exploit; TensorFlow is only imported by workers that play a model
+def _modelPlayer(seed, fname):
+    import training
+    agent = training.make_agent(fname)
+    agent.load_model()
+    agent.epsilon = 0.0
+    agent.epsilon_min = 0.0
+    return pokemon.agentPlayer(agent)
+
+
+# Picks one of the legal actions uniformly
+def randomEntrant(name='random'):
+    return Entrant(name, _randomPlayer)
+
+
+# Plays by an evaluator function called with (team, opponent), such as pokemon.evaluator_highest_damage_action
+def evaluatorEntrant(name, evaluator):
+    return Entrant(name, _evaluatorPlayer, evaluator)
+
+
+# mcts.MCTSAgent searching time_budget_ms per decision
+def mctsEntrant(time_budget_ms, name=None):
+    return Entrant(name or 'mcts_%ims' % time_budget_ms, _mctsPlayer, time_budget_ms)
+
+
+# In-process rollout.RolloutEvaluator with a time budget in seconds per decision
+def rolloutEntrant(time_budget, name=None):
+    return Entrant(name or 'rollout_%ims' % round(time_budget * 1000), _rolloutPlayer, time_budget)
+
+
+# A saved training.Agent model such as 'model_a.h5'
+def modelEntrant(name, fname):
+    return Entrant(name, _modelPlayer, fname)
+
+
+# ---------- Games ----------
+
+# Players built by this worker, by entrant index
+_worker_entrants = None
+_worker_players = {}
+
+
+def _initWorker(entrants):
+    global _worker_entrants
+    _worker_entrants = entrants
+    _worker_players.clear()
+
+
+# Returns the worker's player of entrant index, building it on first use
+# Battles are seeded per game, but a player's own random numbers depend on which games its worker played before
+def _player(index, root_seed):
+    player = _worker_players.get(index)
+    if player is None:
+        seed = None if root_seed is None else \
+            int(np.random.SeedSequence(root_seed, spawn_key=(2, index)).generate_state(1)[0])
+        player = _worker_players[index] = _worker_entrants[index].make(seed)
+    return player
+
+
+# Plays one game and returns the score of Team 1 (1 for a win, 0.5 for a draw, 0 for a loss) and its length
+# A game that reaches max_round goes to the team with the most health left, like in fightSim
+# Each player sees the observation from its own seat: player2 gets getState(team2, team1)
+def playGame(player1, player2, team1, team2, rng, observation):
+    team1.reset()
+    team2.reset()
+    pokemon.seatTeams(team1, team2)
+    pokemon.getState(team1, team2, out=observation)
+    swapped = np.empty_like(observation)
+    done = False
+    while not done:
+        action1 = player1(team1, team2, observation)
+        action2 = player2(team2, team1, pokemon.swap_observation(observation, out=swapped))
+        _, _, done = pokemon.step(team1, team2, action1 + 1, action2 + 1, out=observation, rng=rng)
+    value = rollout.gameValue(team1, team2)
+    return (1.0 if value > 0 else 0.0 if value < 0 else 0.5), team1.roundNumber
+
+
+# Pool task: plays games first to first + count - 1 of the pairing (i, j)
+# Entrant i plays Team 1 in even games and Team 2 in odd games
+# Returns a list of (game, score of i, turns)
+def _playPairing(i, j, first, count, team_1_generator, team_2_generator, root_seed):
+    team1 = team_1_generator()
+    team2 = team_2_generator()
+    observation = np.zeros(pokemon.state_size, dtype=np.float32)
+    results = []
+    for game in range(first, first + count):
+        # Every (pairing, game) has its own battle stream, wherever it is played
+        rng = None if root_seed is None else \
+            pokemon.BattleRNG(np.random.SeedSequence(root_seed, spawn_key=(3, i, j, game)))
+        if game % 2 == 0:
+            score, turns = playGame(_player(i, root_seed), _player(j, root_seed), team1, team2, rng, observation)
+        else:
+            score, turns = playGame(_player(j, root_seed), _player(i, root_seed), team1, team2, rng, observation)
+            score = 1.0 - score
+        results.append((game, score, turns))
+    return results
+
+
+# ---------- Statistics ----------
+
+# Wilson score interval of a win rate of wins (draws count as half) out of n games, at z standard deviations
+def wilsonInterval(wins, n, z=1.96):
+    if n == 0:
+        return 0.0, 1.0
+    p = wins / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+# Elo ratings fitted to every game at once (Bradley-Terry maximum likelihood on the Elo scale, mean 1500)
+# scores[i][j] is the total score of i against j, games[i][j] the number of games they played
+# Every pairing gets one virtual draw, so a player that won every game still gets a finite rating
+def eloRatings(scores, games, iterations=1000):
+    n = len(scores)
+    scores = np.asarray(scores, dtype=np.float64) + 0.5 * (np.asarray(games) > 0)
+    games = np.asarray(games, dtype=np.float64) + 1.0 * (np.asarray(games) > 0)
+    strength = np.ones(n)
+    for _ in range(iterations):
+        # Minorization-maximization update of the Bradley-Terry strengths
+        denominator = (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        updated = np.where(denominator > 0, scores.sum(axis=1) / np.maximum(denominator, 1e-12), strength)
+        updated /= np.exp(np.mean(np.log(updated)))
+        if np.allclose(updated, strength, rtol=1e-10):
+            strength = updated
+            break
+        strength = updated
+    ratings = 400.0 * np.log10(strength)
+    return ratings - ratings.mean() + 1500.0
+
+
+# Glicko-1 ratings and rating deviations. rounds is a list of rating periods, each a list of (i, j, score of i)
+# Everyone starts at 1500 with a deviation of 350; initial_rating and initial_deviation may also hold one value
+# per player
+def glickoRatings(n, rounds, initial_rating=1500.0, initial_deviation=350.0):
+    q = math.log(10) / 400.0
+    rating = np.full(n, initial_rating)
+    deviation = np.full(n, initial_deviation)
+    for games in rounds:
+        # Accumulate every player's games of the period against the ratings at its start
+        variance_sum = np.zeros(n)
+        score_sum = np.zeros(n)
+        for i, j, score in games:
+            for player, other, s in ((i, j, score), (j, i, 1.0 - score)):
+                g = 1.0 / math.sqrt(1.0 + 3.0 * q * q * deviation[other] ** 2 / math.pi ** 2)
+                expected = 1.0 / (1.0 + 10.0 ** (-g * (rating[player] - rating[other]) / 400.0))
+                variance_sum[player] += g * g * expected * (1.0 - expected)
+                score_sum[player] += g * (s - expected)
+        played = variance_sum > 0
+        d2 = 1.0 / (q * q * np.where(played, variance_sum, 1.0))
+        precision = 1.0 / deviation ** 2 + 1.0 / d2
+        rating = np.where(played, rating + q / precision * score_sum, rating)
+        deviation = np.where(played, np.sqrt(1.0 / precision), deviation)
+    return rating, deviation
+
+
+# ---------- Tournament ----------
+
+# Plays games_per_pair games between every pair of entrants and returns a report dictionary
+# n_workers = Number of worker processes, None for one per CPU, 0 to play in the calling process
+# root_seed = Seed of the battles and players, None for a random run
+def run_tournament(entrants, games_per_pair=100, n_workers=None, team_1_generator=pokemon.generate_team_1,
+                   team_2_generator=pokemon.generate_team_2, root_seed=0, chunk_size=10):
+    n = len(entrants)
+    pairings = list(itertools.combinations(range(n), 2))
+    tasks = [(i, j, first, min(chunk_size, games_per_pair - first), team_1_generator, team_2_generator, root_seed)
+             for i, j in pairings for first in range(0, games_per_pair, chunk_size)]
+
+    if n_workers == 0:
+        _initWorker(entrants)
+        chunks = [_playPairing(*task) for task in tasks]
+    else:
+        with mp.Pool(n_workers, initializer=_initWorker, initargs=(entrants,)) as pool:
+            chunks = pool.starmap(_playPairing, tasks)
+
+    scores = np.zeros((n, n))
+    games = np.zeros((n, n), dtype=np.int64)
+    turns = np.zeros((n, n), dtype=np.int64)
+    rounds = [[] for _ in range(games_per_pair)]
+    for (i, j, *_), chunk in zip(tasks, chunks):
+        for game, score, length in chunk:
+            scores[i, j] += score
+            scores[j, i] += 1.0 - score
+            games[i, j] += 1
+            games[j, i] += 1
+            turns[i, j] += length
+            turns[j, i] += length
+            # Game k of every pairing forms Glicko rating period k
+            rounds[game].append((i, j, score))
+
+    elo = eloRatings(scores, games)
+    glicko, deviation = glickoRatings(n, rounds)
+    players = []
+    for i, entrant in enumerate(entrants):
+        total = games[i].sum()
+        low, high = wilsonInterval(scores[i].sum(), total)
+        players.append({'name': entrant.name, 'games': int(total), 'score': float(scores[i].sum()),
+                        'win_rate': float(scores[i].sum() / total) if total else 0.0,
+                        'win_rate_interval': [low, high], 'elo': float(elo[i]),
+                        'glicko': float(glicko[i]), 'glicko_deviation': float(deviation[i])})
+    pairs = []
+    for i, j in pairings:
+        low, high = wilsonInterval(scores[i, j], games[i, j])
+        pairs.append({'player': entrants[i].name, 'opponent': entrants[j].name, 'games': int(games[i, j]),
+                      'win_rate': float(scores[i, j] / games[i, j]), 'win_rate_interval': [low, high],
+                      'mean_turns': float(turns[i, j] / games[i, j])})
+    return {'games_per_pair': games_per_pair, 'root_seed': root_seed, 'players': players, 'pairings': pairs}
+
+
+# Returns the report as a table sorted by Elo, followed by every pairing
+def format_report(report):
+    lines = ['%-20s %6s %8s %17s %8s %14s' % ('Player', 'Games', 'Win %', '95% interval', 'Elo', 'Glicko')]
+    for player in sorted(report['players'], key=lambda p: -p['elo']):
+        low, high = player['win_rate_interval']
+        lines.append('%-20s %6i %7.1f%% %7.1f%% - %5.1f%% %8.0f %7.0f +- %3.0f'
+                     % (player['name'], player['games'], player['win_rate'] * 100, low * 100, high * 100,
+                        player['elo'], player['glicko'], 2 * player['glicko_deviation']))
+    lines.append('')
+    for pair in report['pairings']:
+        low, high = pair['win_rate_interval']
+        lines.append('%-20s vs %-20s %5.1f%% (%5.1f%% - %5.1f%%) over %i games, %.1f turns'
+                     % (pair['player'], pair['opponent'], pair['win_rate'] * 100, low * 100, high * 100,
+                        pair['games'], pair['mean_turns']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Round-robin tournament between Pokemon players')
+    parser.add_argument('--models', nargs='*', default=[], help='Saved Agent models to enter, such as model_a.h5')
+    parser.add_argument('--mcts', type=int, nargs='*', default=[], help='Enter MCTS agents with these ms budgets')
+    parser.add_argument('--rollout', type=int, nargs='*', default=[],
+                        help='Enter rollout evaluators with these ms budgets')
+    parser.add_argument('--no-random', action='store_true', help='Leave out the random player')
+    parser.add_argument('--games', type=int, default=100, help='Games per pairing')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, 0 plays in this process')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the tournament')
+    parser.add_argument('--output', help='Save the report to this JSON file')
+    args = parser.parse_args()
+
+    entrants = [] if args.no_random else [randomEntrant()]
+    entrants.append(evaluatorEntrant('highest_damage', pokemon.evaluator_highest_damage_action))
+    entrants += [rolloutEntrant(ms / 1000.0) for ms in args.rollout]
+    entrants += [mctsEntrant(ms) for ms in args.mcts]
+    entrants += [modelEntrant(os.path.splitext(os.path.basename(fname))[0], fname) for fname in args.models]
+
+    report = run_tournament(entrants, games_per_pair=args.games, n_workers=args.workers, root_seed=args.seed)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,121 @@
+import os
+import sys
+import time
 import tensorflow as tf
 from matplotlib import pyplot as plt
 import numpy as np
 import pokemon
+import profiling
+import recorder
+import actor_learner
+import dataset
+import league
+import tournament
+import vec_env
 
 
 # ReplayBuffer class stores information about past events and trajectories useful for future events
+# backend = 'memory' keeps the memory in RAM
+# backend = 'mmap'   keeps the memory in memory-mapped .npy files inside directory. The files are reopened
+#                    if they already exist, so training can resume with the memory of a previous run
+# rng is the numpy Generator used for sampling, a randomly seeded one if None
 class ReplayBuffer:
-    def __init__(self, max_size, input_dims):
+    def __init__(self, max_size, input_dims, backend='memory', directory=None, rng=None, n_actions=6):
         # How many past steps of training should be held in memory?
         self.mem_size = max_size
+        self.input_dims = input_dims
+        self.n_actions = n_actions
+        self.backend = backend
+        self.directory = directory
+        self.rng = rng if rng is not None else np.random.default_rng()
         # Current offset to next memory location to write to.
         # Memory counter loops back to start when the capacity is reached
         self.mem_counter = 0
+        # Persistent copy of mem_counter, mem_size and input_dims when memory-mapped
+        self.meta_memory = None
+        resume = False
+
+        if backend == 'mmap':
+            if directory is None:
+                raise ValueError('A directory is required for the mmap ReplayBuffer backend')
+            os.makedirs(directory, exist_ok=True)
+            # Resume from the files of a previous run if they exist
+            resume = os.path.exists(os.path.join(directory, 'meta.npy'))
+            self.meta_memory = self._open('meta', (3,), np.int64, resume)
+            if resume:
+                if self.meta_memory[1] != max_size or self.meta_memory[2] != input_dims:
+                    raise ValueError('Replay memory in %s has size %i x %i, expected %i x %i'
+                                     % (directory, self.meta_memory[1], self.meta_memory[2], max_size, input_dims))
+                self.mem_counter = int(self.meta_memory[0])
+            else:
+                self.meta_memory[:] = (0, max_size, input_dims)
+        elif backend != 'memory':
+            raise ValueError('Unknown ReplayBuffer backend \'%s\'' % backend)
+
         # List that stores previous observations
-        self.state_memory = np.zeros((self.mem_size, input_dims),
-                                     dtype=np.float32)
+        self.state_memory = self._open('state_memory', (self.mem_size, input_dims), np.float32, resume)
         # List that stores new observations
-        self.new_state_memory = np.zeros((self.mem_size, input_dims),
-                                         dtype=np.float32)
+        self.new_state_memory = self._open('new_state_memory', (self.mem_size, input_dims), np.float32, resume)
         # List that stores actions that were chosen
-        self.action_memory = np.zeros(self.mem_size, dtype=np.int32)
+        self.action_memory = self._open('action_memory', (self.mem_size,), np.int32, resume)
         # List that stores rewards that were given
-        self.reward_memory = np.zeros(self.mem_size, dtype=np.float32)
+        self.reward_memory = self._open('reward_memory', (self.mem_size,), np.float32, resume)
         # List that stores game completion flags that were given in a step
-        self.doneflags_memory = np.zeros(self.mem_size, dtype=np.int32)
+        self.doneflags_memory = self._open('doneflags_memory', (self.mem_size,), np.int32, resume)
+        # List that stores the legal actions of the new states (see pokemon.legal_actions)
+        # Memories written before masks were stored get every action legal
+        mask_resume = resume and os.path.exists(os.path.join(directory, 'next_mask_memory.npy'))
+        self.next_mask_memory = self._open('next_mask_memory', (self.mem_size, n_actions), np.bool_, mask_resume)
+        if not mask_resume:
+            self.next_mask_memory[:] = True
+
+    # Creates (or reopens when resume is True) one of the memory arrays for the chosen backend
+    def _open(self, name, shape, dtype, resume):
+        if self.backend == 'memory':
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'),
+                                         mode='r+' if resume else 'w+', dtype=dtype, shape=shape)
+
+    # Writes memory-mapped arrays back to disk. Does nothing for the memory backend
+    def flush(self):
+        if self.meta_memory is None:
+            return
+        self.meta_memory[0] = self.mem_counter
+        for memory in (self.state_memory, self.new_state_memory, self.action_memory, self.reward_memory,
+                       self.doneflags_memory, self.next_mask_memory, self.meta_memory):
+            memory.flush()
 
     # Stores the 'before' and 'after' states, reward, and completion flag after a simulation step is performed
-    def store_step_transition(self, old_state, action, reward, new_state, done):
+    # next_mask holds the legal actions in the new state, None if every action is legal
+    def store_step_transition(self, old_state, action, reward, new_state, done, next_mask=None):
         index = self.mem_counter % self.mem_size
         self.state_memory[index] = old_state
         self.new_state_memory[index] = new_state
         self.reward_memory[index] = reward
         self.action_memory[index] = action
         self.doneflags_memory[index] = 1 - int(done)
+        self.next_mask_memory[index] = True if next_mask is None else next_mask
         self.mem_counter += 1
+        if self.meta_memory is not None:
+            self.meta_memory[0] = self.mem_counter
+
+    # Stores a batch of transitions at once, oldest first. Same as calling store_step_transition for each row
+    # Returns the memory indices they were written to
+    def store_transitions(self, old_states, actions, rewards, new_states, dones, next_masks=None):
+        n = len(actions)
+        # Only the last mem_size transitions of a batch larger than the memory survive
+        skip = max(0, n - self.mem_size)
+        indices = (self.mem_counter + np.arange(skip, n)) % self.mem_size
+        self.state_memory[indices] = old_states[skip:]
+        self.new_state_memory[indices] = new_states[skip:]
+        self.reward_memory[indices] = rewards[skip:]
+        self.action_memory[indices] = actions[skip:]
+        self.doneflags_memory[indices] = 1 - np.asarray(dones[skip:], dtype=np.int32)
+        self.next_mask_memory[indices] = True if next_masks is None else next_masks[skip:]
+        self.mem_counter += n
+        if self.meta_memory is not None:
+            self.meta_memory[0] = self.mem_counter
+        return indices
 
     # Returns a collection of lists, each of size batch_size, from memory
     # The lists contain past events that were stored in memory via storing step transitions
@@ -42,16 +124,122 @@ class ReplayBuffer:
         # Returns at most, the capacity of the memory
         mem_filled = min(self.mem_size, self.mem_counter)
         # Grab a random sampling of indices of size 'batch_size' with max of mem_filled
-        batch = np.random.choice(mem_filled, batch_size, replace=False)
+        batch = self.rng.choice(mem_filled, batch_size, replace=False)
 
-        # batch now contains a random list of indices that are used to pick n samples from memory
+        return self.gather(batch)
+
+    # Returns the states, actions, rewards, new states, doneflags and new state legal action masks stored at the
+    # indices in batch
+    def gather(self, batch):
+        # batch contains a list of indices that are used to pick n samples from memory
         states = self.state_memory[batch]
         new_states = self.new_state_memory[batch]
         rewards = self.reward_memory[batch]
         actions = self.action_memory[batch]
         doneflag = self.doneflags_memory[batch]
+        next_masks = self.next_mask_memory[batch]
+
+        return states, actions, rewards, new_states, doneflag, next_masks
+
+
+# Binary sum-tree over the priorities of a replay memory
+# Each node holds the sum of its two children, so tree[1] is the total priority and
+# both sampling by priority and updating a priority take O(log n)
+# Leaves start at index capacity, which is the memory size rounded up to a power of two
+class SumTree:
+    def __init__(self, size):
+        self.depth = max(1, int(np.ceil(np.log2(size))))
+        self.capacity = 1 << self.depth
+        self.tree = np.zeros(2 * self.capacity, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    # Sets the priority of a single leaf. A plain Python loop is cheaper than NumPy for one leaf
+    def update_one(self, index, priority):
+        tree = self.tree
+        node = index + self.capacity
+        tree[node] = priority
+        node //= 2
+        while node >= 1:
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+            node //= 2
+
+    # Sets the priorities of many leaves, then recomputes their ancestors one tree level at a time
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices, dtype=np.int64) + self.capacity
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    # Returns the leaf indices whose cumulative priority range contains each value in values
+    # Every value descends the tree at the same time, one level per iteration
+    def find(self, values):
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_left = values < self.tree[left]
+            values = np.where(go_left, values, values - self.tree[left])
+            nodes = np.where(go_left, left, left + 1)
+        return nodes - self.capacity
+
+
+# Replay memory that samples transitions in proportion to their priority (prioritized experience replay)
+# alpha          = How much prioritization is used, 0 is uniform sampling
+# beta           = Strength of the importance-sampling correction, annealed towards 1 by beta_increment per sample
+# priority_floor = Added to every TD error so no transition has zero chance of being sampled
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(self, max_size, input_dims, alpha=0.6, beta=0.4, beta_increment=0.001, priority_floor=1e-5,
+                 backend='memory', directory=None, rng=None, n_actions=6):
+        super().__init__(max_size, input_dims, backend=backend, directory=directory, rng=rng, n_actions=n_actions)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.priority_floor = priority_floor
+        self.priorities = SumTree(max_size)
+        # New transitions get the highest priority seen so far, so they are sampled at least once
+        self.max_priority = 1.0
+
+        # Priorities are not persisted; a resumed memory starts with every transition at max priority
+        mem_filled = min(self.mem_size, self.mem_counter)
+        if mem_filled > 0:
+            self.priorities.update(np.arange(mem_filled), np.full(mem_filled, self.max_priority))
+
+    def store_step_transition(self, old_state, action, reward, new_state, done, next_mask=None):
+        index = self.mem_counter % self.mem_size
+        super().store_step_transition(old_state, action, reward, new_state, done, next_mask)
+        self.priorities.update_one(index, self.max_priority ** self.alpha)
+
+    def store_transitions(self, old_states, actions, rewards, new_states, dones, next_masks=None):
+        indices = super().store_transitions(old_states, actions, rewards, new_states, dones, next_masks)
+        self.priorities.update(indices, np.full(len(indices), self.max_priority ** self.alpha))
+        return indices
+
+    # Returns the same lists as ReplayBuffer.sample_memory followed by the sampled memory indices and
+    # their importance-sampling weights. Pass the indices to update_priorities after learning
+    def sample_memory(self, batch_size):
+        mem_filled = min(self.mem_size, self.mem_counter)
+        total = self.priorities.total()
+
+        # Draw one value from each of batch_size equal segments of the total priority
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        batch = np.minimum(self.priorities.find(values), mem_filled - 1)
+
+        # Importance-sampling weights correct for the non-uniform sampling
+        probabilities = self.priorities.tree[batch + self.priorities.capacity] / total
+        weights = (mem_filled * probabilities) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return self.gather(batch) + (batch, weights)
 
-        return states, actions, rewards, new_states, doneflag
+    # Sets new priorities from the TD errors of the transitions at indices
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.priority_floor
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.priorities.update(indices, priorities ** self.alpha)
 
 
 # Generates a TensorFlow sequential model for training
@@ -72,9 +260,11 @@ def build_dqn(learn_rate, n_actions, input_size):
 
 
 # A class to represent the DQN agent and its hyperparameters
+# seed (an int or numpy SeedSequence) makes exploration and memory sampling reproducible
 class Agent:
     def __init__(self, learn_rate, gamma, n_actions, epsilon_start, batch_size, input_size, epsilon_decrement=0.01,
-                 epsilon_end=0.01, mem_size=1000000, fname='model.h5'):
+                 epsilon_end=0.01, mem_size=1000000, fname='model.h5', mem_backend='memory', mem_directory=None,
+                 prioritized=False, learn_every=1, gradient_steps=1, seed=None):
         self.action_space = [i for i in range(n_actions)]
         self.learn_rate = learn_rate
         self.gamma = gamma  # Discount factor for learning
@@ -85,33 +275,107 @@ class Agent:
         self.batch_size = batch_size  # Number of samples to use for learning
         self.model_file = fname  # Filename to save the trained model at end of training
         self.input_size = input_size  # Size of the observation space
-        self.memory = ReplayBuffer(mem_size, input_size)  # Stores information about past events
+        self.prioritized = prioritized  # Sample memory by TD error instead of uniformly?
+        self.rng = np.random.default_rng(seed)  # Random numbers for exploration and memory sampling
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(mem_size, input_size, backend=mem_backend, directory=mem_directory,
+                                                  rng=self.rng, n_actions=n_actions)
+        else:
+            self.memory = ReplayBuffer(mem_size, input_size, backend=mem_backend, directory=mem_directory,
+                                       rng=self.rng, n_actions=n_actions)  # Stores information about past events
         self.q_model = build_dqn(learn_rate, n_actions,
                                  input_size)  # Creates and compiles a TensorFlow sequential model
+        self.learn_every = learn_every  # Perform a training update every n calls to learn
+        self.gradient_steps = gradient_steps  # Number of minibatches trained on per update
+        self.learn_counter = 0  # Number of calls to learn once the memory holds a full batch
+        self.compile_inference()  # Compiled, warmed up inference function used by choose_actions
+        self.compile_training()  # Compiled training step used by learn
 
     # Stores the transition from old state and new state into memory
     # Memory holds what a state looked like before an action, after an action, and
     # the reward and whether the game is over (doneflag)
-    def store_step_transition(self, old_state, action, reward, new_state, doneflag):
-        self.memory.store_step_transition(old_state, action, reward, new_state, doneflag)
+    # next_mask holds the legal actions in the new state (see pokemon.legal_actions), so the Q target only
+    # considers actions that can be taken there
+    def store_step_transition(self, old_state, action, reward, new_state, doneflag, next_mask=None):
+        self.memory.store_step_transition(old_state, action, reward, new_state, doneflag, next_mask)
+
+    # Compiles a direct call of the Q model for inference and runs it once, so that the first
+    # decision does not pay for tracing. Must be called again whenever q_model is replaced
+    def compile_inference(self):
+        self.predict = compile_predictor(self.q_model, self.input_size)
 
     # Choose an action, provided an observation of the current state space
-    def choose_action(self, observation):
-        # Is this action utilizing exploration or exploitation?
-        if np.random.random() < self.epsilon:
-            # Random roll is exploration. Perform a random action
-            action = np.random.choice(self.action_space)
+    # mask holds the legal actions (see pokemon.legal_actions), None if every action is legal
+    def choose_action(self, observation, mask=None):
+        return int(self.choose_actions(observation, None if mask is None else np.asarray(mask)[np.newaxis])[0])
+
+    # Choose one action per row of observations (a single observation is treated as a batch of 1)
+    # Exploration is rolled per row; all exploiting rows are served by a single forward pass
+    # masks, if given, has one row of legal actions per observation; only legal actions are chosen
+    def choose_actions(self, observations, masks=None):
+        # A float32 observation batch (see pokemon.getState) is used without copying
+        states = np.asarray(observations, dtype=np.float32)
+        if states.ndim == 1:
+            states = states[np.newaxis]
+
+        # Is each action utilizing exploration or exploitation?
+        # Random roll is exploration. Perform a random (legal) action
+        explore = self.rng.random(len(states)) < self.epsilon
+        if masks is None:
+            actions = self.rng.integers(len(self.action_space), size=len(states))
         else:
-            # Random roll is exploitation. Utilize memory by predicting
-            # Prediction accepts a collection of observations; only 1 observation is available
-            # Simply put observation into a 1-element nested list
-            state = np.array([observation])
-            actions = self.q_model.predict(state)
-
+            actions = pokemon.random_legal_actions(masks, self.rng)
+
+        # Random roll is exploitation. Utilize memory by predicting
+        if not explore.all():
+            exploit = ~explore
+            q_values = self.predict(states if not explore.any() else states[exploit]).numpy()
+            if masks is not None:
+                q_values = pokemon.masked_q_values(q_values, masks[exploit])
             # Choose the action with the highest prediction
-            action = np.argmax(actions)
-
-        return action
+            actions[exploit] = np.argmax(q_values, axis=1)
+
+        return actions
+
+    # Compiles the training step for the current q_model. Must be called again whenever q_model is replaced
+    # One call of train_step runs every minibatch of a stacked batch inside the graph. For each minibatch it
+    # predicts the new states, builds the Q targets and applies one gradient update, which is the same update
+    # as train_on_batch with mean squared error on a target equal to q_eval except for the taken action
+    def compile_training(self):
+        model = self.q_model
+        optimizer = model.optimizer
+        # Create the optimizer's variables now; they cannot be created inside the compiled loop
+        if hasattr(optimizer, 'build'):
+            optimizer.build(model.trainable_variables)
+        gamma = self.gamma
+        n_actions = len(self.action_space)
+
+        @tf.function(input_signature=[
+            tf.TensorSpec(shape=[None, None, self.input_size], dtype=tf.float32),  # states
+            tf.TensorSpec(shape=[None, None], dtype=tf.int32),  # actions
+            tf.TensorSpec(shape=[None, None], dtype=tf.float32),  # rewards
+            tf.TensorSpec(shape=[None, None, self.input_size], dtype=tf.float32),  # new states
+            tf.TensorSpec(shape=[None, None], dtype=tf.float32),  # doneflags
+            tf.TensorSpec(shape=[None, None, n_actions], dtype=tf.bool),  # legal actions of the new states
+            tf.TensorSpec(shape=[None, None], dtype=tf.float32)])  # importance-sampling weights
+        def train_step(states, actions, rewards, new_states, doneflags, next_masks, weights):
+            n_batches = tf.shape(states)[0]
+            batch_size = tf.cast(tf.shape(states)[1], tf.float32)
+            td_errors = tf.TensorArray(tf.float32, size=n_batches)
+            for i in tf.range(n_batches):
+                # doneflag is 0 when at the terminal state, therefore only consider the reward term
+                # Only actions that are legal in the new state are considered for its value
+                q_next = tf.where(next_masks[i], model(new_states[i], training=False), -1e9)
+                q_target = rewards[i] + gamma * tf.reduce_max(q_next, axis=1) * doneflags[i]
+                with tf.GradientTape() as tape:
+                    q_eval = tf.gather(model(states[i], training=True), actions[i], batch_dims=1)
+                    loss = tf.reduce_sum(weights[i] * tf.square(q_target - q_eval)) / (batch_size * n_actions)
+                gradients = tape.gradient(loss, model.trainable_variables)
+                optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+                td_errors = td_errors.write(i, q_target - q_eval)
+            return td_errors.stack()
+
+        self.train_step = train_step
 
     def learn(self):
 
@@ -119,42 +383,101 @@ class Agent:
         if self.memory.mem_counter < self.batch_size:
             return
 
-        # Sample state step transitions from past events (memory)
-        states, actions, rewards, new_states, doneflags = self.memory.sample_memory(self.batch_size)
-
-        # Generate a list of Q values for the sampled old states
-        q_eval = self.q_model.predict(states)
-        # Generate a list of Q values for the sampled resulting new states
-        q_next = self.q_model.predict(new_states)
-        q_target = np.copy(q_eval)  # Python is weird. We want a deep copy
-        batch_index = np.arange(self.batch_size, dtype=np.int32)  # Generates list of indices from 0 to batch_size
-
-        # Generate target Q values; target represents the "direction" we want prediction estimates to gravitate towards
-        # The goal is to have Q targets converge to the best action
-        # Each element contains a target based on the action that was taken for that simulation step
-        # gamma represents how much of previous memory to consider (discount)
-        # q_next term represents the best action (i.e. the action taken using argmax) for that new state
-        # doneflag is 0 when at the terminal state, therefore only consider the reward term
-        q_target[batch_index, actions] = rewards + self.gamma * np.max(q_next, axis=1) * doneflags
-
-        # Perform training based off of the desired q targets
-        # Our goal is to have Q values gravitate towards the ideal actions
-        self.q_model.train_on_batch(states, q_target)
-
-        # Update epsilon (exploration vs exploitation)
-        if self.epsilon > self.epsilon_min:
-            self.epsilon = self.epsilon - self.epsilon_decrement
-        else:
-            self.epsilon = self.epsilon_min
+        # Only update every learn_every calls (one call is made per environment step)
+        self.learn_counter += 1
+        if self.learn_counter % self.learn_every == 0:
+            # Sample gradient_steps minibatches of state step transitions from past events (memory)
+            # Prioritized memory also returns the sampled indices and their importance-sampling weights
+            samples = [self.memory.sample_memory(self.batch_size) for _ in range(self.gradient_steps)]
+            states, actions, rewards, new_states, doneflags, next_masks = [np.stack([sample[i] for sample in samples])
+                                                                           for i in range(6)]
+            if self.prioritized:
+                weights = np.stack([sample[7] for sample in samples])
+            else:
+                weights = np.ones(rewards.shape, dtype=np.float32)
+
+            # Generate Q targets and perform training on every minibatch in one compiled call
+            # Our goal is to have Q values gravitate towards the ideal actions
+            td_errors = self.train_step(states, actions.astype(np.int32), rewards, new_states,
+                                        doneflags.astype(np.float32), next_masks, weights).numpy()
+
+            # Transitions with a large TD error are sampled more often from now on
+            if self.prioritized:
+                for sample, errors in zip(samples, td_errors):
+                    self.memory.update_priorities(sample[6], errors)
+
+    # Update epsilon (exploration vs exploitation) after steps environment steps
+    # Called per step rather than from learn, so learn_every and gradient_steps leave the schedule unchanged
+    def decay_epsilon(self, steps=1):
+        self.epsilon = max(self.epsilon_min, self.epsilon - steps * self.epsilon_decrement)
 
     # Save the TensorFlow model weights to a file using the agent's model_file member
+    # A memory-mapped replay memory is flushed as well, so training can resume from it
     def save_model(self):
         self.q_model.save(self.model_file)
+        self.memory.flush()
 
     # Load a model from the agent's model_file member
     def load_model(self):
         self.q_model = tf.keras.models.load_model(self.model_file)
         # self.q_model.load_weights(self.model_file)
+        self.compile_inference()
+        self.compile_training()
+
+
+# Returns a compiled function that calls one or more models on a batch of states, warmed up with one call
+# The models are called directly rather than through predict, which has milliseconds of overhead per call
+def compile_predictor(models, input_size):
+    spec = [tf.TensorSpec(shape=[None, input_size], dtype=tf.float32)]
+    if isinstance(models, (list, tuple)):
+        predictor = tf.function(lambda states: tuple(model(states, training=False) for model in models),
+                                input_signature=spec)
+    else:
+        predictor = tf.function(lambda states: models(states, training=False), input_signature=spec)
+    predictor(tf.zeros((1, input_size), dtype=tf.float32))
+    return predictor
+
+
+# Compiled predictors serving two Agents at once, keyed by the ids of their models
+_pair_predictors = {}
+
+
+# Chooses actions for Agent A playing Team 1 and Agent B playing Team 2 from the getState observation of
+# Team 1. Agent B is shown its own side first (see pokemon.swap_observation), like every seat 2 player
+# When neither Agent explores, both Q models are evaluated in one compiled call
+# masks, if given, is the (2, 6) array of pokemon.legal_actions: Agent A's legal actions in row 0, B's in row 1
+def choose_action_pair(agent_a, agent_b, observation, masks=None):
+    if masks is None:
+        masks = np.ones((2, len(agent_a.action_space)), dtype=bool)
+    explore_a = agent_a.rng.random() < agent_a.epsilon
+    explore_b = agent_b.rng.random() < agent_b.epsilon
+    action_a = int(pokemon.random_legal_actions(masks[0], agent_a.rng)) if explore_a else None
+    action_b = int(pokemon.random_legal_actions(masks[1], agent_b.rng)) if explore_b else None
+
+    if not explore_a and not explore_b:
+        key = (id(agent_a.q_model), id(agent_b.q_model))
+        entry = _pair_predictors.get(key)
+        # Ids can be reused once a model is freed, so check the models themselves
+        if entry is None or entry[0] is not agent_a.q_model or entry[1] is not agent_b.q_model:
+            entry = (agent_a.q_model, agent_b.q_model,
+                     compile_predictor((agent_a.q_model, agent_b.q_model), agent_a.input_size))
+            _pair_predictors[key] = entry
+        # Row 0 is Agent A's view and row 1 Agent B's; each model's answer for its own row is used
+        states = np.empty((2, len(observation)), dtype=np.float32)
+        states[0] = observation
+        pokemon.swap_observation(states[0], out=states[1])
+        q_a, q_b = entry[2](states)
+        action_a = int(np.argmax(pokemon.masked_q_values(q_a.numpy()[0], masks[0])))
+        action_b = int(np.argmax(pokemon.masked_q_values(q_b.numpy()[1], masks[1])))
+    elif not explore_a:
+        q_a = agent_a.predict(np.asarray(observation, dtype=np.float32)[np.newaxis]).numpy()[0]
+        action_a = int(np.argmax(pokemon.masked_q_values(q_a, masks[0])))
+    elif not explore_b:
+        state_b = pokemon.swap_observation(np.asarray(observation, dtype=np.float32))
+        q_b = agent_b.predict(state_b[np.newaxis]).numpy()[0]
+        action_b = int(np.argmax(pokemon.masked_q_values(q_b, masks[1])))
+
+    return action_a, action_b
 
 
 # ---------- Constants ----------
@@ -171,9 +494,18 @@ team_2_generator = pokemon.generate_team_1
 learning_rate = 0.0005
 gamma = 0.99  # Discount for Q targets in learning
 epsilon = 1.0  # Percent chance of exploring at start
-epsilon_dec = 0.002  # Amount to decrement epsilon per learning call
-
-space_size = 156  # Number of parameters in the observation space
+epsilon_dec = 0.002  # Amount to decrement epsilon per environment step
+
+# Observations of train()
+#    None     = pokemon.getState builds the whole observation every turn
+#    Not None = A pokemon.ObservationEncoder, such as pokemon.ObservationEncoder(normalize=True, one_hot_types=True),
+#               encodes the fixed team data once per game and writes only the 12 changing fields each turn.
+#               play() shows saved models the same encoding. The actor-learner, league and offline modes only
+#               support getState observations and raise a ValueError if this is set
+observation_encoder = None
+
+# Number of parameters in the observation space
+space_size = pokemon.state_size if observation_encoder is None else observation_encoder.size
 action_size = 6  # Number of actions that can be performed by the player
 
 # Simulation Operation Switches
@@ -195,10 +527,14 @@ train_a = True
 #    Not None = AI Agent will train or play against an opponent that picks its move
 #               defined by the given function. If training, the AI will not switch
 #               training to the opponent, since it is an evaluation function
+#               Evaluator functions are called with (team, opponent) and return an action from 0 to 5.
+#               For a stronger opponent use rollout.RolloutEvaluator(n_workers=4, time_budget=0.02)
+#               or mcts.MCTSAgent(time_budget_ms=50)
 evaluator_function = pokemon.evaluator_highest_damage_action
 
 # --- Playing ---
 play_ai = True  # Set to True if you should verse the AI instead of training
+gameboy_text = True  # Print battle text one character at a time? False prints it instantly
 
 # If playing, play as Player A.
 # If an Evaluator Function is defined, player_a represents
@@ -209,6 +545,75 @@ save_model = True  # Overwrite saved model file at end of training?
 save_plot = True  # Save a plot of the scores?
 score_range = 5.0  # Maximum value to show when plotting scores (or outputting to console)
 
+# Where Agents keep their replay memory
+#    None     = Replay memory is kept in RAM and lost when the process exits
+#    Not None = Replay memory is memory-mapped from files in a sub-directory per model. Existing
+#               files are reopened, so training resumes with the memory of the previous run
+replay_directory = None
+
+# Should Agents sample their replay memory by priority (TD error) instead of uniformly?
+prioritized_replay = False
+
+# Per-phase timing of the training loop
+profile_training = False  # Time team generation, choose_actions, step, store_step_transition and learn?
+profile_window = 100  # Number of episodes in the rolling timing summary
+profile_print_every = 10  # Print the rolling timing summary every n episodes
+# Every episode's timings are appended to <profile_file>.csv as it ends; the totals and the rolling summary are
+# exported to <profile_file>.json at the end of training
+profile_file = 'training_profile'
+
+# Update-to-data ratio: every learn_every environment steps, train on gradient_steps minibatches
+learn_every = 1
+gradient_steps = 1
+
+# Seed of the whole run
+#    None     = Every run is different
+#    Not None = TensorFlow, both Agents and every game get their own stream derived from this seed, so a run
+#               can be repeated exactly and any single game can be replayed with pokemon.gameSeed(root_seed, game)
+root_seed = None
+
+# Battle log of train()
+#    None     = Games are not recorded
+#    Not None = Every turn is appended to <record_file>.turns and every game to <record_file>.index, see
+#               recorder.BattleLog to read them back
+record_file = None
+
+# Actor-learner training (see train_actor_learner)
+#    True  = Player A is trained by a learner while n_actors processes play games with a NumPy copy of its
+#            Q network. Player B is evaluator_function, or a copy of Player A if it is None
+#    False = train() plays and learns in turns on one thread
+actor_learner_mode = False
+n_actors = 4
+actor_sync_every = 64  # Steps between an actor's checks for new weights
+actor_ring_capacity = 4096  # Transitions an actor can get ahead of the learner before actor_ring_policy applies
+# What an actor does with a full ring: 'overwrite' its oldest unread transition, 'drop' the new one, or 'block'
+# until the learner catches up (see actor_learner.TransitionRing)
+actor_ring_policy = 'overwrite'
+# Replay ratio of the learner
+#    None     = The learner calls learn continuously, as fast as it can, however many transitions arrive
+#    Not None = The learner calls learn at most this many times per transition received so far
+actor_replay_ratio = None
+publish_every = 100  # Training updates between two publications of the weights to the actors
+
+# Self-play league (see train_league)
+#    True  = Player A plays many games at once against frozen checkpoints of itself sampled from a pool
+#    False = Self-play hands training back and forth between two Agents every switch_games games
+league_mode = False
+league_pool_size = 20  # Checkpoints kept in the pool
+league_snapshot_every = 500  # Training updates between two checkpoints of Player A
+league_workers = 2  # Processes stepping the games in flight
+league_games_per_worker = 16
+league_seed_models = []  # Saved models (such as 'model_b.h5') loaded into the pool once at the start
+
+# Offline training (see train_offline)
+#    None     = Games are simulated while training
+#    Not None = Player A learns from the transitions of this dataset directory (see dataset.generate_dataset)
+#               without playing, and is evaluated against evaluator_function along the way
+offline_directory = None
+offline_updates = 100000  # Calls of learn; each trains like one environment step in train()
+offline_eval_every = 10000  # Updates between two evaluations
+offline_eval_games = 50
+
 
 # Switch which Agent is actively training
 def switch_training():
@@ -217,10 +622,23 @@ def switch_training():
 
 
 # Generates a DQN Agent from global parameters
-def make_agent(fname):
+# agent_index picks the Agent's random stream when root_seed is set (0 for model A, 1 for model B)
+def make_agent(fname, agent_index=0):
+    mem_directory = None if replay_directory is None else os.path.join(replay_directory, os.path.splitext(fname)[0])
     return Agent(gamma=gamma, epsilon_start=epsilon, learn_rate=learning_rate,
                  input_size=space_size, n_actions=action_size,
-                 mem_size=10000, batch_size=64, epsilon_end=0.01, epsilon_decrement=epsilon_dec, fname=fname)
+                 mem_size=10000, batch_size=64, epsilon_end=0.01, epsilon_decrement=epsilon_dec, fname=fname,
+                 mem_backend='memory' if replay_directory is None else 'mmap', mem_directory=mem_directory,
+                 prioritized=prioritized_replay, learn_every=learn_every, gradient_steps=gradient_steps,
+                 seed=None if root_seed is None else np.random.SeedSequence(root_seed, spawn_key=(1, agent_index)))
+
+
+# Raises a ValueError if observation_encoder is set; mode names a training mode whose actors, opponents or
+# dataset only produce pokemon.getState observations, which an encoder-sized network cannot read
+def check_state_observations(mode):
+    if observation_encoder is not None:
+        raise ValueError('%s only supports pokemon.getState observations of size %i; set observation_encoder '
+                         'to None to use it' % (mode, pokemon.state_size))
 
 
 # Generates a matplotlib plot based on Game Scores for both Player A and Player B
@@ -242,18 +660,25 @@ def plot(x_data, y_data, filename, title='', x_label='X Axis', y_label='Y Axis',
 
 # Chooses an action for Team A and Team B, given an observation of the environment.
 # The actions chosen consider if an Evaluator Function is defined.
+# Agents only choose among the legal actions of their team (see pokemon.legal_actions)
+# observation is Team A's view; Model B plays Team B and is shown the board from Team B's side
 # Returns action A, action B
 def choose_actions(team_a, team_b, observation, agent_is_a, model_a=None, model_b=None):
+    masks = pokemon.legal_actions(team_a, team_b)
+    # Both seats are Agents; serve them together
+    if evaluator_function is None:
+        return choose_action_pair(model_a, model_b, observation, masks)
+
     # Choose actions for both teams
     if evaluator_function is None or agent_is_a:
-        action_a = model_a.choose_action(observation)  # Choose with Agent A
+        action_a = model_a.choose_action(observation, masks[0])  # Choose with Agent A
     elif evaluator_function is not None and not agent_is_a:
-        action_a = evaluator_function(team_a)  # Use Evaluator Function for Player A
+        action_a = evaluator_function(team_a, team_b)  # Use Evaluator Function for Player A
 
     if evaluator_function is None or not agent_is_a:
-        action_b = model_b.choose_action(observation)  # Choose with Agent B
+        action_b = model_b.choose_action(pokemon.swap_observation(observation), masks[1])  # Choose with Agent B
     elif evaluator_function is not None and agent_is_a:
-        action_b = evaluator_function(team_b)  # Use Evaluator Function for Player B
+        action_b = evaluator_function(team_b, team_a)  # Use Evaluator Function for Player B
 
     return action_a, action_b
 
@@ -268,8 +693,8 @@ def play(verse_evaluator: bool = False):
         print('Agent Evaluator vs Model %c' % ('B' if player_a else 'A'))
 
     fname = 'model_b.h5' if player_a else 'model_a.h5'
-    model_a = make_agent(fname) if not player_a else None
-    model_b = make_agent(fname) if player_a else None
+    model_a = make_agent(fname, 0) if not player_a else None
+    model_b = make_agent(fname, 1) if player_a else None
 
     wins = [0, 0]  # Accumulate wins for A and B
 
@@ -280,22 +705,32 @@ def play(verse_evaluator: bool = False):
     except:
         print('Model %c could not be loaded -- playing against random AI' % ('A' if model_a is not None else 'B'))
 
+    # Generate teams
+    team_a = team_1_generator()
+    team_b = team_2_generator()
+
     for current_game in range(num_games):
         print('Game Number %i. %s Playing as Player %c' % (current_game + 1,
                                                             ('The Evaluator is' if verse_evaluator else 'You are'),
                                                             ('A' if player_a else 'B'),
                                                             ))
-        # Generate teams
-        team_a = team_1_generator()
-        team_b = team_2_generator()
+        # Restore the teams to their starting state
+        team_a.reset()
+        team_b.reset()
+        pokemon.seatTeams(team_a, team_b)
+        # Models trained with an encoder are shown the same encoding
+        if observation_encoder is not None:
+            observation_encoder.reset(team_a, team_b)
 
         if verse_evaluator:
             done = False  # Is this game over?
             score_a = 0
             score_b = 0
             while not done:
-                action_a, action_b = choose_actions(team_a, team_b, pokemon.getState(team_a, team_b),
-                                                    not player_a, model_a=model_a, model_b=model_b)
+                state = pokemon.getState(team_a, team_b) if observation_encoder is None else \
+                    observation_encoder.encode(team_a, team_b)
+                action_a, action_b = choose_actions(team_a, team_b, state, not player_a, model_a=model_a,
+                                                    model_b=model_b)
 
                 observation, reward, done = pokemon.step(team_a, team_b, action_a + 1, action_b + 1)
 
@@ -312,7 +747,17 @@ def play(verse_evaluator: bool = False):
             wins[1] += 1 if team_b.hasAvailablePokemon else 0
         else:
             # Play the game, let the simulation know that it's going to get input from the AI
-            pokemon.battleSim(team_a, team_b, ai=(model_a if model_a is not None else model_b), ai_is_a=not player_a)
+            renderer = pokemon.GameboyRenderer() if gameboy_text else pokemon.HeadlessRenderer(sys.stdout)
+            model = model_a if model_a is not None else model_b
+            player = pokemon.agentPlayer(model)
+            if observation_encoder is not None:
+                # The encoder was reset for Team A first; Model B sees its own side first
+                player = lambda team, opponent, observation: model.choose_action(
+                    observation_encoder.encode(team_a, team_b) if team is team_a else
+                    pokemon.swap_observation(observation_encoder.encode(team_a, team_b)),
+                    pokemon.teamLegalActions(team))
+            pokemon.battleSim(team_a, team_b, renderer=renderer, player1=None if player_a else player,
+                              player2=player if player_a else None)
             wins[0] += 1 if team_a.hasAvailablePokemon else 0
             wins[1] += 1 if team_b.hasAvailablePokemon else 0
 
@@ -326,59 +771,103 @@ def train():
     if evaluator_function is not None:
         print('Training Player %c against evaluator function' % ('A' if train_a else 'B'))
 
+    # Seed Python, NumPy and TensorFlow (weight initialization) before any model is built
+    if root_seed is not None:
+        tf.keras.utils.set_random_seed(root_seed)
+
     # Create models for player A and B
     if evaluator_function is None or train_a:
         # Create model A if not training against an evaluator OR we *are* and training Player A
-        model_a = make_agent(fname='model_a.h5')
+        model_a = make_agent(fname='model_a.h5', agent_index=0)
 
     if evaluator_function is None or not train_a:
-        model_b = make_agent(fname='model_b.h5')
+        model_b = make_agent(fname='model_b.h5', agent_index=1)
 
     # Keep track of scores for informative output and plotting
     scores = []
     avg_scores = []
 
+    # Create the teams once; every game restores them in place
+    team_a = team_1_generator()
+    team_b = team_2_generator()
+
+    # Observations are written into these two preallocated rows, which swap roles every turn
+    observation = np.zeros(space_size, dtype=np.float32)
+    new_observation = np.zeros(space_size, dtype=np.float32)
+    # Model B plays Team B and learns from Team B's side of the board, see pokemon.swap_observation
+    observation_b = np.zeros(space_size, dtype=np.float32)
+    new_observation_b = np.zeros(space_size, dtype=np.float32)
+
+    # Times each phase of the loop; does nothing when profiling is switched off
+    timer = profiling.PhaseTimer(['team_generation', 'choose_actions', 'step', 'store_step_transition', 'learn'],
+                                 enabled=profile_training, window=profile_window,
+                                 csv_file=profile_file + '.csv')
+
+    battle_recorder = recorder.Recorder(record_file) if record_file is not None else None
+
     # Play n games
     for current_game in range(num_games):
         done = False  # Is this game over?
         score_a = 0
         score_b = 0
+        timer.begin()
 
-        # Create a new instance of the pokemon game simulator (RESET)
-        # TODO: This may be pretty slow
-        team_a = team_1_generator()
-        team_b = team_2_generator()
+        # Restore the pokemon game simulator to its starting state (RESET)
+        team_a.reset()
+        team_b.reset()
+        pokemon.seatTeams(team_a, team_b)
+        rng = pokemon.BattleRNG(pokemon.gameSeed(root_seed, current_game)) if root_seed is not None else None
 
         # Observation is 'old observation' before actions are performed
-        observation = pokemon.getState(team_a, team_b)
+        if observation_encoder is not None:
+            observation_encoder.reset(team_a, team_b)
+            observation_encoder.encode(team_a, team_b, out=observation)
+        else:
+            pokemon.getState(team_a, team_b, out=observation)
+        timer.lap('team_generation')
 
         while not done:
 
             # Choose actions for each team. This takes into consideration the Evaluator Function
             action_a, action_b = choose_actions(team_a, team_b, observation, train_a,
                                                 model_a=model_a, model_b=model_b)
+            timer.lap('choose_actions')
 
             # Perform a simulation step using the chosen actions
-            new_observation, reward, done = pokemon.step(team_a, team_b, action_a + 1, action_b + 1)
+            _, reward, done = pokemon.step(team_a, team_b, action_a + 1, action_b + 1, out=new_observation, rng=rng,
+                                           recorder=battle_recorder, encoder=observation_encoder)
             # print('%.2f %.2f %i %i' % (reward[0], reward[1], action_a, action_b))
+            timer.lap('step')
+            timer.count('turns')
 
             # Accumulate game total scores from reward
             score_a += reward[0]
             score_b += reward[1]
 
-            # Store what we learned into Agents' memories
+            # Store what we learned into Agents' memories, with the actions each team can take next
+            next_masks = pokemon.legal_actions(team_a, team_b)
             if evaluator_function is None or train_a:
-                model_a.store_step_transition(observation, action_a, reward[0], new_observation, done)
+                model_a.store_step_transition(observation, action_a, reward[0], new_observation, done, next_masks[0])
 
             if evaluator_function is None or not train_a:
-                model_b.store_step_transition(observation, action_b, reward[1], new_observation, done)
+                pokemon.swap_observation(observation, out=observation_b)
+                pokemon.swap_observation(new_observation, out=new_observation_b)
+                model_b.store_step_transition(observation_b, action_b, reward[1], new_observation_b, done,
+                                              next_masks[1])
 
             # Old observation now takes on new value -- used for next loop iteration
-            observation = new_observation
+            # The memories copied the rows, so the old row can be overwritten by the next step
+            observation, new_observation = new_observation, observation
+            timer.lap('store_step_transition')
 
             # Perform learning on the AI that's actively training
             # Q values will be generated and used to find Q target
-            model_a.learn() if train_a else model_b.learn()
+            training_model = model_a if train_a else model_b
+            training_model.learn()
+            training_model.decay_epsilon()
+            timer.lap('learn')
+
+        timer.end_episode()
 
         # Increment or switch who is training
         # Switching should not happen when training against and evaluator function
@@ -406,6 +895,17 @@ def train():
               '[average_score (%.2f, %.2f)]' % (avg_score[0], avg_score[1]),
               '[epsilon %.2f]' % _epsilon)
 
+        if profile_training and (current_game + 1) % profile_print_every == 0:
+            print('[Timing over last %i episodes]' % len(timer.recent),
+                  profiling.format_summary(timer.rolling_summary()))
+
+    if battle_recorder is not None:
+        battle_recorder.close()
+
+    if profile_training:
+        print('Saving timings to %s.json...' % profile_file)
+        timer.export_json(profile_file + '.json')
+        timer.close()
 
     if save_model:
         print('Saving models to file...')
@@ -420,8 +920,266 @@ def train():
         plot([x for x in range(num_games)], avg_scores, filename='scores_plot', x_label='Game Number', y_label='Score')
 
 
+# Actor-learner variant of train()
+# Actor processes play the games and push transitions into shared memory rings. This process drains them into
+# the replay memory and trains continuously in between: every iteration of its loop calls learn once, so the
+# number of gradient steps does not depend on how many transitions arrive (see actor_replay_ratio to cap it).
+# learn_every and gradient_steps apply per learn call, and epsilon decays per transition received, like per
+# environment step in train(). Actors do not wait for the learner unless actor_ring_policy is 'block'
+def train_actor_learner():
+    check_state_observations('The actor-learner mode')
+    print('Training Player A with %i actors against %s' %
+          (n_actors, 'itself' if evaluator_function is None else 'the evaluator function'))
+    if root_seed is not None:
+        tf.keras.utils.set_random_seed(root_seed)
+
+    model_a = make_agent(fname='model_a.h5', agent_index=0)
+    weights = actor_learner.SharedWeights([w.shape for w in model_a.q_model.get_weights()])
+    weights.publish(model_a.q_model.get_weights(), model_a.epsilon)
+    processes, rings, stop, stats = actor_learner.start_actors(
+        n_actors, weights, team_1_generator, team_2_generator, evaluator_function, ring_capacity=actor_ring_capacity,
+        sync_every=actor_sync_every, seed=root_seed, score_range=score_range, ring_policy=actor_ring_policy)
+
+    # One timing episode covers the iterations between two progress reports
+    timer = profiling.PhaseTimer(['drain', 'learn', 'publish'], enabled=profile_training, window=profile_window,
+                                 csv_file=profile_file + '.csv')
+    published = 0  # learn_counter at the last publication
+    reported = 0  # Episodes finished at the last progress report
+    transitions = 0
+    updates = 0  # Calls of learn with a full batch in memory
+    start = time.perf_counter()
+    timer.begin()
+    try:
+        while stats.totals()[0] < num_games:
+            received = 0
+            for ring in rings:
+                batch = ring.drain()
+                if batch is not None:
+                    model_a.memory.store_transitions(*batch)
+                    received += len(batch[1])
+            transitions += received
+            model_a.decay_epsilon(received)
+            actor_learner.check_actors(processes)
+            timer.lap('drain')
+
+            if model_a.memory.mem_counter >= model_a.batch_size and \
+                    (actor_replay_ratio is None or updates < actor_replay_ratio * transitions):
+                model_a.learn()
+                updates += 1
+            elif received == 0:
+                # Nothing to learn from yet, or the replay ratio is reached; wait for the actors
+                time.sleep(0.0005)
+            timer.lap('learn')
+
+            if model_a.learn_counter - published >= publish_every:
+                weights.publish(model_a.q_model.get_weights(), model_a.epsilon)
+                published = model_a.learn_counter
+            timer.lap('publish')
+
+            episodes, score_sum, turns = stats.totals()
+            if episodes - reported >= profile_print_every:
+                reported = episodes
+                elapsed = time.perf_counter() - start
+                print('[Episode %i/%i]' % (episodes, num_games),
+                      '[average_score %.2f]' % (score_sum / episodes),
+                      '[average_turns %.1f]' % (turns / episodes),
+                      '[%.0f transitions/s]' % (transitions / elapsed),
+                      '[%.0f updates/s]' % (updates / elapsed),
+                      '[%i dropped]' % sum(ring.dropped.value for ring in rings),
+                      '[epsilon %.2f]' % model_a.epsilon)
+                timer.end_episode()
+                if profile_training:
+                    print('[Learner timing over last %i reports]' % len(timer.recent),
+                          profiling.format_summary(timer.rolling_summary()))
+                timer.begin()
+    finally:
+        stop.value = 1
+        for process in processes:
+            process.join()
+    timer.end_episode()
+
+    if profile_training:
+        print('Saving timings to %s.json...' % profile_file)
+        timer.export_json(profile_file + '.json')
+        timer.close()
+
+    if save_model:
+        print('Saving model to file...')
+        model_a.save_model()
+
+
+# Offline variant of train()
+# Player A's memory is replaced by the shards of offline_directory, so every learn call samples minibatches from
+# the dataset and no game is simulated for training. Every offline_eval_every updates Player A plays
+# offline_eval_games greedy games against evaluator_function to show progress
+def train_offline():
+    check_state_observations('Offline training')
+    if root_seed is not None:
+        tf.keras.utils.set_random_seed(root_seed)
+
+    model_a = make_agent(fname='model_a.h5', agent_index=0)
+    # The dataset has no priorities; it is sampled uniformly
+    model_a.memory = dataset.ShardedDataset(offline_directory, rng=model_a.rng)
+    model_a.prioritized = False
+    print('Training Player A offline on %i transitions from %s' % (len(model_a.memory), offline_directory))
+
+    team_a = team_1_generator()
+    team_b = team_2_generator()
+    observation = np.zeros(space_size, dtype=np.float32)
+    player_a = pokemon.agentPlayer(model_a)
+    player_b = pokemon.evaluatorPlayer(evaluator_function) if evaluator_function is not None else None
+
+    # Times the updates and evaluations; one timing episode covers an evaluation interval
+    timer = profiling.PhaseTimer(['learn', 'evaluate'], enabled=profile_training, window=profile_window,
+                                 csv_file=profile_file + '.csv')
+    evaluations = []
+    timer.begin()
+    for update in range(1, offline_updates + 1):
+        model_a.learn()
+        timer.lap('learn')
+        timer.count('updates')
+        if update % offline_eval_every != 0 and update != offline_updates:
+            continue
+
+        if player_b is not None:
+            # Evaluate greedily, then restore the exploration schedule
+            epsilon = model_a.epsilon
+            model_a.epsilon = 0.0
+            score = 0.0
+            for game in range(offline_eval_games):
+                rng = None if root_seed is None else \
+                    pokemon.BattleRNG(np.random.SeedSequence(root_seed, spawn_key=(6, game)))
+                score += tournament.playGame(player_a, player_b, team_a, team_b, rng, observation)[0]
+            model_a.epsilon = epsilon
+            evaluations.append((update, score / offline_eval_games))
+            timer.lap('evaluate')
+            print('[Update %i/%i]' % (update, offline_updates),
+                  '[win rate against the evaluator over %i games %.2f]' % (offline_eval_games, evaluations[-1][1]))
+        timer.end_episode()
+        if profile_training:
+            print('[Timing over last %i evaluation intervals]' % len(timer.recent),
+                  profiling.format_summary(timer.rolling_summary()))
+        timer.begin()
+
+    if profile_training:
+        print('Saving timings to %s.json...' % profile_file)
+        timer.export_json(profile_file + '.json')
+        timer.close()
+
+    if save_model:
+        print('Saving model to file...')
+        model_a.save_model()
+
+    if save_plot and evaluations:
+        print('Saving plot...')
+        plot([update for update, _ in evaluations], [[e, 1.0 - e] for _, e in evaluations], 'offline_plot',
+             x_label='Update', y_label='Win Rate', legend=['Player A', 'Evaluator'])
+
+
+# League variant of train()
+# Player A plays league_workers * league_games_per_worker games at once in a VecEnv. Every game's opponent is
+# a checkpoint sampled from the pool by Player A's win rate against it, evaluated from the shared NumPy weights
+# of the inference cache. Player A learns once per transition, like in train()
+def train_league():
+    check_state_observations('The league mode')
+    if root_seed is not None:
+        tf.keras.utils.set_random_seed(root_seed)
+
+    model_a = make_agent(fname='model_a.h5', agent_index=0)
+    pool = league.CheckpointPool(league_pool_size)
+    cache = league.InferenceCache(pool)
+    rng = np.random.default_rng(None if root_seed is None else np.random.SeedSequence(root_seed, spawn_key=(5,)))
+    # Saved models are loaded once; from then on only their weights are used
+    for fname in league_seed_models:
+        pool.add(os.path.splitext(os.path.basename(fname))[0], tf.keras.models.load_model(fname).get_weights())
+    pool.add('model_a_0', model_a.q_model.get_weights())
+    next_snapshot = league_snapshot_every
+
+    timer = profiling.PhaseTimer(['choose_actions', 'step', 'store_step_transition', 'learn'],
+                                 enabled=profile_training, window=profile_window,
+                                 csv_file=profile_file + '.csv')
+    recent_scores = []  # Player A's scores in the last 100 games
+    episodes = 0
+    reported = 0
+    env = vec_env.VecEnv(league_workers, league_games_per_worker, team_1_generator, team_2_generator,
+                         root_seed=root_seed)
+    print('League training of Player A over %i games in flight' % env.n_games)
+    try:
+        observations = env.reset()
+        swapped = np.empty_like(observations)  # Team 2's view of every game, for the checkpoints playing it
+        opponents = [pool.sample(rng) for _ in range(env.n_games)]
+        while episodes < num_games:
+            timer.begin()
+            masks = pokemon.observation_legal_actions(observations)
+            actions_a = model_a.choose_actions(observations, masks[:, 0])
+            # Checkpoints of Player A learned to play Team 1, so they are shown the board from Team 2's side
+            actions_b = cache.choose_actions(opponents, pokemon.swap_observation(observations, out=swapped),
+                                             masks[:, 1])
+            timer.lap('choose_actions')
+
+            new_observations, rewards, dones = env.step(actions_a + 1, actions_b + 1)
+            # Finished games were already reset; learn from their final observation instead
+            next_states = new_observations.copy()
+            next_states[dones] = env.terminal_observations[dones]
+            timer.lap('step')
+
+            model_a.memory.store_transitions(observations, actions_a, rewards[:, 0], next_states, dones,
+                                             pokemon.observation_legal_actions(next_states)[:, 0])
+            timer.lap('store_step_transition')
+
+            for _ in range(env.n_games):
+                model_a.learn()
+            model_a.decay_epsilon(env.n_games)
+            timer.lap('learn')
+            timer.end_episode()
+
+            for game in np.flatnonzero(dones):
+                score = league.observationScore(next_states[game])
+                pool.record(opponents[game], score)
+                recent_scores = recent_scores[-99:] + [score]
+                opponents[game] = pool.sample(rng)
+                episodes += 1
+
+            if model_a.learn_counter >= next_snapshot:
+                pool.add('model_a_%i' % model_a.learn_counter, model_a.q_model.get_weights())
+                next_snapshot += league_snapshot_every
+            observations = new_observations
+
+            if episodes - reported >= profile_print_every:
+                reported = episodes
+                print('[Episode %i/%i]' % (episodes, num_games),
+                      '[win rate over last %i games %.2f]' % (len(recent_scores), np.mean(recent_scores)),
+                      '[pool size %i]' % len(pool),
+                      '[epsilon %.2f]' % model_a.epsilon)
+                if profile_training:
+                    print('[Timing over last %i steps]' % len(timer.recent),
+                          profiling.format_summary(timer.rolling_summary()))
+    finally:
+        env.close()
+
+    print('Player A against the pool:')
+    for name, games, win_rate in pool.summary():
+        print('  %-20s %6i games, win rate %.2f' % (name, games, win_rate))
+
+    if profile_training:
+        print('Saving timings to %s.json...' % profile_file)
+        timer.export_json(profile_file + '.json')
+        timer.close()
+
+    if save_model:
+        print('Saving model to file...')
+        model_a.save_model()
+
+
 if __name__ == '__main__':
     if not play_ai:
-        train()
+        if offline_directory is not None:
+            train_offline()
+        elif league_mode:
+            train_league()
+        elif actor_learner_mode:
+            train_actor_learner()
+        else:
+            train()
     else:
         play(evaluator_function is not None)
@@ -0,0 +1,241 @@
+# Multi-process vectorized environment around pokemon.step
+# A pool of worker processes each owns a block of games and steps them whenever actions are sent.
+# Observations, rewards and done flags are written into shared memory, so the caller reads
+# them as stacked NumPy arrays instead of receiving pickled lists.
+#
+# Actions use the same 1 to 6 numbering as pokemon.step. Games are reset automatically when
+# pokemon.isGameOver fires; the observation that ended the game is kept in terminal_observations.
+#
+# With a root_seed, the k-th game played in slot i draws from pokemon.gameSeed(root_seed, i + k * n_games),
+# so a run is reproducible no matter how the slots are spread over workers.
+#
+# An exception raised in a worker (by a team generator or pokemon.step) is sent back over its pipe and raised
+# again in the calling process, with the worker's traceback as its cause.
+
+import multiprocessing as mp
+import pickle
+import traceback
+import numpy as np
+import pokemon
+
+state_size = pokemon.state_size  # Number of parameters returned by pokemon.getState
+
+
+# Shared memory blocks backing the stacked arrays of a VecEnv
+class SharedBuffers:
+    def __init__(self, n_games):
+        self.n_games = n_games
+        self.observations = mp.RawArray('f', n_games * state_size)
+        self.terminal_observations = mp.RawArray('f', n_games * state_size)
+        self.rewards = mp.RawArray('f', n_games * 2)
+        self.dones = mp.RawArray('b', n_games)
+        self.actions = mp.RawArray('i', n_games * 2)
+
+    # Returns NumPy views of the shared blocks: observations, terminal observations, rewards, dones, actions
+    def arrays(self):
+        return (np.frombuffer(self.observations, dtype=np.float32).reshape(self.n_games, state_size),
+                np.frombuffer(self.terminal_observations, dtype=np.float32).reshape(self.n_games, state_size),
+                np.frombuffer(self.rewards, dtype=np.float32).reshape(self.n_games, 2),
+                np.frombuffer(self.dones, dtype=np.int8),
+                np.frombuffer(self.actions, dtype=np.int32).reshape(self.n_games, 2))
+
+
+# A block of games stepped by one worker (or in-process when running synchronously)
+class GameBlock:
+    def __init__(self, first, count, team_1_generator, team_2_generator, buffers, root_seed=None):
+        self.first = first
+        self.count = count
+        self.n_games = buffers.n_games
+        self.root_seed = root_seed
+        self.rngs = [None] * count  # BattleRNG of the game in each slot, None uses pokemon.default_rng
+        self.played = [0] * count  # Number of games started in each slot
+        self.observations, self.terminal_observations, self.rewards, self.dones, self.actions = buffers.arrays()
+        # Teams are built once and restored in place whenever a game starts over
+        self.games = [(team_1_generator(), team_2_generator()) for _ in range(count)]
+
+    # Restarts every game in the block and writes their observations
+    def reset(self):
+        for i in range(self.count):
+            self._reset_game(i)
+        self.rewards[self.first:self.first + self.count] = 0
+        self.dones[self.first:self.first + self.count] = 0
+
+    def _reset_game(self, i):
+        team_1, team_2 = self.games[i]
+        team_1.reset()
+        team_2.reset()
+        if self.root_seed is not None:
+            game_index = self.first + i + self.played[i] * self.n_games
+            self.rngs[i] = pokemon.BattleRNG(pokemon.gameSeed(self.root_seed, game_index))
+        self.played[i] += 1
+        pokemon.getState(team_1, team_2, out=self.observations[self.first + i])
+
+    # Steps every game in the block with the actions found in shared memory
+    def step(self):
+        for i in range(self.count):
+            index = self.first + i
+            team_1, team_2 = self.games[i]
+            action_1, action_2 = self.actions[index]
+            observation, reward, done = pokemon.step(team_1, team_2, int(action_1), int(action_2),
+                                                     out=self.observations[index], rng=self.rngs[i])
+            self.rewards[index] = reward
+            self.dones[index] = done
+            if done:
+                # Keep the final observation for the caller, then start a new game in this slot
+                self.terminal_observations[index] = observation
+                self._reset_game(i)
+
+
+# Traceback of an exception raised in a worker process, attached as the cause of the exception raised again
+# by VecEnv
+class WorkerTraceback(Exception):
+    def __init__(self, text):
+        super().__init__(text)
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+
+# Returns what a worker sends back for error: the exception and its formatted traceback
+# An exception that cannot be pickled is replaced by a RuntimeError naming it
+def _workerError(error):
+    text = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = RuntimeError(repr(error))
+    return error, text
+
+
+# Entry point of a worker process. Waits for commands sent over the pipe and answers each with None, or with
+# the exception it raised (see _workerError). The worker keeps answering after an exception, so the caller can
+# still close it; if building its games failed, every command gets that exception
+def _worker(remote, first, count, team_1_generator, team_2_generator, buffers, root_seed):
+    try:
+        block = GameBlock(first, count, team_1_generator, team_2_generator, buffers, root_seed)
+        setup_error = None
+    except Exception as error:
+        block = None
+        setup_error = _workerError(error)
+    try:
+        while True:
+            command = remote.recv()
+            if command == 'close':
+                break
+            if block is None:
+                remote.send(setup_error)
+                continue
+            try:
+                if command == 'step':
+                    block.step()
+                elif command == 'reset':
+                    block.reset()
+            except Exception as error:
+                remote.send(_workerError(error))
+                continue
+            remote.send(None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+# Vectorized environment of n_workers * games_per_worker games
+# asynchronous = True  runs every block of games in its own worker process
+# asynchronous = False steps the blocks one after another in the calling process
+class VecEnv:
+    def __init__(self, n_workers, games_per_worker, team_1_generator=pokemon.generate_team_1,
+                 team_2_generator=pokemon.generate_team_2, asynchronous=True, root_seed=None):
+        self.n_workers = n_workers
+        self.games_per_worker = games_per_worker
+        self.n_games = n_workers * games_per_worker
+        self.asynchronous = asynchronous
+        self.waiting = False
+        self.closed = False
+
+        self.buffers = SharedBuffers(self.n_games)
+        self.observations, self.terminal_observations, self.rewards, self.dones, self.actions = \
+            self.buffers.arrays()
+
+        if asynchronous:
+            self.remotes = []
+            self.processes = []
+            for worker in range(n_workers):
+                remote, worker_remote = mp.Pipe()
+                process = mp.Process(target=_worker, daemon=True,
+                                     args=(worker_remote, worker * games_per_worker, games_per_worker,
+                                           team_1_generator, team_2_generator, self.buffers, root_seed))
+                process.start()
+                worker_remote.close()
+                self.remotes.append(remote)
+                self.processes.append(process)
+        else:
+            self.blocks = [GameBlock(worker * games_per_worker, games_per_worker, team_1_generator,
+                                     team_2_generator, self.buffers, root_seed) for worker in range(n_workers)]
+
+    def _send(self, command):
+        if self.asynchronous:
+            for remote in self.remotes:
+                remote.send(command)
+        else:
+            for block in self.blocks:
+                getattr(block, command)()
+
+    # Returns the answer of every worker, see _worker
+    def _receive(self):
+        if self.asynchronous:
+            return [remote.recv() for remote in self.remotes]
+        return []
+
+    # Waits for every worker and raises the first exception one of them sent back
+    def _wait(self):
+        answers = self._receive()
+        for worker, answer in enumerate(answers):
+            if answer is not None:
+                error, text = answer
+                error.__cause__ = WorkerTraceback('VecEnv worker %i failed:\n%s' % (worker, text))
+                raise error
+
+    # Starts new games everywhere and returns the (n_games, state_size) observations
+    def reset(self):
+        self._send('reset')
+        self._wait()
+        return self.observations.copy()
+
+    # Sends the actions for Team 1 and Team 2 (arrays of size n_games) without waiting for the results
+    def step_async(self, actions_a, actions_b):
+        self.actions[:, 0] = actions_a
+        self.actions[:, 1] = actions_b
+        self._send('step')
+        self.waiting = True
+
+    # Waits for the step started by step_async
+    # Returns observations, rewards of shape (n_games, 2) and done flags
+    # Games that ended were already reset; see terminal_observations for their final observation
+    def step_wait(self):
+        self.waiting = False
+        self._wait()
+        return self.observations.copy(), self.rewards.copy(), self.dones.astype(bool)
+
+    def step(self, actions_a, actions_b):
+        self.step_async(actions_a, actions_b)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.asynchronous:
+            if self.waiting:
+                self._receive()
+            for remote in self.remotes:
+                remote.send('close')
+            for process in self.processes:
+                process.join()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()